@@ -1,26 +1,45 @@
+import io
 import os
+import time
 import mimetypes
-import openai
 import spacy
 from spacy.lang.en.stop_words import STOP_WORDS
-from datetime import datetime
-from flask import Flask, request, jsonify
+from datetime import datetime, timezone
+from flask import Flask, Response, request, jsonify
 from PyPDF2 import PdfReader
 import docx2txt
 from flask_cors import CORS
 from langchain_openai import OpenAIEmbeddings
 import json
-from uitils.extraction import extract_text_from_file, extract_doctype_from_file, extract_embeddings_from_file, extract_keywords_from_file, extract_chapter_name_subject, extract_syllabus_or_date_changes
+from uitils.extraction import extract_text_from_file, extract_pages_from_file, extract_doctype_from_file, extract_embeddings_from_file, extract_keywords_from_file, extract_chapter_name_subject, extract_syllabus_or_date_changes
 from uitils.portfolio import createProfile, updateProfile, addRoadmap
-from uitils.chatbot import process_query, check_up_call, generate_quiz
+from uitils.chatbot import process_query, check_up_call, generate_quiz, generate_quiz_stream, QUIZ_MAX_QUESTIONS
 from pymongo import MongoClient
 from uitils.test import test_extract_text_from_file
-from uitils.courses import generate_course
+from uitils.courses import generate_course, generate_course_from_pages, open_checkpoint, iter_chunk_slides
+from uitils.batch import process_concurrently, BATCH_MAX_WORKERS
+from uitils import llm, llm_cache, metrics, question_bank
+from uitils.jsonstream import iter_json_items
+from uitils.chunker import chunk_document, leading_text, count_tokens
+from uitils.dedupe import MinHashIndex, slide_text
+from uitils.grading import compile_answer_key, grade_attempts, save_results
+from uitils.mastery import record_attempt, get_mastery
+from uitils.quiz_sessions import create_session, get_answer_key
+from uitils.document_quiz import generate_document_quiz
+from uitils import spaced_repetition
+from uitils.document_flashcards import generate_document_flashcards
 import dotenv
 dotenv.load_dotenv()
 
 # Initialize the Flask app
 app = Flask(__name__)
+
+# Keep the question bank stocked in the background so /quiz rarely waits on the LLM. On by
+# default for `python app.py`; processes that only import the app (gunicorn workers, tools) opt
+# in with QUESTION_BANK_REFILL=1.
+QUESTION_BANK_REFILL = os.getenv("QUESTION_BANK_REFILL")
+if __name__ != "__main__" and QUESTION_BANK_REFILL == "1":
+    question_bank.start_refiller()
 CORS(app, resources={
     r"/*": {
         "origins": ["http://localhost:3000"],  # Specify the frontend origin
@@ -31,6 +50,83 @@ CORS(app, resources={
 })
 
 
+@app.before_request
+def tag_request_route():
+    # Tag LLM metrics with the route being served and time the request
+    request.start_time = time.perf_counter()
+    metrics.current_route.set(request.url_rule.rule if request.url_rule else "unmatched")
+
+@app.after_request
+def record_request_latency(response):
+    start = getattr(request, "start_time", None)
+    if start is not None:
+        metrics.http_latency.observe({
+            "route": request.url_rule.rule if request.url_rule else "unmatched",
+            "method": request.method,
+            "status": response.status_code
+        }, time.perf_counter() - start)
+    return response
+
+
+def wants_stream():
+    """
+    Whether the client asked for generated items as an NDJSON stream instead of one JSON response:
+    `?stream=1`, a `stream` form/JSON field, or an `Accept: application/x-ndjson` header.
+    """
+    flag = request.args.get("stream") or request.form.get("stream")
+    if flag is None and request.is_json:
+        flag = (request.get_json(silent=True) or {}).get("stream")
+    if flag is not None:
+        return str(flag).lower() in ("1", "true", "yes")
+    return request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"]) == "application/x-ndjson"
+
+def ndjson_items(item_type, items, is_valid=None, on_done=None):
+    """
+    Stream generated items to the client as they are completed.
+
+    Each item becomes one `{"type": item_type, "data": item}` line, followed by a final
+    `{"type": "done", "count": n}` line. Items failing `is_valid` are skipped; an error while
+    generating ends the stream with a `{"type": "error", "error": message}` line.
+    `on_done`, if given, is called with all streamed items and returns extra fields for the
+    done line.
+    """
+    def generate():
+        start = time.perf_counter()
+        count = 0
+        streamed = []
+        try:
+            for item in items:
+                if is_valid and not is_valid(item):
+                    print(f"Skipping invalid {item_type}: {item}")
+                    continue
+                count += 1
+                if count == 1:
+                    print(f"First {item_type} streamed after {time.perf_counter() - start:.2f}s")
+                if on_done:
+                    streamed.append(item)
+                yield json.dumps({"type": item_type, "data": item}) + "\n"
+            extra = on_done(streamed) if on_done else {}
+            yield json.dumps({"type": "done", "count": count, "elapsed": time.perf_counter() - start, **extra}) + "\n"
+        except Exception as e:
+            print(f"Error streaming {item_type}s: {str(e)}")
+            yield json.dumps({"type": "error", "error": str(e), "count": count}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+# Tokens of the document used as context by the single-call generators
+QUIZ_CONTEXT_TOKENS = int(os.getenv("QUIZ_CONTEXT_TOKENS", "1000"))
+FLASHCARD_CONTEXT_TOKENS = int(os.getenv("FLASHCARD_CONTEXT_TOKENS", "750"))
+
+QUESTION_FIELDS = ["question_number", "question", "options", "answer", "subject", "chapter", "marks"]
+FLASHCARD_FIELDS = ["question", "answer", "topic"]
+
+def is_valid_question(question):
+    return isinstance(question, dict) and all(field in question for field in QUESTION_FIELDS) and len(question["options"]) == 4
+
+def is_valid_flashcard(card):
+    return isinstance(card, dict) and all(key in card for key in FLASHCARD_FIELDS)
+
+
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 client = MongoClient(MONGO_URI)
 db = client['RGIT_DB']
@@ -44,9 +140,6 @@ LOCAL_METADATA_DIR = "./metadata"
 os.makedirs(LOCAL_FILES_DIR, exist_ok=True)
 os.makedirs(LOCAL_METADATA_DIR, exist_ok=True)
 
-# Load environment variables (e.g., OpenAI API key)
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 
 @app.route('/upload', methods=['POST'])
 def upload_document():
@@ -174,6 +267,33 @@ def call():
     return jsonify({"response":tx})
 
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    LLM token usage, LLM latency and request latency in Prometheus text format.
+    """
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/llm/cache', methods=['GET'])
+def llm_cache_stats():
+    """
+    Hit/miss counters and upstream latency saved by the LLM response cache.
+    """
+    return jsonify(llm_cache.cache_stats()), 200
+
+
+@app.route('/quiz/bank', methods=['GET'])
+def question_bank_stats():
+    """
+    Number of banked quiz questions per subject and chapter.
+    """
+    counts = question_bank.inventory()
+    nodes = [{"subject": subject, "chapter": chapter, "questions": count}
+             for (subject, chapter), count in sorted(counts.items(), key=lambda item: (str(item[0][0]), str(item[0][1])))]
+    return jsonify({"target": question_bank.QUESTION_BANK_TARGET, "nodes": nodes}), 200
+
+
 @app.route('/user', methods=['GET'])
 def get_profile():
     user_id = request.args.get("user_id")
@@ -198,6 +318,17 @@ def get_user_documents():
 
     return jsonify({"documents": list(documents)}), 200
 
+@app.route('/user/mastery', methods=['GET'])
+def get_user_mastery():
+    """
+    Subject and chapter mastery of a user: question counts, marks, accuracy and decayed accuracy.
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+
+    return jsonify({"user_id": user_id, **get_mastery(user_id)}), 200
+
 @app.route('/evaluate-quiz', methods=['POST', 'OPTIONS'])
 def evaluate_quiz():
     # Handle OPTIONS request
@@ -212,57 +343,41 @@ def evaluate_quiz():
         quiz_response = data.get('quiz_response')
         user_answers = data.get('user_answers')
         user_id = data.get('user_id')
+        quiz_id = data.get('quiz_id') or (quiz_response.get('quiz_id') if isinstance(quiz_response, dict) else None)
 
-        if not all([quiz_response, user_answers, user_id]):
+        if not all([quiz_id or quiz_response, user_answers, user_id]):
             return jsonify({"error": "Missing required data"}), 400
+        if not isinstance(user_answers, dict):
+            return jsonify({"error": "user_answers must be an object mapping question numbers to answers"}), 400
+
+        # A quiz with a session is only ever graded against its stored answer key. A posted
+        # quiz_response (legacy clients) can't be trusted, so those results are returned but
+        # never stored or counted in mastery and IRT.
+        if quiz_id:
+            key = get_answer_key(quiz_id)
+            if key is None:
+                return jsonify({"error": "Quiz not found or expired"}), 404
+        else:
+            key = compile_answer_key(quiz_response)
+            if not key.questions:
+                return jsonify({"error": "Invalid quiz response data"}), 400
+
+        results, _ = grade_attempts(key, [{"user_id": user_id, "user_answers": user_answers}])
+        result = results[0]
+        result["percentage"] = result["overall_percentage"]
+        if not quiz_id:
+            result["saved"] = False
+            return jsonify(result), 200
+        result["quiz_id"] = quiz_id
 
-        # Get questions from quiz response
-        questions = quiz_response.get('response', {}).get('questions', [])
-
-        # Initialize evaluation metrics
-        total_questions = len(questions)
-        correct_answers = 0
-        total_marks = 0
-        obtained_marks = 0
-        details = []
-
-        # Evaluate each question
-        for question in questions:
-            question_number = question['question_number']
-            user_answer = user_answers.get(str(question_number))
-            correct_answer = question['answer']
-            marks = question['marks']
-
-            is_correct = user_answer == correct_answer
-            question_marks = marks if is_correct else 0
-
-            if is_correct:
-                correct_answers += 1
-                obtained_marks += marks
-            total_marks += marks
-
-            details.append({
-                "question_number": question_number,
-                "question": question['question'],
-                "user_answer": user_answer,
-                "correct_answer": correct_answer,
-                "is_correct": is_correct,
-                "marks": marks,
-                "obtained_marks": question_marks
-            })
-
-        # Calculate percentage
-        percentage = (obtained_marks / total_marks * 100) if total_marks > 0 else 0
-
-        result = {
-            "user_id": user_id,
-            "total_questions": total_questions,
-            "correct_answers": correct_answers,
-            "total_marks": total_marks,
-            "obtained_marks": obtained_marks,
-            "percentage": percentage,
-            "details": details
-        }
+        try:
+            # Stored like evaluate_and_analyze_quiz does, so mastery can be rebuilt from quiz_attempts
+            attempt = dict(result)
+            db['quiz_attempts'].insert_one(attempt)
+            record_attempt(attempt)
+        except Exception as e:
+            # Grading doesn't depend on the stored attempt or the mastery counters
+            print(f"Error saving quiz attempt: {str(e)}")
 
         return jsonify(result), 200
 
@@ -273,6 +388,61 @@ def evaluate_quiz():
             "message": "Failed to evaluate quiz"
         }), 500
 
+@app.route('/evaluate-quiz/bulk', methods=['POST'])
+def evaluate_quiz_bulk():
+    """
+    Grade every attempt at one quiz (e.g. a whole-class exam) in a single request.
+
+    JSON body: `quiz_id` of a stored quiz or the full `quiz_response` (as for /evaluate-quiz),
+    `attempts` - a list of `{"user_id": ..., "user_answers": {...}}` - and optionally `save`
+    (default true) and `details` (include per-question details in the response, default false).
+    Attempts graded against a posted `quiz_response` are never saved.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+
+        quiz_response = data.get('quiz_response')
+        quiz_id = data.get('quiz_id')
+        attempts = data.get('attempts')
+        if not (quiz_id or quiz_response) or not isinstance(attempts, list) or not attempts:
+            return jsonify({"error": "quiz_id or quiz_response and a non-empty attempts list are required"}), 400
+        if any(not isinstance(attempt, dict) or not attempt.get("user_id") for attempt in attempts):
+            return jsonify({"error": "Every attempt needs a user_id"}), 400
+        if any(not isinstance(attempt.get("user_answers"), dict) for attempt in attempts):
+            return jsonify({"error": "Every attempt needs user_answers as an object mapping question numbers to answers"}), 400
+
+        key = get_answer_key(quiz_id) if quiz_id else compile_answer_key(quiz_response)
+        if key is None:
+            return jsonify({"error": "Quiz not found or expired"}), 404
+        if not key.questions:
+            return jsonify({"error": "Invalid quiz response data"}), 400
+
+        start = time.perf_counter()
+        # Details are always stored, only returned on request
+        results, summary = grade_attempts(key, attempts, include_details=True)
+        summary["grading_seconds"] = time.perf_counter() - start
+
+        summary["saved"] = 0
+        if data.get("save", True) and quiz_id:
+            try:
+                summary["saved"] = save_results(results, quiz_id=quiz_id)
+            except Exception as e:
+                print(f"Error saving graded attempts: {str(e)}")
+                return jsonify({"error": str(e), "message": "Failed to save graded attempts"}), 500
+
+        if not data.get("details"):
+            results = [{field: value for field, value in result.items() if field != "details"} for result in results]
+        return jsonify({"results": results, "summary": summary}), 200
+
+    except Exception as e:
+        print(f"Error grading attempts: {str(e)}")
+        return jsonify({
+            "error": str(e),
+            "message": "Failed to grade attempts"
+        }), 500
+
 @app.route('/upload_pdf', methods=['POST'])
 def upload_pdf():
     try:
@@ -297,16 +467,33 @@ def upload_pdf():
         try:
             file.save(temp_path)
             with open(temp_path, 'rb') as f:
-                extracted_text = extract_text_from_file(f, 'application/pdf')
+                pages = extract_pages_from_file(f, 'application/pdf') or []
+            extracted_text = "".join(page + "\n" for page in pages)
 
-            if not extracted_text:
+            if not extracted_text.strip():
                 raise ValueError("No text could be extracted from the file")
 
             print(f"Successfully extracted text, length: {len(extracted_text)}")
+            request_user_id = request.form.get("user_id")
+
+            # Documents longer than the single-call context are covered section by section
+            mode = request.form.get("mode") or request.args.get("mode") or "auto"
+            if mode == "mapreduce" or (mode == "auto" and count_tokens(extracted_text) > QUIZ_CONTEXT_TOKENS):
+                questions = generate_document_quiz(pages, num_questions=5, user_id=request_user_id)
+                if wants_stream():
+                    return ndjson_items("question", questions, is_valid_question,
+                                        on_done=lambda questions: {"quiz_id": create_session(questions, request_user_id)})
+                if not questions:
+                    raise ValueError("No valid questions generated")
+                return jsonify({
+                    "response": {
+                        "questions": questions
+                    },
+                    "quiz_id": create_session(questions, request_user_id)
+                }), 200
 
-            # Truncate text if too long (OpenAI has token limits)
-            max_text_length = 4000  # Adjust based on your needs
-            truncated_text = extracted_text[:max_text_length]
+            # Keep the prompt within budget, cutting at a sentence or section boundary
+            truncated_text = leading_text(extracted_text, QUIZ_CONTEXT_TOKENS)
 
             # Generate questions using OpenAI
             prompt = f"""
@@ -333,20 +520,34 @@ def upload_pdf():
             Return an array of 5 such question objects.
             """
 
+            messages = [
+                {"role": "system", "content": "You are a quiz generator that creates multiple choice questions based on provided text."},
+                {"role": "user", "content": prompt}
+            ]
+
             print("Sending request to OpenAI")
-            response = openai.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a quiz generator that creates multiple choice questions based on provided text."},
-                    {"role": "user", "content": prompt}
-                ],
+            if wants_stream():
+                pieces = llm.chat_stream(
+                    site="upload_pdf_quiz",
+                    task="quiz",
+                    expected_output_tokens=5 * 150,
+                    messages=messages,
+                    temperature=0.7
+                )
+                return ndjson_items("question", iter_json_items(pieces), is_valid_question,
+                                    on_done=lambda questions: {"quiz_id": create_session(questions, request_user_id)})
+
+            content = llm.chat(
+                site="upload_pdf_quiz",
+                task="quiz",
+                expected_output_tokens=5 * 150,
+                messages=messages,
                 temperature=0.7
             )
 
             # Parse OpenAI response
             try:
-                content = response.choices[0].message.content
-                if content is None:
+                if not content:
                     raise ValueError("Empty response from OpenAI")
 
                 # Extract JSON from response (it might be wrapped in markdown code blocks)
@@ -364,8 +565,7 @@ def upload_pdf():
 
                 # Validate question format
                 for q in questions:
-                    required_fields = ["question_number", "question", "options", "answer", "subject", "chapter", "marks"]
-                    if not all(field in q for field in required_fields):
+                    if not all(field in q for field in QUESTION_FIELDS):
                         raise ValueError("Invalid question format in OpenAI response")
                     if len(q["options"]) != 4:
                         raise ValueError("Each question must have exactly 4 options")
@@ -373,7 +573,8 @@ def upload_pdf():
                 return jsonify({
                     "response": {
                         "questions": questions
-                    }
+                    },
+                    "quiz_id": create_session(questions, request_user_id)
                 }), 200
 
             except json.JSONDecodeError as e:
@@ -434,10 +635,84 @@ def quiz():
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
 
-    num_questions = data.get("num_questions", 5)
-    quiz = generate_quiz(prompt, user_id=user_id, num_questions=num_questions)
+    try:
+        num_questions = int(data.get("num_questions", 5))
+    except (TypeError, ValueError):
+        num_questions = 0
+    if not 1 <= num_questions <= QUIZ_MAX_QUESTIONS:
+        return jsonify({"error": f"num_questions must be an integer from 1 to {QUIZ_MAX_QUESTIONS}"}), 400
+    difficulty = data.get("difficulty")
+    if difficulty and difficulty not in question_bank.DIFFICULTIES:
+        return jsonify({"error": f"difficulty must be one of {', '.join(question_bank.DIFFICULTIES)}"}), 400
+
+    # Pick the banked questions that best measure this student's ability (see uitils/irt.py)
+    adaptive = bool(data.get("adaptive", False))
+
+    if wants_stream():
+        return ndjson_items("question", generate_quiz_stream(prompt, user_id=user_id, num_questions=num_questions, difficulty=difficulty, adaptive=adaptive),
+                            on_done=lambda questions: {"quiz_id": create_session(questions, user_id)})
+
+    quiz = generate_quiz(prompt, user_id=user_id, num_questions=num_questions, difficulty=difficulty, adaptive=adaptive)
+
+    # Evaluate with just this id and the answers
+    quiz_id = create_session(quiz.get("questions", []), user_id)
+    return jsonify({"response": quiz, "quiz_id": quiz_id}), 200
+
+def stream_course(pages):
+    """
+    Stream a course as NDJSON while its chunks are generated.
+
+    For each chunk, in order: a `{"type": "progress", "chunk": i, "chunks": n, "status": ...}`
+    frame, then one `{"type": "slide", "chunk": i, "data": slide}` frame per slide. The stream
+    ends with a `{"type": "done", ...}` summary frame. Chunks are generated concurrently but only
+    a bounded window is held in memory, however long the document is. Near-duplicates of slides
+    already sent are dropped.
+    """
+    # Split text into token-bounded chunks along headings, paragraphs and sentences
+    chunks = chunk_document(pages)
+    checkpoint = open_checkpoint(pages, chunks)
+
+    def generate():
+        start = time.perf_counter()
+        slide_count = 0
+        duplicates = 0
+        missing = []
+        seen = MinHashIndex()
+        try:
+            for outcome in iter_chunk_slides(chunks, checkpoint=checkpoint):
+                chunk_number = outcome["index"] + 1
+                progress = {"type": "progress", "chunk": chunk_number, "chunks": len(chunks), "status": outcome["status"], "pages": outcome["pages"]}
+                if outcome["status"] == "error":
+                    missing.append(outcome["index"])
+                    progress["error"] = outcome["error"]
+                yield json.dumps(progress) + "\n"
+                for slide in outcome["slides"]:
+                    if seen.add(slide_text(slide)) is not None:
+                        duplicates += 1
+                        continue
+                    slide_count += 1
+                    yield json.dumps({"type": "slide", "chunk": chunk_number, "data": slide}) + "\n"
+
+            if slide_count and not missing:
+                written = MinHashIndex()
+                checkpoint.save_output_from_chunks(
+                    keep=lambda slide: written.add(slide_text(slide)) is None,
+                    course_id=checkpoint.id, missing_chunks=[], output_path=checkpoint.output_path
+                )
+            yield json.dumps({
+                "type": "done",
+                "count": slide_count,
+                "duplicates_removed": duplicates,
+                "course_id": checkpoint.id,
+                "chunks": len(chunks),
+                "missing_chunks": missing,
+                "elapsed": time.perf_counter() - start
+            }) + "\n"
+        except Exception as e:
+            print(f"Error streaming course: {str(e)}")
+            yield json.dumps({"type": "error", "error": str(e), "count": slide_count}) + "\n"
 
-    return jsonify({"response": quiz}), 200
+    return Response(generate(), mimetype="application/x-ndjson")
 
 @app.route('/course', methods=['POST'])
 def generate_course_endpoint():
@@ -459,76 +734,19 @@ def generate_course_endpoint():
         if not mimetype:
             return jsonify({"error": "Could not determine file type"}), 400
 
-        # Extract text from file
-        text = extract_text_from_file(file, mimetype)
-        if not text:
+        # Extract text from file, page by page
+        pages = extract_pages_from_file(file, mimetype)
+        if not pages or not any(page.strip() for page in pages):
             return jsonify({"error": "Could not extract text from file"}), 400
 
-        # Split text into smaller chunks to avoid token limits
-        words = text.split()
-        chunk_size = 1500  # Adjust based on your needs
-        chunks = [' '.join(words[i:i + chunk_size])
-                 for i in range(0, len(words), chunk_size)]
-
-        all_slides = []
-        for i, chunk in enumerate(chunks):
-            print(f"Processing chunk {i+1} of {len(chunks)}")
+        if wants_stream():
+            return stream_course(pages)
 
-            # Generate slides for this chunk
-            prompt = f"""
-            Create educational slides from this text:
-            {chunk}
-
-            Format each slide as:
-            {{
-                "title": "Clear and concise title",
-                "content": "Detailed slide content"
-            }}
-
-            Return an array of slides.
-            """
+        # Chunks are generated concurrently and checkpointed, so a retry of the same document
+        # only generates the chunks that are still missing
+        course = generate_course_from_pages(pages, site="course_chunk")
 
-            try:
-                response = openai.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "You are a course content generator."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
-
-                content = response.choices[0].message.content
-                if not content:
-                    print(f"Empty content from OpenAI for chunk {i+1}")
-                    continue
-
-                # Clean and parse the response
-                clean_content = content
-                if "```json" in content:
-                    json_parts = content.split("```json")
-                    if len(json_parts) > 1:
-                        clean_content = json_parts[1].split("```")[0]
-                elif "```" in content:
-                    json_parts = content.split("```")
-                    if len(json_parts) > 1:
-                        clean_content = json_parts[1]
-
-                try:
-                    chunk_slides = json.loads(clean_content.strip())
-                    if isinstance(chunk_slides, dict) and "slides" in chunk_slides:
-                        all_slides.extend(chunk_slides["slides"])
-                    elif isinstance(chunk_slides, list):
-                        all_slides.extend(chunk_slides)
-                except json.JSONDecodeError as e:
-                    print(f"Error parsing chunk {i+1}: {str(e)}")
-                    continue
-
-            except Exception as e:
-                print(f"Error processing chunk {i+1}: {str(e)}")
-                continue
-
-        if not all_slides:
+        if not course["slides"]:
             return jsonify({
                 "slides": [{
                     "title": "Error",
@@ -536,24 +754,111 @@ def generate_course_endpoint():
                 }]
             })
 
-        return jsonify({"slides": all_slides})
+        return jsonify({
+            "slides": course["slides"],
+            "course_id": course["course_id"],
+            "missing_chunks": course["missing_chunks"]
+        })
 
     except Exception as e:
         print(f"Error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def flashcards_messages(extracted_text):
+    prompt = f"""
+    Create exactly 5 flashcards from this content. Return ONLY a JSON array of flashcards.
+    Content: {leading_text(extracted_text, FLASHCARD_CONTEXT_TOKENS)}
+
+    Format each flashcard as:
+    {{
+        "question": "Clear concise question",
+        "answer": "Clear concise answer",
+        "topic": "Topic of this flashcard"
+    }}
+
+    Return ONLY the JSON array, nothing else. Example:
+    [
+        {{
+            "question": "What is...",
+            "answer": "It is...",
+            "topic": "Main concept"
+        }},
+        // more cards...
+    ]
+    """
+    return [
+        {"role": "system", "content": "You are a flashcard generator. Always respond with valid JSON arrays containing flashcards."},
+        {"role": "user", "content": prompt}
+    ]
+
+def flashcards_from_text(extracted_text):
+    """
+    Generate structured flashcards for the given text using OpenAI.
+
+    Falls back to a single overview card when the model response is not valid JSON.
+    """
+    response_content = llm.chat(
+        site="flashcards_from_text",
+        task="flashcards",
+        expected_output_tokens=5 * 80,
+        messages=flashcards_messages(extracted_text),
+        temperature=0.7
+    )
+
+    # Extract and parse the response
+    if not response_content:
+        raise ValueError("Empty response from OpenAI")
+
+    response_text = response_content.strip()
+
+    # Clean the response to ensure it's valid JSON
+    if response_text.startswith('```json'):
+        response_text = response_text.replace('```json', '').replace('```', '').strip()
+
+    # Parse the JSON and validate the structure
+    try:
+        flashcards = json.loads(response_text)
+        if not isinstance(flashcards, list):
+            raise ValueError("Response is not a list")
+
+        # Validate each flashcard
+        for card in flashcards:
+            if not all(key in card for key in FLASHCARD_FIELDS):
+                raise ValueError("Invalid flashcard structure")
+
+        print(f"Successfully generated {len(flashcards)} flashcards")
+        return flashcards
+
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error: {str(e)}")
+        # Fallback: Create basic flashcards from the text
+        return [
+            {
+                "question": "What is the main topic of this document?",
+                "answer": extracted_text[:100] if extracted_text else "No text available",
+                "topic": "Overview"
+            }
+        ]
+
 @app.route('/flashcards', methods=['POST'])
 def generate_flashcards():
     try:
         file = request.files.get("file", None)
         text = request.form.get("text", None)
         user_id = request.form.get("user_id", None)
+        # Re-uploads of a document under the same id only generate cards for changed pages
+        document_id = request.form.get("document_id", None)
 
         if file:
             filename = file.filename
             if filename is None:
                 return jsonify({"error": "Invalid filename"}), 400
             content_type, _ = mimetypes.guess_type(str(filename))
+            if content_type == 'application/pdf' and user_id:
+                pages = extract_pages_from_file(file, content_type)
+                if pages:
+                    return document_flashcards(user_id, document_id or filename, pages)
+                file.seek(0)
             extracted_text = extract_text_from_file(file, content_type)
             if extracted_text is None:
                 return jsonify({"error": "Could not extract text from file"}), 400
@@ -562,79 +867,208 @@ def generate_flashcards():
         else:
             return jsonify({"error": "Either a file or text content must be provided"}), 400
 
-        # Generate structured flashcards using OpenAI
-        prompt = f"""
-        Create exactly 5 flashcards from this content. Return ONLY a JSON array of flashcards.
-        Content: {extracted_text[:3000] if extracted_text else ''}
+        if wants_stream():
+            pieces = llm.chat_stream(
+                site="flashcards_from_text",
+                task="flashcards",
+                expected_output_tokens=5 * 80,
+                messages=flashcards_messages(extracted_text),
+                temperature=0.7
+            )
+            on_done = (lambda cards: {"card_ids": track_flashcards(user_id, cards)}) if user_id else None
+            return ndjson_items("flashcard", iter_json_items(pieces), is_valid_flashcard, on_done)
 
-        Format each flashcard as:
-        {{
-            "question": "Clear concise question",
-            "answer": "Clear concise answer",
-            "topic": "Topic of this flashcard"
-        }}
+        flashcards = flashcards_from_text(extracted_text)
+        track_flashcards(user_id, flashcards)
+        return jsonify({"flashcards": flashcards}), 200
 
-        Return ONLY the JSON array, nothing else. Example:
-        [
-            {{
-                "question": "What is...",
-                "answer": "It is...",
-                "topic": "Main concept"
-            }},
-            // more cards...
-        ]
-        """
+    except Exception as e:
+        print(f"Error in generate_flashcards: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a flashcard generator. Always respond with valid JSON arrays containing flashcards."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7
-        )
 
-        # Extract and parse the response
-        response_content = response.choices[0].message.content
-        if response_content is None:
-            raise ValueError("Empty response from OpenAI")
+def document_flashcards(user_id, document_id, pages):
+    """
+    Page-level incremental flashcards for a PDF (see uitils/document_flashcards.py). Cards of
+    pages removed since the previous upload leave the user's review queue.
+    """
+    # Stored pages are scoped to the user, so nobody else can reuse or retire them
+    flashcards, stats = generate_document_flashcards(f"{user_id}:{document_id}", pages)
+    retired = stats.pop("retired_cards")
+    track_flashcards(user_id, flashcards)
+    try:
+        spaced_repetition.remove_cards(user_id, [spaced_repetition.card_id(card) for card in retired])
+    except Exception as e:
+        print(f"Could not remove retired flashcards from the review queue: {str(e)}")
+    stats["retired_cards"] = len(retired)
+    stats["document_id"] = document_id
 
-        response_text = response_content.strip()
+    if wants_stream():
+        return ndjson_items("flashcard", flashcards, is_valid_flashcard, on_done=lambda cards: {"document": stats})
+    if not flashcards and stats["failed_pages"]:
+        return jsonify({"error": "Failed to generate flashcards", "document": stats}), 500
+    return jsonify({"flashcards": flashcards, "document": stats}), 200
 
-        # Clean the response to ensure it's valid JSON
-        if response_text.startswith('```json'):
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
+def track_flashcards(user_id, flashcards):
+    """
+    Add generated flashcards to the user's review queue and tag them with their card_id.
+    """
+    try:
+        return spaced_repetition.add_cards(user_id, flashcards)
+    except Exception as e:
+        print(f"Could not add flashcards to the review queue: {str(e)}")
+        return []
+
+def parse_review_time(value):
+    # ISO 8601, stored as naive UTC like the rest of the review state
+    reviewed_at = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if reviewed_at.tzinfo is not None:
+        reviewed_at = reviewed_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return reviewed_at
+
+@app.route('/flashcards/reviews', methods=['POST'])
+def record_flashcard_reviews():
+    """
+    Record a batch of flashcard reviews and reschedule the cards (SM-2).
 
-        # Parse the JSON and validate the structure
-        try:
-            flashcards = json.loads(response_text)
-            if not isinstance(flashcards, list):
-                raise ValueError("Response is not a list")
-
-            # Validate each flashcard
-            for card in flashcards:
-                if not all(key in card for key in ['question', 'answer', 'topic']):
-                    raise ValueError("Invalid flashcard structure")
-
-            print(f"Successfully generated {len(flashcards)} flashcards")
-            return jsonify({"flashcards": flashcards}), 200
-
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {str(e)}")
-            # Fallback: Create basic flashcards from the text
-            fallback_flashcards = [
-                {
-                    "question": "What is the main topic of this document?",
-                    "answer": extracted_text[:100] if extracted_text else "No text available",
-                    "topic": "Overview"
-                }
-            ]
-            return jsonify({"flashcards": fallback_flashcards}), 200
+    JSON body: `user_id` and `reviews` - a list of `{"card_id": ..., "quality": 0-5}`, each
+    optionally with `reviewed_at` (ISO 8601, default now).
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
 
+    user_id = data.get("user_id")
+    reviews = data.get("reviews")
+    if not user_id or not isinstance(reviews, list) or not reviews:
+        return jsonify({"error": "user_id and a non-empty reviews list are required"}), 400
+    if len(reviews) > spaced_repetition.SRS_MAX_BATCH:
+        return jsonify({"error": f"At most {spaced_repetition.SRS_MAX_BATCH} reviews per request"}), 400
+
+    parsed = []
+    for review in reviews:
+        if not isinstance(review, dict) or not review.get("card_id"):
+            return jsonify({"error": "Every review needs a card_id"}), 400
+        quality = review.get("quality")
+        if not isinstance(quality, int) or isinstance(quality, bool) or not 0 <= quality <= 5:
+            return jsonify({"error": "quality must be an integer from 0 to 5"}), 400
+        entry = {"card_id": str(review["card_id"]), "quality": quality}
+        if review.get("reviewed_at"):
+            try:
+                entry["reviewed_at"] = parse_review_time(review["reviewed_at"])
+            except ValueError:
+                return jsonify({"error": f"Invalid reviewed_at: {review['reviewed_at']}"}), 400
+        parsed.append(entry)
+
+    try:
+        outcome = spaced_repetition.record_reviews(user_id, parsed)
     except Exception as e:
-        print(f"Error in generate_flashcards: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        print(f"Error recording flashcard reviews: {str(e)}")
+        return jsonify({"error": str(e), "message": "Failed to record reviews"}), 500
+
+    outcome["due"] = {card: due_at.isoformat() for card, due_at in outcome["due"].items()}
+    return jsonify(outcome), 200
+
+@app.route('/flashcards/due', methods=['GET'])
+def get_due_flashcards():
+    """
+    The user's flashcards that are due for review, most overdue first.
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    limit = request.args.get("limit", spaced_repetition.SRS_DUE_LIMIT, type=int)
+    if limit is None or limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    cards = spaced_repetition.due_cards(user_id, min(limit, spaced_repetition.SRS_MAX_BATCH))
+    for card in cards:
+        for field in ("due_at", "last_reviewed"):
+            if card.get(field):
+                card[field] = card[field].isoformat()
+    return jsonify({"user_id": user_id, "cards": cards}), 200
+
+
+def _batch_extract(upload):
+    content_type, _ = mimetypes.guess_type(upload.filename)
+    extracted_text = extract_text_from_file(upload, content_type)
+    if extracted_text is None:
+        raise ValueError("Could not extract text from file")
+    return extracted_text
+
+def _batch_course(upload):
+    # generate_course reports failures as error slides; a batch line must say "error" instead
+    course = generate_course(upload)
+    if not course.get("course_id"):
+        raise ValueError(course["slides"][0]["content"])
+    if course.get("missing_chunks"):
+        raise ValueError(f"Chunks {[index + 1 for index in course['missing_chunks']]} failed; "
+                         f"retrying resumes course {course['course_id']} from its checkpoints")
+    return course
+
+BATCH_TASKS = {
+    "upload": lambda upload: {"document_content": {"extracted_text": _batch_extract(upload)}},
+    "flashcards": lambda upload: {"flashcards": flashcards_from_text(_batch_extract(upload))},
+    "course": _batch_course,
+}
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """
+    Process many uploaded files in one request on a bounded worker pool.
+
+    Form fields:
+    - files: one or more files (repeated field).
+    - task: "upload" (text extraction, default), "flashcards" or "course".
+
+    Streams one NDJSON line per file as soon as it finishes, followed by a summary line.
+    A failing file is reported in its own line and does not affect the others.
+    """
+    files = request.files.getlist("files") or request.files.getlist("file")
+    if not files:
+        return jsonify({"error": "At least one file is required"}), 400
+    if len(files) > BATCH_MAX_FILES:
+        return jsonify({"error": f"At most {BATCH_MAX_FILES} files are allowed per batch"}), 400
+
+    task = request.form.get("task", "upload")
+    if task not in BATCH_TASKS:
+        return jsonify({"error": f"Unknown task '{task}'. Use one of: {', '.join(BATCH_TASKS)}"}), 400
+
+    # Read the uploads up front: the request stream is closed once the response starts streaming
+    uploads = []
+    for file in files:
+        upload = io.BytesIO(file.read())
+        upload.filename = file.filename or f"file_{len(uploads)}"
+        uploads.append(upload)
+
+    worker = BATCH_TASKS[task]
+    max_workers = request.form.get("max_workers", type=int) or BATCH_MAX_WORKERS
+
+    def generate():
+        start = time.perf_counter()
+        failed = 0
+        for outcome in process_concurrently(uploads, worker, max_workers=min(max_workers, BATCH_MAX_WORKERS)):
+            outcome["filename"] = uploads[outcome["index"]].filename
+            if outcome["status"] == "error":
+                failed += 1
+                print(f"Batch {task} failed for {outcome['filename']}: {outcome['error']}")
+            yield json.dumps(outcome) + "\n"
+        yield json.dumps({
+            "summary": {
+                "task": task,
+                "total_files": len(uploads),
+                "succeeded": len(uploads) - failed,
+                "failed": failed,
+                "elapsed": time.perf_counter() - start
+            }
+        }) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
 
 
 if __name__ == "__main__":
+    # The debug reloader runs this file twice; only the child (WERKZEUG_RUN_MAIN) serves requests
+    if QUESTION_BANK_REFILL != "0" and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        question_bank.start_refiller()
     app.run(debug=True)
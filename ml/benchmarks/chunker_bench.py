@@ -0,0 +1,107 @@
+"""
+Compare the structure-aware chunker (uitils/chunker.py) with the old fixed word splitter.
+
+Reports wall time, chunk count, chunk size in tokens and how many chunks end mid-sentence:
+
+    python benchmarks/chunker_bench.py --pages 1000
+    python benchmarks/chunker_bench.py --pdf notes.pdf --max-tokens 2000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import textwrap
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from uitils.chunker import chunk_texts, count_tokens
+
+VOCABULARY = ("stack queue node pointer memory array tree graph hash function variable process "
+              "algorithm complexity recursion sorting search insertion deletion traversal").split()
+
+
+def word_chunks(text, chunk_size):
+    # The splitter previously used by /course and generate_course
+    words = text.split()
+    return [' '.join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size)]
+
+
+def synthetic_pages(count, seed=7):
+    """
+    Textbook-like pages: chapter and section headings, paragraphs wrapped at 80 columns.
+    """
+    rng = random.Random(seed)
+
+    def sentence():
+        return " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(6, 28))).capitalize() + "."
+
+    pages = []
+    for number in range(count):
+        lines = []
+        if number % 12 == 0:
+            lines += [f"CHAPTER {number // 12 + 1}", ""]
+        if number % 3 == 0:
+            lines += [f"{number // 12 + 1}.{number % 12 // 3 + 1} {rng.choice(VOCABULARY).capitalize()} basics", ""]
+        for _ in range(rng.randint(3, 6)):
+            lines += textwrap.wrap(" ".join(sentence() for _ in range(rng.randint(2, 8))), 80) + [""]
+        pages.append("\n".join(lines))
+    return pages
+
+
+def pdf_pages(path):
+    from PyPDF2 import PdfReader
+    with open(path, "rb") as f:
+        return [page.extract_text() or "" for page in PdfReader(f).pages]
+
+
+def report(name, chunks, seconds, max_tokens):
+    sizes = [count_tokens(chunk) for chunk in chunks]
+    mid_sentence = sum(1 for chunk in chunks[:-1] if not chunk.rstrip().endswith((".", "!", "?", ":")))
+    return {
+        "splitter": name,
+        "seconds": round(seconds, 3),
+        "chunks": len(chunks),
+        "tokens": {
+            "mean": round(statistics.mean(sizes)) if sizes else 0,
+            "max": max(sizes, default=0),
+            "over_limit": sum(1 for size in sizes if size > max_tokens),
+        },
+        "mid_sentence_cuts": mid_sentence,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document chunkers")
+    parser.add_argument("--pages", type=int, default=1000, help="Synthetic page count")
+    parser.add_argument("--pdf", help="Use a real PDF instead of synthetic pages")
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--overlap-tokens", type=int, default=100)
+    parser.add_argument("--words", type=int, default=1500, help="Chunk size of the word splitter")
+    args = parser.parse_args()
+
+    pages = pdf_pages(args.pdf) if args.pdf else synthetic_pages(args.pages)
+    text = "\n".join(pages)
+
+    start = time.perf_counter()
+    baseline = word_chunks(text, args.words)
+    baseline_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    structured = chunk_texts(pages, max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens)
+    structured_seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        "pages": len(pages),
+        "characters": len(text),
+        "results": [
+            report(f"words:{args.words}", baseline, baseline_seconds, args.max_tokens),
+            report(f"structured:{args.max_tokens}", structured, structured_seconds, args.max_tokens),
+        ],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Time the near-duplicate stage (uitils/dedupe.py) on synthetic slides.
+
+A share of the items are copies of others with a few words changed; the report shows how long
+signatures and clustering take and how many of the planted duplicates were merged:
+
+    python benchmarks/dedupe_bench.py --items 20000 --duplicates 0.4
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from uitils.dedupe import minhash, duplicate_groups, slide_text
+
+VOCABULARY = ("stack queue node pointer memory array tree graph hash function variable process "
+              "algorithm complexity recursion sorting search insertion deletion traversal binary "
+              "heap linked list index table key value bucket collision").split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark near-duplicate removal")
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--duplicates", type=float, default=0.4, help="Share of items that are edited copies")
+    parser.add_argument("--edits", type=int, default=1, help="Words changed in each copy")
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    originals = int(args.items * (1 - args.duplicates))
+    slides = [{"title": rng.choice(VOCABULARY).capitalize(),
+               "content": " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(15, 40)))}
+              for _ in range(originals)]
+    for _ in range(args.items - originals):
+        source = rng.choice(slides[:originals])
+        words = source["content"].split()
+        for _ in range(args.edits):
+            words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+        slides.append({"title": source["title"], "content": " ".join(words)})
+    rng.shuffle(slides)
+
+    texts = [slide_text(slide) for slide in slides]
+    start = time.perf_counter()
+    signatures = minhash(texts)
+    signature_seconds = time.perf_counter() - start
+    groups = duplicate_groups(signatures, args.threshold)
+    total_seconds = time.perf_counter() - start
+
+    kept = len(set(groups.tolist()))
+    print(json.dumps({
+        "items": len(slides),
+        "planted_duplicates": len(slides) - originals,
+        "merged": len(slides) - kept,
+        "signature_seconds": round(signature_seconds, 3),
+        "cluster_seconds": round(total_seconds - signature_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Compare bulk grading (uitils/grading.py) with grading one attempt at a time the way
+evaluate_and_analyze_quiz does, without the database writes. Both build the full result
+/evaluate-quiz/bulk stores, including per-question details and recommendations:
+
+    python benchmarks/grading_bench.py --attempts 2000 --questions 50
+"""
+import os
+import sys
+import json
+import time
+import datetime
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from uitils.grading import compile_answer_key, grade_attempts, recommendations
+
+
+def grade_one(questions, user_id, user_answers):
+    # Per-question loop with dict updates, as in evaluate_and_analyze_quiz, building the same
+    # result (breakdowns, recommendations and per-question details) the bulk path returns
+    obtained_marks = 0
+    total_marks = 0
+    correct_answers = 0
+    subject_analysis = {}
+    chapter_analysis = {}
+    details = []
+    for question in questions:
+        marks = question["marks"]
+        user_answer = user_answers.get(str(question["question_number"]))
+        is_correct = user_answer == question["answer"]
+        obtained = marks if is_correct else 0
+        obtained_marks += obtained
+        total_marks += marks
+        correct_answers += int(is_correct)
+        for analysis, name in ((subject_analysis, question["subject"]), (chapter_analysis, question["chapter"])):
+            data = analysis.setdefault(name, {"total_questions": 0, "correct_answers": 0, "total_marks": 0, "obtained_marks": 0})
+            data["total_questions"] += 1
+            data["total_marks"] += marks
+            if is_correct:
+                data["correct_answers"] += 1
+                data["obtained_marks"] += marks
+        details.append({
+            "question_number": question["question_number"],
+            "question": question["question"],
+            "user_answer": user_answer,
+            "correct_answer": question["answer"],
+            "is_correct": is_correct,
+            "subject": question["subject"],
+            "chapter": question["chapter"],
+            "marks": marks,
+            "obtained_marks": obtained
+        })
+    for analysis in (subject_analysis, chapter_analysis):
+        for data in analysis.values():
+            data["percentage"] = data["obtained_marks"] / data["total_marks"] * 100 if data["total_marks"] else 0
+    percentage = obtained_marks / total_marks * 100 if total_marks else 0
+    return {
+        "user_id": user_id,
+        "total_questions": len(questions),
+        "correct_answers": correct_answers,
+        "total_marks": total_marks,
+        "obtained_marks": obtained_marks,
+        "overall_percentage": percentage,
+        "subject_analysis": subject_analysis,
+        "chapter_analysis": chapter_analysis,
+        "recommendations": recommendations(subject_analysis, chapter_analysis, percentage),
+        "timestamp": datetime.datetime.now(),
+        "details": details
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk quiz grading")
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    subjects = ["Data Structures", "Operating Systems", "Networks", "Databases"]
+    questions = []
+    for number in range(1, args.questions + 1):
+        options = [f"option {number}.{i}" for i in range(4)]
+        subject = rng.choice(subjects)
+        questions.append({"question_number": number, "question": f"Question {number}", "options": options,
+                          "answer": rng.choice(options), "subject": subject,
+                          "chapter": f"{subject} {rng.randint(1, 5)}", "marks": rng.choice([1, 1, 2])})
+    attempts = [{"user_id": f"student_{i}",
+                 "user_answers": {str(q["question_number"]): rng.choice(q["options"])
+                                  for q in questions if rng.random() < 0.95}}
+                for i in range(args.attempts)]
+
+    start = time.perf_counter()
+    looped = [grade_one(questions, attempt["user_id"], attempt["user_answers"]) for attempt in attempts]
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    key = compile_answer_key(questions)
+    results, _ = grade_attempts(key, attempts, include_details=True)
+    bulk_seconds = time.perf_counter() - start
+
+    without_details_start = time.perf_counter()
+    grade_attempts(key, attempts, include_details=False)
+    without_details_seconds = time.perf_counter() - without_details_start
+
+    for loop_result, bulk_result in zip(looped, results):
+        assert loop_result["obtained_marks"] == bulk_result["obtained_marks"]
+        assert sorted(loop_result["recommendations"]) == sorted(bulk_result["recommendations"])
+        assert [d["is_correct"] for d in loop_result["details"]] == [d["is_correct"] for d in bulk_result["details"]]
+    print(json.dumps({
+        "attempts": args.attempts,
+        "questions": args.questions,
+        "loop_seconds": round(loop_seconds, 3),
+        "bulk_seconds": round(bulk_seconds, 3),
+        "bulk_without_details_seconds": round(without_details_seconds, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Time IRT calibration (uitils/irt.py) on simulated responses and check how well it recovers the
+true parameters, plus the latency of picking the most informative questions for a student:
+
+    python benchmarks/irt_bench.py --students 50000 --questions 5000 --responses 2000000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from uitils.irt import calibrate, select_most_informative
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IRT calibration and adaptive selection")
+    parser.add_argument("--students", type=int, default=50000)
+    parser.add_argument("--questions", type=int, default=5000)
+    parser.add_argument("--responses", type=int, default=2000000)
+    parser.add_argument("--candidates", type=int, default=500, help="Candidate pool per selection")
+    parser.add_argument("--select", type=int, default=10, help="Questions picked per selection")
+    parser.add_argument("--selections", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    true_theta = rng.normal(0, 1, args.students)
+    true_b = rng.normal(0, 1, args.questions)
+    true_a = np.exp(rng.normal(0, 0.3, args.questions))
+    users = rng.integers(0, args.students, args.responses)
+    items = rng.integers(0, args.questions, args.responses)
+    p = 1 / (1 + np.exp(-true_a[items] * (true_theta[users] - true_b[items])))
+    correct = (rng.random(args.responses) < p).astype(np.int8)
+
+    start = time.perf_counter()
+    theta, a, b = calibrate(users, items, correct, args.students, args.questions)
+    calibrate_seconds = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(args.selections):
+        pool = rng.integers(0, args.questions, args.candidates)
+        student = rng.integers(0, args.students)
+        start = time.perf_counter()
+        select_most_informative(theta[student], a[pool], b[pool], args.select)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    print(json.dumps({
+        "responses": args.responses,
+        "students": args.students,
+        "questions": args.questions,
+        "calibrate_seconds": round(calibrate_seconds, 3),
+        "correlation": {
+            "theta": round(float(np.corrcoef(theta, true_theta)[0, 1]), 3),
+            "b": round(float(np.corrcoef(b, true_b)[0, 1]), 3),
+            "a": round(float(np.corrcoef(a, true_a)[0, 1]), 3),
+        },
+        "selection_ms": {
+            "p50": round(statistics.median(latencies) * 1000, 3),
+            "p99": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Concurrent load generator for the Flask backend.
+
+Run the backend against the fake provider server (see fake_llm.py) to benchmark it offline:
+
+    python fake_llm.py --latency lognormal:800,0.6 &
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python app.py &
+    python benchmarks/load_test.py --endpoint /chatbot --requests 200 --concurrency 20
+"""
+import time
+import json
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PAYLOADS = {
+    "/chatbot": {"json": {"text": "Can you help me understand linked lists?", "params": {"user_id": "user_1"}}},
+    "/quiz": {"json": {"prompt": ["Data Structures"], "user_id": "user_1", "num_questions": 5}},
+    "/portfolio/roadmap": {"json": {"user_id": "user_1", "prompt": "Learn data structures in 3 months"}},
+    "/flashcards": {"data": {"text": "A linked list is a linear data structure where each node points to the next node."}},
+}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a backend endpoint")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--endpoint", default="/chatbot", choices=sorted(PAYLOADS))
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=args.concurrency, pool_maxsize=args.concurrency)
+    session.mount("http://", adapter)
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            response = session.post(args.base_url + args.endpoint, timeout=300, **PAYLOADS[args.endpoint])
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+        return status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(one, range(args.requests)))
+    wall = time.perf_counter() - start
+
+    latencies = [latency for _, latency in results]
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    print(json.dumps({
+        "endpoint": args.endpoint,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(args.requests / wall, 2),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 1),
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+        },
+        "statuses": statuses,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
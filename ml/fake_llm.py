@@ -0,0 +1,421 @@
+"""
+Local stand-in for the OpenAI, Gemini and Bland.ai APIs used by the backend, for offline load tests.
+
+Point the backend at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089
+    BLANDAI_BASE_URL=http://127.0.0.1:8089
+
+Modes:
+    synth   - synthesize schema-valid responses (quizzes, slides, flashcards, roadmaps, ...)
+    replay  - answer from a recordings file, synthesizing on a miss (or 404 with --strict)
+    record  - forward to the real providers and append every response to the recordings file
+
+Example:
+    python fake_llm.py --mode synth --latency lognormal:800,0.6 --error-rate 0.02 --error-status 429,503
+"""
+import os
+import re
+import json
+import time
+import uuid
+import math
+import random
+import hashlib
+import argparse
+import threading
+
+import requests
+from flask import Flask, Response, request, jsonify
+
+app = Flask(__name__)
+
+OPENAI_UPSTREAM = "https://api.openai.com"
+GEMINI_UPSTREAM = "https://generativelanguage.googleapis.com"
+
+config = {
+    "mode": "synth",
+    "recordings": "./recordings/llm.jsonl",
+    "strict": False,
+    "latency": ("fixed", [0.0]),
+    "token_delay": 0.0,
+    "error_rate": 0.0,
+    "error_statuses": [429],
+}
+recordings = {}
+recordings_lock = threading.Lock()
+stats = {"requests": 0, "errors_injected": 0, "replayed": 0, "synthesized": 0, "recorded": 0}
+stats_lock = threading.Lock()
+
+
+def count(field):
+    with stats_lock:
+        stats[field] += 1
+
+
+# --- latency and error injection -------------------------------------------------------------
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution such as "fixed:200", "uniform:100,800", "normal:400,100" or
+    "lognormal:800,0.6" (median ms, sigma). Values are in milliseconds.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    if kind not in expected or len(values) != expected[kind]:
+        raise argparse.ArgumentTypeError(f"Invalid latency spec '{spec}'")
+    return kind, values
+
+
+def sample_latency():
+    kind, values = config["latency"]
+    if kind == "fixed":
+        ms = values[0]
+    elif kind == "uniform":
+        ms = random.uniform(values[0], values[1])
+    elif kind == "normal":
+        ms = random.gauss(values[0], values[1])
+    else:
+        ms = random.lognormvariate(math.log(max(values[0], 1e-3)), values[1])
+    return max(ms, 0.0) / 1000.0
+
+
+def injected_error():
+    if config["error_rate"] <= 0 or random.random() >= config["error_rate"]:
+        return None
+    count("errors_injected")
+    status = random.choice(config["error_statuses"])
+    body = {"error": {"message": f"Injected error {status}", "type": "fake_llm_error", "code": status}}
+    response = jsonify(body)
+    response.status_code = status
+    if status == 429:
+        response.headers["Retry-After"] = "1"
+    return response
+
+
+# --- record / replay -------------------------------------------------------------------------
+
+def request_key(surface, body):
+    body = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+    payload = json.dumps({"surface": surface, "body": body}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_recordings(path):
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                recordings[entry["key"]] = entry["response"]
+    print(f"Loaded {len(recordings)} recordings from {path}")
+
+
+def save_recording(key, surface, response):
+    with recordings_lock:
+        recordings[key] = response
+        os.makedirs(os.path.dirname(config["recordings"]) or ".", exist_ok=True)
+        with open(config["recordings"], "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "surface": surface, "response": response}, ensure_ascii=False) + "\n")
+    count("recorded")
+
+
+def forward(url, body):
+    headers = {k: v for k, v in request.headers.items() if k.lower() in ("authorization", "x-goog-api-key", "content-type")}
+    upstream = requests.post(url, params=request.args, json=body, headers=headers, timeout=120)
+    upstream.raise_for_status()
+    return upstream.json()
+
+
+def resolve(surface, body, synthesize, upstream_url):
+    """
+    Produce the full (non-streamed) response body for a request according to the current mode.
+    """
+    key = request_key(surface, body)
+    if config["mode"] in ("replay", "record") and key in recordings:
+        count("replayed")
+        return recordings[key]
+    if config["mode"] == "record":
+        response = forward(upstream_url, {**body, "stream": False} if surface == "chat" else body)
+        save_recording(key, surface, response)
+        return response
+    if config["mode"] == "replay" and config["strict"]:
+        return None
+    count("synthesized")
+    return synthesize()
+
+
+# --- synthesized content ---------------------------------------------------------------------
+
+WORDS = ("data structure algorithm memory pointer array queue stack graph tree node edge search sort "
+         "hash model training learning network layer gradient function variable process thread").split()
+
+
+def sentence(rng, words=8):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def requested_count(prompt, default):
+    match = re.search(r"(?:create|generate|with)\s+(?:exactly\s+)?(\d+)\s+(?:multiple choice\s+)?(?:questions|flashcards|mcq)", prompt)
+    return int(match.group(1)) if match else default
+
+
+def synth_question(rng, number):
+    options = [sentence(rng, 3) for _ in range(4)]
+    return {
+        "question_number": number,
+        "question": sentence(rng) + "?",
+        "options": options,
+        "answer": rng.choice(options),
+        "subject": rng.choice(["Data Structures", "Artificial Intelligence", "Operating Systems"]),
+        "chapter": rng.choice(["Arrays", "Linked Lists", "Search", "Scheduling"]),
+        "difficulty": rng.choice(["easy", "medium", "hard"]),
+        "marks": 1,
+        "hint": sentence(rng, 6),
+    }
+
+
+def synthesize_text(prompt):
+    """
+    Build a response matching what the backend's prompt asks for.
+    """
+    text = prompt.lower()
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+    if "classify the following text into document type" in text:
+        return "STUDY_MATERIAL"
+    if "classify this query" in text:
+        return "study-related"
+    if "determine the subjects and chapters most relevant" in text:
+        return json.dumps({"subjects": ["Data Structures"], "chapters": ["Linked Lists"]})
+    if "extract the subject and chapter" in text:
+        return json.dumps({"subject": "Data Structures", "chapter": "Linked Lists"})
+    if "syllabus changes or date changes" in text:
+        return json.dumps({"syllabus_changes": [], "date_changes": []})
+    if "roadmap" in text:
+        steps = rng.randint(5, 10)
+        return "\n".join(f"{i}. Title: {sentence(rng, 3)} | Description: {sentence(rng, 12)}" for i in range(1, steps + 1))
+    if "flashcard" in text:
+        source = re.search(r'"source":\s*"([^"]*)"', prompt)
+        cards = []
+        for _ in range(requested_count(text, 5)):
+            card = {"question": sentence(rng) + "?", "answer": sentence(rng, 12), "topic": sentence(rng, 2)}
+            if source:
+                card["source"] = source.group(1)
+            cards.append(card)
+        return "```json\n" + json.dumps(cards, indent=2) + "\n```"
+    if "slides" in text:
+        slides = [{"title": sentence(rng, 3), "content": sentence(rng, 25)} for _ in range(rng.randint(3, 6))]
+        return json.dumps({"slides": slides}, indent=2)
+    if "question" in text and ("quiz" in text or "multiple choice" in text or "mcq" in text):
+        questions = [synth_question(rng, i) for i in range(1, requested_count(text, 5) + 1)]
+        if '"questions"' in text:
+            return json.dumps({"questions": questions}, indent=2)
+        return "```json\n" + json.dumps(questions, indent=2) + "\n```"
+    return " ".join(sentence(rng, 12) + "." for _ in range(rng.randint(2, 5)))
+
+
+def message_text(messages):
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if isinstance(part, dict))
+    return "\n".join(parts)
+
+
+def token_count(text):
+    return len(text) // 4 + 1
+
+
+def split_tokens(text):
+    return re.findall(r"\s*\S+", text) or [text]
+
+
+# --- OpenAI surfaces -------------------------------------------------------------------------
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    count("requests")
+    body = request.get_json(force=True)
+    error = injected_error()
+    if error is not None:
+        return error
+
+    def synthesize():
+        prompt = message_text(body.get("messages", []))
+        content = synthesize_text(prompt)
+        return {
+            "id": f"chatcmpl-fake-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": token_count(prompt), "completion_tokens": token_count(content),
+                      "total_tokens": token_count(prompt) + token_count(content)},
+        }
+
+    result = resolve("chat", body, synthesize, f"{OPENAI_UPSTREAM}/v1/chat/completions")
+    if result is None:
+        return jsonify({"error": {"message": "No recording for request", "type": "fake_llm_miss"}}), 404
+
+    time.sleep(sample_latency())
+    if not body.get("stream"):
+        return jsonify(result)
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+    def stream():
+        content = result["choices"][0]["message"].get("content") or ""
+        base = {"id": result["id"], "object": "chat.completion.chunk", "created": result["created"], "model": result["model"]}
+        yield "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}) + "\n\n"
+        for piece in split_tokens(content):
+            if config["token_delay"]:
+                time.sleep(config["token_delay"])
+            yield "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}) + "\n\n"
+        yield "data: " + json.dumps({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}) + "\n\n"
+        if include_usage:
+            yield "data: " + json.dumps({**base, "choices": [], "usage": result.get("usage")}) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return Response(stream(), mimetype="text/event-stream")
+
+
+def fake_embedding(text, dimensions):
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).hexdigest())
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+@app.route('/v1/embeddings', methods=['POST'])
+def embeddings():
+    count("requests")
+    body = request.get_json(force=True)
+    error = injected_error()
+    if error is not None:
+        return error
+
+    def synthesize():
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or (3072 if body.get("model") == "text-embedding-3-large" else 1536)
+        tokens = sum(token_count(str(text)) for text in inputs)
+        return {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(str(text), dimensions)} for i, text in enumerate(inputs)],
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    result = resolve("embeddings", body, synthesize, f"{OPENAI_UPSTREAM}/v1/embeddings")
+    if result is None:
+        return jsonify({"error": {"message": "No recording for request", "type": "fake_llm_miss"}}), 404
+    time.sleep(sample_latency())
+    return jsonify(result)
+
+
+# --- Gemini surface --------------------------------------------------------------------------
+
+@app.route('/v1beta/models/<path:model_action>', methods=['POST'])
+def gemini(model_action):
+    count("requests")
+    model, _, action = model_action.partition(":")
+    if action not in ("generateContent", "streamGenerateContent"):
+        return jsonify({"error": {"code": 404, "message": f"Unknown action '{action}'"}}), 404
+    body = request.get_json(force=True)
+    error = injected_error()
+    if error is not None:
+        return error
+
+    def synthesize():
+        prompt = "\n".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+        text = synthesize_text(prompt)
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": token_count(prompt), "candidatesTokenCount": token_count(text),
+                              "totalTokenCount": token_count(prompt) + token_count(text)},
+            "modelVersion": model,
+        }
+
+    result = resolve("gemini", {"model": model, **body}, synthesize, f"{GEMINI_UPSTREAM}/v1beta/models/{model}:generateContent")
+    if result is None:
+        return jsonify({"error": {"code": 404, "message": "No recording for request"}}), 404
+
+    time.sleep(sample_latency())
+    if action == "generateContent":
+        return jsonify(result)
+
+    text = result["candidates"][0]["content"]["parts"][0]["text"]
+    pieces = split_tokens(text)
+    chunks = [{"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}, "index": 0}]} for piece in pieces]
+    chunks[-1]["candidates"][0]["finishReason"] = "STOP"
+    chunks[-1]["usageMetadata"] = result.get("usageMetadata")
+
+    if request.args.get("alt") == "sse":
+        def stream():
+            for chunk in chunks:
+                if config["token_delay"]:
+                    time.sleep(config["token_delay"])
+                yield "data: " + json.dumps(chunk) + "\r\n\r\n"
+        return Response(stream(), mimetype="text/event-stream")
+    return jsonify(chunks)
+
+
+# --- Bland.ai surface ------------------------------------------------------------------------
+
+@app.route('/call', methods=['POST'])
+def bland_call():
+    count("requests")
+    error = injected_error()
+    if error is not None:
+        return error
+    time.sleep(sample_latency())
+    return jsonify({"status": "success", "message": "Call successfully queued.", "call_id": str(uuid.uuid4())})
+
+
+@app.route('/__stats', methods=['GET'])
+def fake_stats():
+    with stats_lock:
+        return jsonify({**stats, "mode": config["mode"], "recordings": len(recordings)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI/Gemini/Bland.ai server for offline load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--mode", choices=["synth", "replay", "record"], default="synth")
+    parser.add_argument("--recordings", default=config["recordings"], help="JSONL file used by replay/record")
+    parser.add_argument("--strict", action="store_true", help="In replay mode, return 404 instead of synthesizing on a miss")
+    parser.add_argument("--latency", type=parse_latency, default="fixed:0",
+                        help="Response latency distribution: fixed:MS, uniform:MIN,MAX, normal:MEAN,STD or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="Delay between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an injected error")
+    parser.add_argument("--error-status", default="429", help="Comma separated statuses used for injected errors")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    config.update({
+        "mode": args.mode,
+        "recordings": args.recordings,
+        "strict": args.strict,
+        "latency": args.latency,
+        "token_delay": args.token_delay_ms / 1000.0,
+        "error_rate": args.error_rate,
+        "error_statuses": [int(status) for status in args.error_status.split(",") if status],
+    })
+    if args.mode in ("replay", "record"):
+        load_recordings(args.recordings)
+
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
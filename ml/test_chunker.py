@@ -0,0 +1,28 @@
+from uitils.chunker import chunk_document, count_tokens, leading_text
+
+PROSE = ("Chapter 1 Introduction\n\nMonte Carlo methods estimate quantities by random sampling. "
+         "They are used in physics, finance and machine learning.\n\n")
+DOCUMENTS = [
+    "x" * 100000,
+    PROSE + "See https://example.com/" + "a1b2c3" * 5000 + " for details. " + PROSE,
+    PROSE * 50,
+    [PROSE, "data:image/png;base64," + "QUJD" * 20000, "Short closing page."],
+]
+
+
+def test_chunks_never_exceed_max_tokens():
+    for document in DOCUMENTS:
+        for max_tokens in (1, 20, 50, 500):
+            chunks = chunk_document(document, max_tokens=max_tokens)
+            assert chunks
+            for chunk in chunks:
+                assert chunk["tokens"] <= max_tokens
+                assert count_tokens(chunk["text"]) <= max_tokens
+
+
+def test_leading_text_never_exceeds_max_tokens():
+    for document in DOCUMENTS:
+        for max_tokens in (1, 50, 3000):
+            text = leading_text(document if isinstance(document, str) else "\n\n".join(document), max_tokens)
+            assert text
+            assert count_tokens(text) <= max_tokens
@@ -0,0 +1,81 @@
+import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Upper bound on concurrent workers for batch jobs; keeps a large import from
+# starting hundreds of extraction/LLM calls at once.
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+
+
+def process_concurrently(items, worker, max_workers=BATCH_MAX_WORKERS):
+    """
+    Run `worker` over `items` on a bounded thread pool and yield results as each one finishes.
+
+    A failure in one item is reported for that item only and never stops the others.
+
+    Args:
+        items (list): Inputs to process.
+        worker (callable): Function called with a single item.
+        max_workers (int): Maximum number of items processed at the same time.
+
+    Yields:
+        dict: {"index", "status", "result" or "error", "elapsed"} in completion order.
+    """
+    if not items:
+        return
+
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            return {"status": "ok", "result": worker(item), "elapsed": time.perf_counter() - start}
+        except Exception as e:
+            return {"status": "error", "error": str(e), "elapsed": time.perf_counter() - start}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        # Each worker runs in a copy of the caller's context so metrics keep the originating route
+        futures = {executor.submit(contextvars.copy_context().run, timed, item): index for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            outcome = future.result()
+            outcome["index"] = futures[future]
+            yield outcome
+
+
+def process_in_order(items, worker, max_workers=BATCH_MAX_WORKERS, window=None):
+    """
+    Like `process_concurrently`, but yield results in input order.
+
+    Only `window` items (default 2 * max_workers) are started ahead of the next one to be
+    yielded, so a slow item holds back at most that many finished results and memory stays
+    bounded for any number of items. Items not yet started are cancelled if the caller stops
+    iterating early.
+
+    Yields:
+        dict: {"index", "status", "result" or "error", "elapsed"} in input order.
+    """
+    if not items:
+        return
+
+    max_workers = max(1, min(max_workers, len(items)))
+    window = window or 2 * max_workers
+
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            return {"status": "ok", "result": worker(item), "elapsed": time.perf_counter() - start}
+        except Exception as e:
+            return {"status": "error", "error": str(e), "elapsed": time.perf_counter() - start}
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {}
+    submitted = 0
+    try:
+        for index in range(len(items)):
+            while submitted < len(items) and submitted < index + window:
+                futures[submitted] = executor.submit(contextvars.copy_context().run, timed, items[submitted])
+                submitted += 1
+            outcome = futures.pop(index).result()
+            outcome["index"] = index
+            yield outcome
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
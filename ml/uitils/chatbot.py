@@ -4,19 +4,29 @@ import dotenv
 import requests
 from pymongo import MongoClient
 from rank_bm25 import BM25Okapi
-from langchain_openai import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
-import openai
 import spacy
 
+from . import llm
+from . import question_bank
+from . import irt
+from . import seen_questions
+from .jsonstream import iter_json_items
+from .batch import process_concurrently
+from .dedupe import MinHashIndex
+
 # Load environment variables
 dotenv.load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
 mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-
-# Initialize OpenAI API
-openai.api_key = openai_api_key
-chatopenai = ChatOpenAI(model='gpt-4o-mini')
+BLANDAI_BASE_URL = os.getenv("BLANDAI_BASE_URL", "https://api.bland.ai")
+# Larger quizzes are split into sub-requests of at most this many questions, generated in parallel
+QUIZ_SUBREQUEST_SIZE = int(os.getenv("QUIZ_SUBREQUEST_SIZE", "10"))
+QUIZ_MAX_WORKERS = int(os.getenv("QUIZ_MAX_WORKERS", "10"))
+# Largest quiz one request may ask for (bounds the sub-request fan-out)
+QUIZ_MAX_QUESTIONS = int(os.getenv("QUIZ_MAX_QUESTIONS", "100"))
+# Adaptive quizzes choose from this many banked candidates per requested question
+ADAPTIVE_POOL_FACTOR = int(os.getenv("ADAPTIVE_POOL_FACTOR", "10"))
+# Other quizzes draw this many candidates per question, to have room for skipping ones the student has seen
+SEEN_POOL_FACTOR = int(os.getenv("SEEN_POOL_FACTOR", "3"))
 
 # MongoDB setup
 client = MongoClient(mongo_uri)
@@ -39,11 +49,18 @@ def get_bm25_ranking(query, docs):
     # Get BM25 scores for the query
     doc_scores = bm25.get_scores(query_keywords)
     return doc_scores
-def generate_openai(prompt: str) -> dict:
+
+def chatopenai_invoke(prompt: str, site: str = "chatbot", task: str = "answer") -> str:
+    """Send a single user prompt to the chatbot model."""
+    return llm.chat([{"role": "user", "content": prompt}], task=task, site=site)
+
+def generate_openai(prompt: str, site: str = "chatbot.generate_openai", detail=None) -> dict:
     """Generate quiz questions using OpenAI."""
     try:
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
+        content = llm.chat(
+            site=site,
+            detail=detail,
+            task="quiz",
             messages=[
                 {"role": "system", "content": "You are a helpful quiz generator."},
                 {"role": "user", "content": prompt}
@@ -51,8 +68,7 @@ def generate_openai(prompt: str) -> dict:
             temperature=0.7
         )
             # Parse the response and format it as quiz questions
-        content = response.choices[0].message.content
-        if content is None:
+        if not content:
             return {"questions": []}
 
         questions = []
@@ -100,8 +116,7 @@ def retrieval(text, params):
             "information of user, their syllabus for the year, their upcoming events."
         )
         try:
-            response = chatopenai.invoke(prompt)
-            classification = str(response.content).strip().lower()
+            classification = chatopenai_invoke(prompt, site="retrieval_classify", task="classify").strip().lower()
         except Exception as e:
             classification = "study-related" # Default fallback
 
@@ -121,8 +136,7 @@ def retrieval(text, params):
                     "Respond with a JSON object in the format: {'subjects': ['subject1', 'subject2'], 'chapters': ['chapter1', 'chapter2']}"
                 )
                 try:
-                    response = chatopenai.invoke(prompt)
-                    subject_info = json.loads(str(response.content))
+                    subject_info = json.loads(chatopenai_invoke(prompt, site="retrieval_subjects", task="extract"))
                     subject_filter = subject_info.get('subjects', [])
                     chapter_filter = subject_info.get('chapters', [])
                     if isubject:
@@ -154,9 +168,8 @@ def retrieval(text, params):
 
             # Use embeddings to rerank the top 10 documents
             top_docs = [doc[1]["document_content"]["extracted_text"] for doc in ranked_docs[:10]]
-            embeddings = OpenAIEmbeddings()
-            query_embedding = embeddings.embed_query(text)
-            doc_embeddings = embeddings.embed_documents(top_docs)
+            query_embedding = llm.embed_query(text, model="text-embedding-ada-002", site="retrieval_query")
+            doc_embeddings = llm.embed(top_docs, model="text-embedding-ada-002", site="retrieval_rerank")
             doc_distances = [
                 (doc, sum((qe - de) ** 2 for qe, de in zip(query_embedding, de)))
                 for doc, de in zip(top_docs, doc_embeddings)
@@ -224,9 +237,8 @@ def process_query(query_text, params):
 
     try:
         # Call the OpenAI API using ChatOpenAI instance
-        response = chatopenai.invoke(f"{prompt}. Only reply in plaintext and not markdown.")
-        generated_text = response.content if response else "No response generated"
-        generated_text = str(generated_text).strip()
+        generated_text = chatopenai_invoke(f"{prompt}. Only reply in plaintext and not markdown.", site="process_query")
+        generated_text = generated_text.strip() or "No response generated"
     except Exception as e:
         print(f"Error generating response: {str(e)}")
         generated_text = "Error generating response"
@@ -238,16 +250,22 @@ def process_query(query_text, params):
     }
     return result
 
-def generate_quiz(portion,user_id,num_questions=5):
+def syllabus_portion(portion, user_id):
+    """
+    The entries of the user's syllabus selected by `portion` (all of them when it is empty).
+
+    Returns:
+        tuple: (allowed_portion, error) - allowed_portion is None and error is set when the profile can't be used.
+    """
     #load the user profile
     user_profile = users_collection.find_one({"user_id": user_id})
 
     #handle case where user profile not found
     if not user_profile:
-        return {"error": "User profile not found"}
+        return None, "User profile not found"
 
     if "syllabus" not in user_profile:
-        return {"error": "No syllabus found in user profile"}
+        return None, "No syllabus found in user profile"
 
     #filter the portion according to the user syllabus for this test
     allowed_portion = []
@@ -260,10 +278,16 @@ def generate_quiz(portion,user_id,num_questions=5):
         allowed_portion = user_profile['syllabus']
 
     print(allowed_portion)
+    return allowed_portion, None
 
+def quiz_messages(allowed_portion, num_questions=5, difficulty=None):
+    """
+    Build the quiz generation prompt for the selected syllabus entries.
+    """
+    difficulty_rule = f"\n    All questions must be of {difficulty} difficulty." if difficulty else ""
     QUIZ_PROMPT = f"""
     You are a mcq quiz generator. From the following syllabus, generate a quiz with {num_questions} questions based on the user's syllabus.
-    The syllabus is: {allowed_portion}
+    The syllabus is: {allowed_portion}{difficulty_rule}
     Return a JSON object with the following format:
     {{
         "questions": [
@@ -293,26 +317,215 @@ def generate_quiz(portion,user_id,num_questions=5):
         ]
     }}
     """
+    return [
+        {"role": "system", "content": "You are a helpful quiz generator."},
+        {"role": "user", "content": QUIZ_PROMPT}
+    ]
+
+def plan_subrequests(nodes, num_questions, size=QUIZ_SUBREQUEST_SIZE):
+    """
+    Spread `num_questions` evenly over the syllabus nodes and pack them into sub-requests of at
+    most `size` questions.
+
+    Returns:
+        list: Sub-requests, each a list of ((subject, chapter), count) quotas.
+    """
+    nodes = nodes or [("General", "")]
+    base, extra = divmod(num_questions, len(nodes))
+    subrequests = [[]]
+    filled = 0
+    for position, node in enumerate(nodes):
+        count = base + (1 if position < extra else 0)
+        while count > 0:
+            if filled == size:
+                subrequests.append([])
+                filled = 0
+            take = min(count, size - filled)
+            subrequests[-1].append((node, take))
+            filled += take
+            count -= take
+    return [quotas for quotas in subrequests if quotas]
+
+def subrequest_messages(quotas, difficulty=None, part=1, parts=1):
+    topics = "\n".join(f"    - {count} on {subject}" + (f", chapter {chapter}" if chapter else "") for (subject, chapter), count in quotas)
+    difficulty_rule = f"All questions must be of {difficulty} difficulty." if difficulty else "Mix easy, medium and hard questions."
+    prompt = f"""
+    You are a mcq quiz generator. Generate {sum(count for _, count in quotas)} questions:
+{topics}
+    {difficulty_rule} Do not repeat questions.
+    This is set {part} of {parts} of one exam; other sets may cover the same topics, so ask about different concepts within them.
+    Return a JSON object with the following format:
+    {{
+        "questions": [
+            {{
+                "question": "What is 2+2?",
+                "options": ["3", "4", "5", "6"],
+                "answer": "4",
+                "subject":"Math",
+                "chapter":"Arithmetic",
+                "difficulty":"easy",
+                "marks":1,
+                "hint":"The answer is 4."
+            }}
+        ]
+    }}
+    """
+    return [
+        {"role": "system", "content": "You are a helpful quiz generator."},
+        {"role": "user", "content": prompt}
+    ]
+
+def generate_subrequest(quotas, difficulty=None, part=1, parts=1):
+    content = llm.chat(
+        site="generate_quiz_part",
+        task="quiz",
+        detail={"questions": sum(count for _, count in quotas), "nodes": len(quotas), "part": part},
+        messages=subrequest_messages(quotas, difficulty, part, parts),
+        temperature=0.7,
+        max_tokens=2000
+    )
+    quiz = json.loads(content)
+    return quiz.get("questions", []) if isinstance(quiz, dict) else quiz
+
+def iter_parallel_quiz(allowed_portion, num_questions, difficulty=None, max_workers=QUIZ_MAX_WORKERS, user_id=None):
+    """
+    Generate a large quiz as parallel sub-requests over the syllabus nodes, yielding questions
+    as each sub-request finishes. Near-duplicates and questions the user has already been given
+    are dropped, and question numbers follow the order questions are yielded in. A second round
+    tops up what failed or was dropped.
+    """
+    nodes = question_bank.syllabus_nodes(allowed_portion)
+    seen = MinHashIndex()
+    produced = 0
+    for attempt in range(2):
+        missing = num_questions - produced
+        if missing <= 0:
+            break
+        subrequests = plan_subrequests(nodes, missing)
+        if attempt:
+            print(f"Topping up quiz with {missing} question(s) in {len(subrequests)} sub-request(s)")
+        # Part numbers keep the prompts of sub-requests for the same nodes (and of the top-up round) apart
+        parts = len(subrequests)
+        worker = lambda index: generate_subrequest(subrequests[index], difficulty, part=attempt * parts + index + 1, parts=parts)
+        for outcome in process_concurrently(list(range(parts)), worker, max_workers=max_workers):
+            if outcome["status"] != "ok":
+                print(f"Quiz sub-request {outcome['index'] + 1}/{len(subrequests)} failed: {outcome['error']}")
+                continue
+            for question in outcome["result"]:
+                if produced >= num_questions:
+                    break
+                if not isinstance(question, dict) or not question.get("question"):
+                    continue
+                if seen.add(f"{question['question']} {question.get('answer', '')}") is not None:
+                    continue
+                if seen_questions.seen_mask(user_id, [question])[0]:
+                    continue
+                produced += 1
+                question["question_number"] = produced
+                yield question
+
+def bank_quiz(allowed_portion, num_questions, difficulty=None, user_id=None, adaptive=False):
+    """
+    Try to serve the quiz from the question bank, skipping questions the student has already
+    been given. When the bank holds too few such questions for these syllabus nodes, queue them
+    for the background refiller and return None (the live questions then grow the bank).
+
+    With `adaptive`, a larger random pool is drawn and the questions most informative about the
+    student's calibrated ability (IRT) are kept.
+    """
+    nodes = question_bank.syllabus_nodes(allowed_portion)
+    pool_size = num_questions * (ADAPTIVE_POOL_FACTOR if adaptive else SEEN_POOL_FACTOR)
+    questions = seen_questions.unseen(user_id, question_bank.sample_questions(nodes, pool_size, difficulty))
+    if len(questions) >= num_questions:
+        if adaptive:
+            questions = irt.select_questions(user_id, questions, num_questions)
+        questions = questions[:num_questions]
+        for number, question in enumerate(questions, start=1):
+            question["question_number"] = number
+        return questions
+    question_bank.request_refill(nodes)
+    return None
+
+def generate_quiz(portion,user_id,num_questions=5,difficulty=None,adaptive=False):
+    allowed_portion, error = syllabus_portion(portion, user_id)
+    if error:
+        return {"error": error}
+
+    questions = bank_quiz(allowed_portion, num_questions, difficulty, user_id, adaptive)
+    if questions is not None:
+        return {"questions": questions}
+
+    # Bank is short: generate live and keep the questions for later quizzes
+    if num_questions > QUIZ_SUBREQUEST_SIZE:
+        questions = list(iter_parallel_quiz(allowed_portion, num_questions, difficulty, user_id=user_id))
+        question_bank.add_questions(questions)
+        return {"questions": questions}
+
+    messages = quiz_messages(allowed_portion, num_questions, difficulty)
     try:
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful quiz generator."},
-                {"role": "user", "content": QUIZ_PROMPT}
-            ],
+        # Not cached: a student regenerating a quiz must get new questions, not the same response
+        content = llm.chat(
+            site="generate_quiz",
+            task="quiz",
+            messages=messages,
             temperature=0.3,
             max_tokens=2000
         )
 
-        content = response.choices[0].message.content
-        if content is None:
+        if not content:
             return {"questions": []}
 
-        return json.loads(content)
+        quiz = json.loads(content)
+        question_bank.add_questions(quiz.get("questions", []))
+        quiz["questions"] = seen_questions.unseen(user_id, quiz.get("questions", []))
+        for number, question in enumerate(quiz["questions"], start=1):
+            question["question_number"] = number
+        return quiz
     except Exception as e:
         print(f"Error generating quiz: {str(e)}")
         return {"questions": []}
 
+def generate_quiz_stream(portion, user_id, num_questions=5, difficulty=None, adaptive=False):
+    """
+    Streaming variant of `generate_quiz`: yields each question as soon as the model has finished
+    writing it (or straight from the question bank). Raises ValueError when the user profile
+    can't be used.
+    """
+    allowed_portion, error = syllabus_portion(portion, user_id)
+    if error:
+        raise ValueError(error)
+
+    questions = bank_quiz(allowed_portion, num_questions, difficulty, user_id, adaptive)
+    if questions is not None:
+        yield from questions
+        return
+
+    if num_questions > QUIZ_SUBREQUEST_SIZE:
+        generated = []
+        for question in iter_parallel_quiz(allowed_portion, num_questions, difficulty, user_id=user_id):
+            generated.append(question)
+            yield question
+        question_bank.add_questions(generated)
+        return
+
+    pieces = llm.chat_stream(
+        site="generate_quiz",
+        task="quiz",
+        messages=quiz_messages(allowed_portion, num_questions, difficulty),
+        temperature=0.3,
+        max_tokens=2000
+    )
+    generated = []
+    streamed = 0
+    for question in iter_json_items(pieces):
+        generated.append(question)
+        if not isinstance(question, dict) or seen_questions.seen_mask(user_id, [question])[0]:
+            continue
+        streamed += 1
+        question["question_number"] = streamed
+        yield question
+    question_bank.add_questions(generated)
+
 # Example usage
 if __name__ == "__main__":
     # Sample query
@@ -354,6 +567,6 @@ def check_up_call(student_name):
     }
 
     # API request
-    response = requests.post('https://api.bland.ai/call', json=data, headers=headers)
+    response = requests.post(f"{BLANDAI_BASE_URL}/call", json=data, headers=headers)
     print(response.text)  # Print response for debugging purposes
     return response.text
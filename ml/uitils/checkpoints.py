@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+import dotenv
+
+dotenv.load_dotenv()
+
+# Per-chunk checkpoints for course generation, so a retried request or a re-upload of the same
+# document only generates the chunks that are still missing.
+#
+# Layout: COURSE_CHECKPOINT_DIR/<course_id>/
+#     manifest.json       document hash, versions and chunk count
+#     chunk_00000.json    slides of each completed chunk
+#     course.json         final course output
+#
+# The course id covers the document content, the chunker (version and settings) and the prompt
+# version, so changing any of them starts a fresh set of checkpoints.
+#
+# Courses not used for COURSE_CHECKPOINT_TTL seconds are removed, and beyond
+# COURSE_CHECKPOINT_MAX_COURSES the least recently used ones go first. A course directory's
+# mtime is its last use.
+
+COURSE_CHECKPOINT_DIR = os.getenv("COURSE_CHECKPOINT_DIR", "./cache/courses")
+COURSE_CHECKPOINT_TTL = int(os.getenv("COURSE_CHECKPOINT_TTL", str(30 * 24 * 3600)))
+COURSE_CHECKPOINT_MAX_COURSES = int(os.getenv("COURSE_CHECKPOINT_MAX_COURSES", "200"))
+
+_evict_lock = threading.Lock()
+
+
+def document_hash(pages):
+    """
+    Content hash of a document given as a list of page texts (or one string).
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+    digest = hashlib.sha256()
+    for page in pages:
+        digest.update((page or "").encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def course_id(doc_hash, chunker_version, prompt_version):
+    raw = json.dumps([doc_hash, chunker_version, prompt_version], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def evict(directory=COURSE_CHECKPOINT_DIR, max_courses=COURSE_CHECKPOINT_MAX_COURSES,
+          ttl=COURSE_CHECKPOINT_TTL, keep=None):
+    """
+    Remove expired course checkpoints, then the least recently used ones until at most
+    `max_courses` are left. The course id `keep` is never removed.
+
+    Returns:
+        int: Number of courses removed.
+    """
+    with _evict_lock:
+        courses = []
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return 0
+        for name in names:
+            path = os.path.join(directory, name)
+            if name == keep or not os.path.isdir(path):
+                continue
+            try:
+                courses.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        courses.sort()
+        expired = time.time() - ttl
+        allowed = max_courses - (1 if keep else 0)
+        removed = 0
+        for index, (used, path) in enumerate(courses):
+            if used >= expired and len(courses) - index <= allowed:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    if removed:
+        print(f"Removed {removed} course checkpoint(s) from {directory}")
+    return removed
+
+
+class CourseCheckpoint:
+    """
+    Checkpoints of one course generation job.
+    """
+
+    def __init__(self, doc_hash, chunker_version, prompt_version, total_chunks, directory=COURSE_CHECKPOINT_DIR):
+        self.id = course_id(doc_hash, chunker_version, prompt_version)
+        self.directory = os.path.join(directory, self.id)
+        self.total_chunks = total_chunks
+        self.output_path = os.path.join(self.directory, "course.json")
+        os.makedirs(self.directory, exist_ok=True)
+        os.utime(self.directory)  # mark as used, so it is evicted last
+        evict(directory, keep=self.id)
+
+        manifest_path = os.path.join(self.directory, "manifest.json")
+        if not os.path.exists(manifest_path):
+            _write_json(manifest_path, {
+                "document_hash": doc_hash,
+                "chunker_version": chunker_version,
+                "prompt_version": prompt_version,
+                "chunks": total_chunks,
+                "created": time.time(),
+            })
+
+    def _chunk_path(self, index):
+        return os.path.join(self.directory, f"chunk_{index:05d}.json")
+
+    def load_chunk(self, index):
+        """
+        Slides saved for a chunk, or None if it has not been completed yet.
+        """
+        entry = _read_json(self._chunk_path(index))
+        return entry["slides"] if entry else None
+
+    def save_chunk(self, index, slides):
+        _write_json(self._chunk_path(index), {"index": index, "slides": slides, "saved": time.time()})
+
+    def missing(self):
+        """
+        Indexes of the chunks without a checkpoint.
+        """
+        return [index for index in range(self.total_chunks) if not os.path.exists(self._chunk_path(index))]
+
+    def load_output(self):
+        return _read_json(self.output_path)
+
+    def save_output(self, output):
+        _write_json(self.output_path, output)
+
+    def save_output_from_chunks(self, keep=None, **fields):
+        """
+        Write course.json from the chunk checkpoints, one chunk at a time, so the whole course
+        never has to be held in memory. Only slides accepted by `keep` (if given) are written;
+        extra keyword arguments are added to the output.
+        """
+        tmp_path = f"{self.output_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write('{"slides": [')
+            first = True
+            for index in range(self.total_chunks):
+                for slide in self.load_chunk(index) or []:
+                    if keep is not None and not keep(slide):
+                        continue
+                    f.write(("" if first else ", ") + json.dumps(slide, ensure_ascii=False))
+                    first = False
+            f.write("]")
+            for key, value in fields.items():
+                f.write(f", {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}")
+            f.write("}")
+        os.replace(tmp_path, self.output_path)
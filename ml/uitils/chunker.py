@@ -0,0 +1,248 @@
+import os
+import re
+
+import dotenv
+
+dotenv.load_dotenv()
+
+# Structure-aware document chunker shared by the slide, quiz and flashcard generators.
+# Text is cut into headings, paragraphs and sentences, then packed into chunks of at most
+# CHUNK_MAX_TOKENS model tokens. Chunks prefer to end at a section or paragraph boundary and
+# never end mid-sentence (unless a single sentence is longer than a whole chunk). Each chunk
+# repeats the last CHUNK_OVERLAP_TOKENS of the previous one and records the pages it came from.
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "2000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "100"))
+
+# Bump when the splitting rules change, so results stored per chunk are not reused across versions
+CHUNKER_VERSION = "2"
+
+# A chunk is closed early at a heading or paragraph start once it is at least this full
+MIN_FILL = 0.5
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+HEADING_PATTERNS = [
+    re.compile(r"^#{1,6}\s+\S"),
+    re.compile(r"^(chapter|section|unit|module|part|lecture|topic)\s+[\dIVXivx]+\b", re.IGNORECASE),
+    re.compile(r"^\d+(\.\d+)*\.?\s+[A-Z][^.!?]{0,80}$"),
+]
+BULLET = re.compile(r"^([-*•]|\d+[.)])\s+")
+
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text):
+    """
+    Count model tokens with tiktoken (cl100k_base) when it is available, otherwise estimate
+    ~4 characters per token.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable, estimating token counts: {str(e)}")
+    if _encoding is not None:
+        return len(_encoding.encode_ordinary(text))
+    return len(text) // 4 + 1
+
+
+def is_heading(line):
+    if len(line) > 100:
+        return False
+    if any(pattern.match(line) for pattern in HEADING_PATTERNS):
+        return True
+    # Short all-caps lines such as "INTRODUCTION" or "LINKED LISTS"
+    words = line.split()
+    return 1 <= len(words) <= 10 and line.isupper() and any(char.isalpha() for char in line)
+
+
+def _split_word(word, max_tokens):
+    # A single "word" longer than a chunk (URLs, base64, text extracted without spaces): cut it
+    # into pieces of at most `max_tokens` tokens by characters
+    pieces = []
+    while word:
+        size = min(len(word), max_tokens * 4)
+        tokens = count_tokens(word[:size])
+        while size > 1 and tokens > max_tokens:
+            size = max(1, min(size - 1, size * max_tokens // tokens))
+            tokens = count_tokens(word[:size])
+        pieces.append(word[:size])
+        word = word[size:]
+    return pieces
+
+
+def _split_long(text, max_tokens):
+    # Last resort for a sentence longer than a whole chunk: cut it on word boundaries
+    words = []
+    for word in text.split():
+        words.extend([word] if count_tokens(word + " ") <= max_tokens else _split_word(word, max(1, max_tokens - 1)))
+    pieces, current = [], []
+    budget = 0
+    for word in words:
+        tokens = count_tokens(word + " ")
+        if current and budget + tokens > max_tokens:
+            pieces.append(" ".join(current))
+            current, budget = [], 0
+        current.append(word)
+        budget += tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _units(pages, max_tokens):
+    """
+    Break pages into units (headings and sentences) of at most `max_tokens` tokens.
+
+    Each unit is (text, tokens, page, kind) where kind is "heading", "paragraph" for the first
+    sentence of a paragraph, or "sentence".
+    """
+    units = []
+    for page_number, page in enumerate(pages, start=1):
+        if not page:
+            continue
+        for block in PARAGRAPH_BREAK.split(page):
+            paragraph = []
+            lines = [line.strip() for line in block.splitlines() if line.strip()]
+            for line in lines + [None]:
+                boundary = line is None or is_heading(line) or BULLET.match(line)
+                if boundary and paragraph:
+                    sentences = SENTENCE_BREAK.split(" ".join(paragraph))
+                    for j, sentence in enumerate(sentences):
+                        tokens = count_tokens(sentence)
+                        pieces = [sentence] if tokens <= max_tokens else _split_long(sentence, max_tokens)
+                        for k, piece in enumerate(pieces):
+                            kind = "paragraph" if j == 0 and k == 0 else "sentence"
+                            units.append((piece, tokens if len(pieces) == 1 else count_tokens(piece), page_number, kind))
+                    paragraph = []
+                if line is None:
+                    break
+                if is_heading(line):
+                    tokens = count_tokens(line)
+                    pieces = [line] if tokens <= max_tokens else _split_long(line, max_tokens)
+                    for k, piece in enumerate(pieces):
+                        units.append((piece, tokens if len(pieces) == 1 else count_tokens(piece), page_number,
+                                      "heading" if k == 0 else "sentence"))
+                else:
+                    paragraph.append(line)
+    return units
+
+
+def _render(units):
+    parts = []
+    for text, _, _, kind in units:
+        if parts:
+            parts.append("\n\n" if kind != "sentence" else " ")
+        parts.append(text)
+    return "".join(parts)
+
+
+def chunk_document(pages, max_tokens=None, overlap_tokens=None):
+    """
+    Split a document into token-bounded chunks along its structure.
+
+    Args:
+        pages (list or str): Text of each page (or the whole text as one string).
+        max_tokens (int): Maximum tokens per chunk. Defaults to CHUNK_MAX_TOKENS.
+        overlap_tokens (int): Tokens of trailing context repeated at the start of the next chunk.
+            Defaults to CHUNK_OVERLAP_TOKENS; capped at a quarter of `max_tokens`.
+
+    Returns:
+        list: Chunks as {"index", "text", "tokens", "page_start", "page_end"} dicts, in document order.
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_tokens = min(CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens, max_tokens // 4)
+
+    chunks = []
+    current = []  # units of the chunk being built, starting with the overlap carried over
+    current_tokens = 0
+    carried = 0  # number of overlap units at the start of `current`
+
+    def emit(cut):
+        nonlocal current, current_tokens, carried
+        body = current[:cut]
+        # Never leave a heading dangling at the end of a chunk
+        while len(body) > 1 and body[-1][3] == "heading":
+            body = body[:-1]
+        rest = current[len(body):]
+        chunks.append({
+            "index": len(chunks),
+            "text": _render(body),
+            "tokens": sum(unit[1] for unit in body),
+            "page_start": body[0][2],
+            "page_end": body[-1][2],
+        })
+
+        overlap = []
+        budget = 0
+        for unit in reversed(body):
+            if unit[3] == "heading" or budget + unit[1] > overlap_tokens:
+                break
+            overlap.insert(0, unit)
+            budget += unit[1]
+        if overlap:
+            # The overlap opens the next chunk as its own paragraph
+            overlap[0] = overlap[0][:3] + ("paragraph",)
+        current = overlap + rest
+        current_tokens = sum(unit[1] for unit in current)
+        carried = len(overlap)
+
+    for unit in _units(pages, max_tokens - overlap_tokens):
+        fresh = len(current) > carried
+        if fresh and unit[3] == "heading" and current_tokens >= max_tokens * MIN_FILL:
+            emit(len(current))
+        elif fresh and current_tokens + unit[1] > max_tokens:
+            # Prefer cutting before the last paragraph or heading in the second half of the chunk
+            cut = len(current)
+            running = 0
+            for i, (_, tokens, _, kind) in enumerate(current):
+                if (i > carried and kind != "sentence" and current[i - 1][3] != "heading"
+                        and running >= max_tokens * MIN_FILL and current_tokens - running + unit[1] <= max_tokens):
+                    cut = i
+                running += tokens
+            emit(cut)
+            if current_tokens + unit[1] > max_tokens:
+                # No room for the overlap next to the carried-over paragraph
+                current = current[carried:]
+                current_tokens = sum(u[1] for u in current)
+                carried = 0
+        current.append(unit)
+        current_tokens += unit[1]
+
+    if len(current) > carried:
+        emit(len(current))
+    return chunks
+
+
+def chunker_version(max_tokens=None, overlap_tokens=None):
+    """
+    Identifier of the chunker version and settings; chunks are identical whenever this matches.
+    """
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    return f"{CHUNKER_VERSION}:{max_tokens}:{overlap_tokens}"
+
+
+def chunk_texts(pages, max_tokens=None, overlap_tokens=None):
+    """
+    Same as `chunk_document` but returns only the chunk texts.
+    """
+    return [chunk["text"] for chunk in chunk_document(pages, max_tokens, overlap_tokens)]
+
+
+def leading_text(text, max_tokens):
+    """
+    The start of `text`, at most `max_tokens` tokens long and cut at a sentence or section
+    boundary instead of mid-word. Replaces blind `text[:n]` truncation in prompts.
+    """
+    if not text:
+        return ""
+    chunks = chunk_document(text, max_tokens=max_tokens, overlap_tokens=0)
+    return chunks[0]["text"] if chunks else ""
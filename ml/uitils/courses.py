@@ -1,27 +1,217 @@
 import os
 import json
 import mimetypes
-from .extraction import extract_text_from_file
-from .chatbot import generate_openai
+from .extraction import extract_pages_from_file
+from .chunker import chunk_document, chunker_version
+from .checkpoints import CourseCheckpoint, document_hash
+from .batch import process_concurrently, process_in_order
+from .dedupe import dedupe, slide_text
+from . import llm
+
+# Chunks are generated concurrently; the LLM gateway's rate limiter keeps the pool within the
+# provider limits, so this only caps how many requests are in flight at once.
+COURSE_MAX_WORKERS = int(os.getenv("COURSE_MAX_WORKERS", "6"))
+# Extra rounds for chunks whose call or response parsing failed
+COURSE_CHUNK_RETRIES = int(os.getenv("COURSE_CHUNK_RETRIES", "2"))
+# Bump when course_chunk_messages changes, so checkpointed slides from the old prompt are not reused
+COURSE_PROMPT_VERSION = "1"
+
+def course_chunk_messages(chunk):
+    prompt = f"""
+    Create educational slides from this text:
+    {chunk}
+
+    Format each slide as:
+    {{
+        "title": "Clear and concise title",
+        "content": "Detailed slide content"
+    }}
+
+    Return an array of slides.
+    """
+    return [
+        {"role": "system", "content": "You are a course content generator."},
+        {"role": "user", "content": prompt}
+    ]
 
-# Function to split text into chunks
-def split_text_into_chunks(text, chunk_size=1000):
+def parse_slides(content):
+    """
+    Parse the slides out of a model response: a JSON array or {"slides": [...]}, optionally
+    wrapped in a markdown code block.
+    """
+    if not content:
+        raise ValueError("Empty response from OpenAI")
+
+    clean_content = content
+    if "```json" in content:
+        clean_content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        clean_content = content.split("```")[1]
+
+    slides = json.loads(clean_content.strip())
+    if isinstance(slides, dict) and "slides" in slides:
+        return slides["slides"]
+    if isinstance(slides, list):
+        return slides
+    raise ValueError("Invalid response structure")
+
+def _with_pages(slide, chunk):
+    # Point each slide back to the pages its chunk came from
+    if isinstance(slide, dict):
+        slide["pages"] = [chunk["page_start"], chunk["page_end"]]
+    return slide
+
+def generate_chunk_slides(chunk, total, site="course_chunk"):
+    content = llm.chat(
+        site=site,
+        detail={"chunk": chunk["index"] + 1, "chunks": total, "pages": [chunk["page_start"], chunk["page_end"]]},
+        task="slides",
+        messages=course_chunk_messages(chunk["text"]),
+        temperature=0.7
+    )
+    return [_with_pages(slide, chunk) for slide in parse_slides(content)]
+
+def open_checkpoint(pages, chunks, max_tokens=None):
+    """
+    Checkpoints for generating a course from `pages` split into `chunks` (with `max_tokens`).
     """
-    Splits the given text into chunks of approximately `chunk_size` words.
+    return CourseCheckpoint(document_hash(pages), chunker_version(max_tokens), COURSE_PROMPT_VERSION, len(chunks))
+
+def generate_slides(chunks, site="course_chunk", max_workers=COURSE_MAX_WORKERS, retries=COURSE_CHUNK_RETRIES, checkpoint=None):
+    """
+    Generate slides for every chunk on a bounded worker pool.
+
+    Chunks that fail (API error or unparseable response) are retried in up to `retries` further
+    rounds; the chunks that already succeeded are kept, so a failure never restarts the job.
+    With a checkpoint, chunks completed by an earlier request are reused and every new chunk is
+    saved as soon as it is done.
 
     Args:
-        text (str): The text to split.
-        chunk_size (int): The number of words per chunk.
+        chunks (list): Chunks of the document from `chunker.chunk_document`.
+        site (str): Call site name used in the LLM metrics.
+        max_workers (int): Maximum number of chunks generated at the same time.
+        retries (int): Number of retry rounds for failed chunks.
+        checkpoint (CourseCheckpoint): Optional per-chunk checkpoint store.
 
     Returns:
-        list: A list of text chunks.
+        list: All slides, ordered by chunk index.
     """
-    words = text.split()
-    return [' '.join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size)]
+    slides_by_chunk = {}
+    pending = list(range(len(chunks)))
+    if checkpoint:
+        for index in pending:
+            saved = checkpoint.load_chunk(index)
+            if saved is not None:
+                slides_by_chunk[index] = saved
+        pending = [index for index in pending if index not in slides_by_chunk]
+        if slides_by_chunk:
+            print(f"Reusing {len(slides_by_chunk)} checkpointed chunk(s) of course {checkpoint.id}")
+
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"Retrying {len(pending)} failed chunk(s), attempt {attempt + 1}")
+
+        failed = []
+        worker = lambda index: generate_chunk_slides(chunks[index], len(chunks), site=site)
+        for outcome in process_concurrently(pending, worker, max_workers=max_workers):
+            index = pending[outcome["index"]]
+            if outcome["status"] == "ok":
+                slides_by_chunk[index] = outcome["result"]
+                if checkpoint:
+                    checkpoint.save_chunk(index, outcome["result"])
+                print(f"Generated {len(outcome['result'])} slides for chunk {index + 1} of {len(chunks)} in {outcome['elapsed']:.2f}s")
+            else:
+                failed.append(index)
+                print(f"Error processing chunk {index + 1}: {outcome['error']}")
+        pending = sorted(failed)
+
+    if pending:
+        print(f"Giving up on chunks {[index + 1 for index in pending]} after {retries + 1} attempts")
+
+    return [slide for index in sorted(slides_by_chunk) for slide in slides_by_chunk[index]]
+
+def iter_chunk_slides(chunks, site="course_chunk", max_workers=COURSE_MAX_WORKERS, retries=COURSE_CHUNK_RETRIES, checkpoint=None):
+    """
+    Generate the slides of each chunk concurrently and yield them strictly in chunk order.
+
+    Only a bounded window of chunks is generated ahead of the one being yielded, so memory does
+    not grow with the document length. A failing chunk is retried up to `retries` times before
+    it is reported as an error. Checkpointed chunks are replayed instead of regenerated.
 
-def generate_course(file, output_path=None, chunk_size=2000):
+    Yields:
+        dict: {"index", "status": "ok" | "cached" | "error", "slides", "pages", "error"?}
+    """
+    def work(index):
+        saved = checkpoint.load_chunk(index) if checkpoint else None
+        if saved is not None:
+            return "cached", saved
+        for attempt in range(retries + 1):
+            try:
+                slides = generate_chunk_slides(chunks[index], len(chunks), site=site)
+                break
+            except Exception as e:
+                print(f"Error processing chunk {index + 1} (attempt {attempt + 1}): {str(e)}")
+                if attempt == retries:
+                    raise
+        if checkpoint:
+            checkpoint.save_chunk(index, slides)
+        return "ok", slides
+
+    for outcome in process_in_order(list(range(len(chunks))), work, max_workers=max_workers):
+        index = outcome["index"]
+        chunk = {"index": index, "pages": [chunks[index]["page_start"], chunks[index]["page_end"]]}
+        if outcome["status"] == "ok":
+            status, slides = outcome["result"]
+            yield dict(chunk, status=status, slides=slides)
+        else:
+            yield dict(chunk, status="error", slides=[], error=outcome["error"])
+
+def generate_course_from_pages(pages, max_tokens=None, site="generate_course"):
+    """
+    Generate the slides for a document, resuming from its checkpoints.
+
+    Near-duplicate slides (e.g. from the overlap between chunks) are merged into the first one,
+    which lists the pages of the merged slides under "duplicate_sources". Once every chunk is
+    done the course is saved in the checkpoint store and later calls for the same document
+    return it directly.
+
+    Returns:
+        dict: {"slides", "course_id", "missing_chunks", "output_path"}; `output_path` is None
+        while chunks are still missing.
+    """
+    chunks = chunk_document(pages, max_tokens=max_tokens)
+    checkpoint = open_checkpoint(pages, chunks, max_tokens)
+
+    course = checkpoint.load_output()
+    if course:
+        print(f"Reusing completed course {checkpoint.id}")
+        return course
+
+    # Generate slides for all chunks concurrently, keeping chunk order
+    all_slides = generate_slides(chunks, site=site, checkpoint=checkpoint)
+    all_slides = dedupe(all_slides, slide_text, lambda slide: {"pages": slide.get("pages")} if isinstance(slide, dict) else None)
+    missing = checkpoint.missing()
+    course = {
+        "slides": all_slides,
+        "course_id": checkpoint.id,
+        "missing_chunks": missing,
+        "output_path": None if missing else checkpoint.output_path
+    }
+    if all_slides and not missing:
+        checkpoint.save_output(course)
+    return course
+
+def generate_course(file, max_tokens=None):
     """
     Generate course content based on the input file.
+
+    The finished course is also written to the checkpoint store; its path is returned as `output_path`.
+
+    Args:
+        file: Uploaded file (needs a `filename`).
+        max_tokens (int): Chunk size in tokens; defaults to the chunker's CHUNK_MAX_TOKENS.
     """
     try:
         # Detect file type (mimetype)
@@ -29,85 +219,20 @@ def generate_course(file, output_path=None, chunk_size=2000):
         if not mimetype:
             raise ValueError("Could not determine file mimetype.")
 
-        # Extract text from the file
-        text = extract_text_from_file(file, mimetype)
-        if not text:  # Check if text is None
+        # Extract text from the file, page by page
+        pages = extract_pages_from_file(file, mimetype)
+        if not pages:  # Check if pages is None
             raise ValueError("No text extracted from file.")
-        if not text.strip():  # Only strip if text is not None
+        if not any(page.strip() for page in pages):
             raise ValueError("Empty text content found in the file.")
 
-        # Split text into chunks
-        chunks = split_text_into_chunks(text, chunk_size=chunk_size)
-
-        # Define the system prompt
-        system_prompt = """
-        You are a course content generator. Create educational slides from the given text.
-        Each slide should have a title and content.
-        Format your response as a JSON array of slides.
-        Example format:
-        {
-            "slides": [
-                {
-                    "title": "Introduction",
-                    "content": "Main content of the slide"
-                },
-                {
-                    "title": "Key Concepts",
-                    "content": "Content explaining key concepts"
-                }
-            ]
-        }
-        """
-
-        # Generate slides for each chunk
-        all_slides = []
-        for idx, chunk in enumerate(chunks):
-            print(f"Processing chunk {idx + 1} of {len(chunks)}...")
-            try:
-                prompt = f"{system_prompt}\n\nText to convert into slides:\n{chunk}"
-
-                # Generate response using OpenAI
-                response = generate_openai(prompt)
-
-                # Try to parse the response as JSON
-                try:
-                    # First, try direct JSON parsing
-                    if isinstance(response, str):
-                        # Remove any markdown code block indicators if present
-                        response = response.replace("```json", "").replace("```", "").strip()
-                        parsed_response = json.loads(response)
-                    else:
-                        parsed_response = response
-
-                    # Validate the response structure
-                    if isinstance(parsed_response, dict) and 'slides' in parsed_response:
-                        all_slides.extend(parsed_response['slides'])
-                    else:
-                        print(f"Invalid response structure for chunk {idx + 1}")
-                        continue
-
-                except json.JSONDecodeError as json_err:
-                    print(f"JSON parsing error in chunk {idx + 1}: {str(json_err)}")
-                    print("Raw response:", response)
-                    continue
-
-            except Exception as e:
-                print(f"Error processing chunk {idx + 1}: {str(e)}")
-                continue
+        # Chunk along headings, paragraphs and sentences and generate (or resume) the slides
+        final_output = generate_course_from_pages(pages, max_tokens=max_tokens)
 
         # If no slides were generated, return an error
-        if not all_slides:
+        if not final_output["slides"]:
             return {"slides": [{"title": "Error", "content": "Could not generate slides from the provided content."}]}
 
-        # Create final output
-        final_output = {"slides": all_slides}
-
-        # Optionally save to file
-        if output_path:
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(final_output, f, indent=4, ensure_ascii=False)
-
         return final_output
 
     except Exception as e:
@@ -0,0 +1,199 @@
+import os
+import re
+
+import numpy as np
+import dotenv
+
+dotenv.load_dotenv()
+
+# Near-duplicate removal for generated slides and flashcards.
+# Every text is reduced to a MinHash signature over its words and word pairs; the fraction of
+# equal signature positions estimates the Jaccard similarity of two texts. Candidate pairs come
+# from LSH banding (texts sharing all rows of at least one band), so the work grows with the
+# number of items rather than the number of pairs.
+
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.7"))  # estimated Jaccard similarity
+
+NUM_PERM = 32
+BANDS = 8  # 8 bands of 4 rows: pairs above ~0.6 similarity are very likely to become candidates
+ROWS = NUM_PERM // BANDS
+BLOCK_ITEMS = 2048  # signatures are computed this many texts at a time to bound memory
+
+WORD = re.compile(r"\w+")
+
+_rng = np.random.default_rng(20240611)
+# Odd multipliers make x -> a * x + b (mod 2**32) a permutation of the 32-bit feature hashes
+_PERM_A = _rng.integers(0, 2**31, size=NUM_PERM, dtype=np.uint32) * np.uint32(2) + np.uint32(1)
+_PERM_B = _rng.integers(0, 2**32, size=NUM_PERM, dtype=np.uint32)
+_BAND_MULTIPLIERS = _rng.integers(1, 2**63, size=ROWS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_PAIR_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _word_hashes(texts):
+    # Python's string hash is salted per process: signatures are only comparable within one process
+    hashes = []
+    offsets = [0]
+    for text in texts:
+        hashes.extend(map(hash, WORD.findall((text or "").lower())))
+        offsets.append(len(hashes))
+    return np.array(hashes, dtype=np.int64).view(np.uint64), np.asarray(offsets)
+
+
+def minhash(texts):
+    """
+    MinHash signatures of `texts` over their words and consecutive word pairs.
+
+    Returns:
+        numpy.ndarray: (len(texts), NUM_PERM) uint32 signatures.
+    """
+    signatures = np.full((len(texts), NUM_PERM), np.iinfo(np.uint32).max, dtype=np.uint32)
+    for block_start in range(0, len(texts), BLOCK_ITEMS):
+        words, offsets = _word_hashes(texts[block_start:block_start + BLOCK_ITEMS])
+        if not len(words):
+            continue
+        # Word pairs, hashed from the two word hashes; pairs across text boundaries are dropped
+        keep = np.ones(max(len(words) - 1, 0), dtype=bool)
+        last_words = offsets[1:-1] - 1
+        keep[last_words[(last_words >= 0) & (last_words < len(keep))]] = False
+        pairs = (words[:-1] * _PAIR_MULTIPLIER + words[1:])[keep]
+        # Fold the 64-bit hashes to 32 bits
+        words = (words ^ (words >> np.uint64(32))).astype(np.uint32)
+        pairs = (pairs ^ (pairs >> np.uint64(32))).astype(np.uint32)
+        pair_counts = np.maximum(np.diff(offsets) - 1, 0)
+
+        rows = signatures[block_start:block_start + len(offsets) - 1]
+        for features, counts in ((words, np.diff(offsets)), (pairs, pair_counts)):
+            present = np.flatnonzero(counts)
+            if not len(present):
+                continue
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[present]
+            # One permutation per signature row, laid out row-major so the per-text minimum
+            # runs over contiguous memory
+            hashed = _PERM_A[:, None] * features + _PERM_B[:, None]
+            rows[present] = np.minimum(rows[present], np.minimum.reduceat(hashed, starts, axis=1).T)
+    return signatures
+
+
+def _band_keys(signatures):
+    # One uint64 key per band, mixing the band's rows
+    rows = signatures.reshape(len(signatures), BANDS, ROWS).astype(np.uint64)
+    return (rows * _BAND_MULTIPLIERS).sum(axis=2, dtype=np.uint64)
+
+
+def similarity(a, b):
+    """
+    Estimated Jaccard similarity between signatures (row-wise for 2-D inputs).
+    """
+    return (a == b).mean(axis=-1)
+
+
+def duplicate_groups(signatures, threshold=None):
+    """
+    Cluster signatures whose estimated similarity is at least `threshold`.
+
+    Returns:
+        numpy.ndarray: For every item, the index of the first item of its cluster.
+    """
+    threshold = DEDUPE_THRESHOLD if threshold is None else threshold
+    count = len(signatures)
+    keys = _band_keys(signatures)
+
+    candidates = []
+    for band in range(BANDS):
+        order = np.argsort(keys[:, band], kind="stable")
+        same = keys[order[1:], band] == keys[order[:-1], band]
+        # Within a bucket pair every member with its neighbour and with the first member
+        run_start = np.maximum.accumulate(np.where(np.concatenate([[True], ~same]), np.arange(count), 0))
+        members = np.flatnonzero(same) + 1
+        candidates.append(np.stack([order[members - 1], order[members]], axis=1))
+        candidates.append(np.stack([order[run_start[members]], order[members]], axis=1))
+    pairs = np.concatenate(candidates)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    # Drop repeated pairs (found in several bands) before comparing signatures
+    codes = np.unique(np.minimum(pairs[:, 0], pairs[:, 1]) * count + np.maximum(pairs[:, 0], pairs[:, 1]))
+    pairs = np.stack([codes // count, codes % count], axis=1)
+    pairs = pairs[similarity(signatures[pairs[:, 0]], signatures[pairs[:, 1]]) >= threshold]
+
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs.tolist():
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            # The earlier item becomes the representative
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    return np.array([find(i) for i in range(count)])
+
+
+def dedupe(items, text_of, provenance_of=None, threshold=None):
+    """
+    Drop near-duplicate items, keeping the first occurrence.
+
+    Args:
+        items (list): Items to deduplicate (e.g. slide or flashcard dicts).
+        text_of (callable): Text used to compare an item.
+        provenance_of (callable): Where an item came from (e.g. its pages or file). The kept item
+            lists the provenance of everything merged into it under "duplicate_sources".
+        threshold (float): Minimum estimated Jaccard similarity; defaults to DEDUPE_THRESHOLD.
+
+    Returns:
+        list: The kept items, in their original order.
+    """
+    if len(items) < 2:
+        return list(items)
+    groups = duplicate_groups(minhash([text_of(item) for item in items]), threshold)
+
+    kept = []
+    for index, item in enumerate(items):
+        representative = groups[index]
+        if representative == index:
+            kept.append(item)
+        elif provenance_of is not None and isinstance(items[representative], dict):
+            items[representative].setdefault("duplicate_sources", []).append(provenance_of(item))
+    if len(kept) < len(items):
+        print(f"Removed {len(items) - len(kept)} near-duplicate(s) of {len(items)} items")
+    return kept
+
+
+class MinHashIndex:
+    """
+    Incremental near-duplicate check for streams, where items can't be collected up front.
+    Holds one signature per distinct item.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = DEDUPE_THRESHOLD if threshold is None else threshold
+        self.buckets = [{} for _ in range(BANDS)]
+        self.signatures = []
+
+    def add(self, text):
+        """
+        Add a text. Returns the id of an earlier near-duplicate, or None if the text is new.
+        """
+        signature = minhash([text])
+        keys = _band_keys(signature)[0].tolist()
+        candidates = sorted({item_id for bucket, key in zip(self.buckets, keys) for item_id in bucket.get(key, ())})
+        if candidates:
+            scores = similarity(np.stack([self.signatures[item_id] for item_id in candidates]), signature[0])
+            for item_id, score in zip(candidates, scores):
+                if score >= self.threshold:
+                    return item_id
+
+        item_id = len(self.signatures)
+        self.signatures.append(signature[0])
+        for bucket, key in zip(self.buckets, keys):
+            bucket.setdefault(key, []).append(item_id)
+        return None
+
+
+def slide_text(slide):
+    return f"{slide.get('title', '')} {slide.get('content', '')}" if isinstance(slide, dict) else str(slide)
+
+
+def flashcard_text(card):
+    return f"{card.get('question', '')} {card.get('answer', '')}" if isinstance(card, dict) else str(card)
@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import hashlib
+import datetime
+
+import dotenv
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+from .chunker import count_tokens, leading_text
+from .batch import process_concurrently
+from .dedupe import dedupe, flashcard_text
+from . import llm
+
+dotenv.load_dotenv()
+
+# Page-level incremental flashcards for uploaded documents (/flashcards).
+#
+# Cards are generated per page and stored in `flashcard_pages` under the document key and a
+# hash of the page text. When a revised version of the document is uploaded, only pages whose
+# hash is new are sent to the LLM; cards of unchanged pages (even if they moved) are reused,
+# and pages that are no longer in the document are retired. The work per upload grows with
+# the number of changed pages, not with the size of the document.
+
+FLASHCARD_CARDS_PER_PAGE = int(os.getenv("FLASHCARD_CARDS_PER_PAGE", "3"))
+FLASHCARD_PAGE_WORKERS = int(os.getenv("FLASHCARD_PAGE_WORKERS", "8"))
+FLASHCARD_MIN_PAGE_TOKENS = 40  # blank or near-blank pages get no cards
+FLASHCARD_PAGE_MAX_TOKENS = 2000
+# Bump when page_messages changes, so cards from the old prompt are regenerated
+FLASHCARD_PAGE_PROMPT_VERSION = 1
+
+client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+db = client['RGIT_DB']
+pages_collection = db['flashcard_pages']
+
+_indexes_ready = False
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    pages_collection.create_index([("document_key", ASCENDING), ("page_hash", ASCENDING)])
+    _indexes_ready = True
+
+
+def page_hash(text):
+    """
+    Hash of a page's text, ignoring whitespace differences from PDF extraction.
+    """
+    normalized = re.sub(r"\s+", " ", text or "").strip()
+    raw = json.dumps([FLASHCARD_PAGE_PROMPT_VERSION, FLASHCARD_CARDS_PER_PAGE, normalized])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def page_messages(text, count):
+    prompt = f"""
+    Create {count} flashcards from this page of a document. Return ONLY a JSON array of flashcards.
+    Content: {text}
+
+    Format each flashcard as:
+    {{
+        "question": "Clear concise question",
+        "answer": "Clear concise answer",
+        "topic": "Topic of this flashcard"
+    }}
+    """
+    return [
+        {"role": "system", "content": "You are a flashcard generator. Always respond with valid JSON arrays containing flashcards."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def parse_flashcards(content):
+    if not content:
+        raise ValueError("Empty response from OpenAI")
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        content = content.split("```")[1]
+    cards = json.loads(content.strip())
+    if isinstance(cards, dict):
+        cards = cards.get("flashcards", [])
+    if not isinstance(cards, list):
+        raise ValueError("Response is not a list")
+    return [{field: card[field] for field in ("question", "answer", "topic")}
+            for card in cards if isinstance(card, dict) and card.get("question") and card.get("answer") and "topic" in card]
+
+
+def generate_page_cards(text, site="flashcards_page"):
+    if count_tokens(text) < FLASHCARD_MIN_PAGE_TOKENS:
+        return []
+    content = llm.chat(
+        site=site,
+        task="flashcards",
+        expected_output_tokens=FLASHCARD_CARDS_PER_PAGE * 80,
+        messages=page_messages(leading_text(text, FLASHCARD_PAGE_MAX_TOKENS), FLASHCARD_CARDS_PER_PAGE),
+        temperature=0.7
+    )
+    return parse_flashcards(content)
+
+
+def _stored_pages(document_key, hashes):
+    """
+    Saved pages among the given hashes, and the live pages of the document that are not among
+    them (to be retired).
+    """
+    try:
+        _ensure_indexes()
+        stored = {document["page_hash"]: document for document in pages_collection.find(
+            {"document_key": document_key, "page_hash": {"$in": hashes}}, {"page_hash": 1, "cards": 1, "retired_at": 1})}
+        removed = list(pages_collection.find(
+            {"document_key": document_key, "page_hash": {"$nin": hashes}, "retired_at": None}, {"page_hash": 1, "cards": 1}))
+        return stored, removed
+    except PyMongoError as e:
+        print(f"Flashcard page store unavailable, generating every page: {str(e)}")
+        return {}, []
+
+
+def _save_pages(document_key, generated, revived, retired):
+    now = datetime.datetime.utcnow()
+    operations = [UpdateOne(
+        {"_id": f"{document_key}:{hash_}"},
+        {"$set": {"document_key": document_key, "page_hash": hash_, "cards": cards, "updated_at": now},
+         "$unset": {"retired_at": ""}},
+        upsert=True
+    ) for hash_, cards in generated.items()]
+    operations += [UpdateOne({"_id": f"{document_key}:{hash_}"}, {"$unset": {"retired_at": ""}}) for hash_ in revived]
+    operations += [UpdateOne({"_id": f"{document_key}:{hash_}"}, {"$set": {"retired_at": now}}) for hash_ in retired]
+    if not operations:
+        return
+    try:
+        pages_collection.bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        print(f"Could not save flashcard pages of {document_key}: {str(e)}")
+
+
+def generate_document_flashcards(document_key, pages, max_workers=FLASHCARD_PAGE_WORKERS):
+    """
+    Flashcards for every page of a document, generating only pages that changed since the
+    document was last processed under the same key.
+
+    Args:
+        document_key (str): Identifies the document across revisions (e.g. user and file name).
+        pages (list): Page texts of the current revision.
+        max_workers (int): Pages generated at the same time.
+
+    Returns:
+        tuple: (cards, stats). Cards are in page order, each with its 1-based "page". Stats
+            count generated, reused, failed and retired pages and list "retired_cards" - the
+            cards of retired pages that no current page still has.
+    """
+    hashes = [page_hash(page) for page in pages]
+    distinct = list(dict.fromkeys(hashes))
+    stored, removed = _stored_pages(document_key, distinct)
+    reusable = {hash_: document["cards"] for hash_, document in stored.items()}
+
+    texts = dict(zip(hashes, pages))
+    missing = [hash_ for hash_ in distinct if hash_ not in reusable]
+    generated = {}
+    failed = 0
+    for outcome in process_concurrently(missing, lambda hash_: generate_page_cards(texts[hash_]), max_workers=max_workers):
+        if outcome["status"] == "ok":
+            generated[missing[outcome["index"]]] = outcome["result"]
+        else:
+            # Not saved, so the page is generated again on the next upload
+            failed += 1
+            print(f"Flashcards for page {hashes.index(missing[outcome['index']]) + 1} failed: {outcome['error']}")
+    # Unchanged pages need no write; pages back from an earlier revision are un-retired
+    revived = [hash_ for hash_, document in stored.items() if document.get("retired_at")]
+    _save_pages(document_key, generated, revived, [document["page_hash"] for document in removed])
+
+    cards_by_hash = {**reusable, **generated}
+    cards = []
+    seen_pages = set()
+    for number, hash_ in enumerate(hashes, start=1):
+        if hash_ in seen_pages:
+            continue  # repeated page (e.g. a reprinted handout)
+        seen_pages.add(hash_)
+        cards.extend({**card, "page": number} for card in cards_by_hash.get(hash_, []))
+    cards = dedupe(cards, flashcard_text, lambda card: {"page": card.get("page")})
+
+    current = {flashcard_text(card) for card in cards}
+    retired_cards = [card for document in removed for card in document.get("cards") or []
+                     if flashcard_text(card) not in current]
+    stats = {
+        "pages": len(pages),
+        "generated_pages": len(generated),
+        "reused_pages": len(reusable),
+        "failed_pages": failed,
+        "retired_pages": len(removed),
+        "retired_cards": retired_cards,
+    }
+    print(f"Flashcards for {document_key}: {len(generated)} page(s) generated, {len(reusable)} reused, {len(removed)} retired")
+    return cards, stats
@@ -0,0 +1,190 @@
+import os
+import json
+import math
+from collections import defaultdict
+
+from .chunker import chunk_document, count_tokens
+from .batch import process_concurrently
+from .dedupe import dedupe
+from .seen_questions import unseen
+from . import llm
+
+# Map-reduce quiz generation over a whole document (/upload_pdf).
+# Map: the document is split into at most QUIZ_MAP_SECTIONS sections and candidate questions are
+# generated for every section concurrently. Reduce: invalid candidates and near-duplicates are
+# dropped and the final quiz is picked round-robin over sections, alternating difficulties.
+# All map calls run at once, so the latency stays close to one (shorter) call.
+
+QUIZ_MAP_SECTIONS = int(os.getenv("QUIZ_MAP_SECTIONS", "8"))
+QUIZ_MAP_WORKERS = int(os.getenv("QUIZ_MAP_WORKERS", "8"))
+QUIZ_SECTION_MIN_TOKENS = 400
+QUIZ_SECTION_MAX_TOKENS = 3000  # larger documents are sampled evenly instead
+CANDIDATE_FACTOR = 2  # candidates generated per final question
+
+DIFFICULTIES = ("easy", "medium", "hard")
+
+
+def plan_sections(pages, max_sections=QUIZ_MAP_SECTIONS):
+    """
+    Split a document into at most `max_sections` chunks spread over the whole document.
+    """
+    total_tokens = sum(count_tokens(page or "") for page in pages)
+    section_tokens = min(max(math.ceil(total_tokens / max_sections), QUIZ_SECTION_MIN_TOKENS), QUIZ_SECTION_MAX_TOKENS)
+    chunks = chunk_document(pages, max_tokens=section_tokens)
+    if len(chunks) > max_sections:
+        # Evenly spaced sections still cover the beginning, middle and end of the document
+        step = len(chunks) / max_sections
+        chunks = [chunks[int(i * step)] for i in range(max_sections)]
+    return chunks
+
+
+def section_messages(text, count):
+    prompt = f"""
+    Create {count} multiple choice questions based on the following section of a document.
+    Use a mix of difficulties (easy, medium, hard) and cover different points of the section.
+
+    Text: {text}
+
+    Format each question as a JSON object with the following structure:
+    {{
+        "question": "question text",
+        "options": ["A", "B", "C", "D"],
+        "answer": "correct option",
+        "subject": "subject area",
+        "chapter": "chapter/topic",
+        "difficulty": "easy",
+        "marks": 1
+    }}
+
+    Return an array of {count} such question objects.
+    """
+    return [
+        {"role": "system", "content": "You are a quiz generator that creates multiple choice questions based on provided text."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def parse_questions(content):
+    if not content:
+        raise ValueError("Empty response from OpenAI")
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        content = content.split("```")[1]
+    questions = json.loads(content.strip())
+    if isinstance(questions, dict):
+        questions = questions.get("questions", [])
+    if not isinstance(questions, list):
+        raise ValueError("Invalid response structure")
+    return questions
+
+
+def is_candidate(question):
+    return (isinstance(question, dict)
+            and all(question.get(field) for field in ("question", "options", "answer"))
+            and isinstance(question["options"], list) and len(question["options"]) == 4
+            and question["answer"] in question["options"])
+
+
+def generate_section_questions(section, count, total, site="upload_pdf_quiz_map"):
+    content = llm.chat(
+        site=site,
+        task="quiz",
+        detail={"section": section["index"] + 1, "sections": total, "pages": [section["page_start"], section["page_end"]]},
+        expected_output_tokens=count * 150,
+        messages=section_messages(section["text"], count),
+        temperature=0.7
+    )
+    questions = []
+    for question in parse_questions(content):
+        if not is_candidate(question):
+            continue
+        question["difficulty"] = str(question.get("difficulty") or "medium").lower()
+        question.setdefault("subject", "General")
+        question.setdefault("chapter", "General")
+        question.setdefault("marks", 1)
+        question["pages"] = [section["page_start"], section["page_end"]]
+        questions.append(question)
+    return questions
+
+
+def select_questions(candidates_by_section, num_questions):
+    """
+    Reduce step: pick `num_questions` candidates, taking sections in turn and, within a
+    section, the difficulty the quiz has least of so far. With fewer questions than sections,
+    the first round visits evenly spaced sections so the quiz still spans the document.
+    """
+    count = len(candidates_by_section)
+    first_round = sorted({int(i * count / num_questions) for i in range(min(num_questions, count))})
+    order = first_round + [index for index in range(count) if index not in first_round]
+
+    pools = []
+    for index in order:
+        by_difficulty = defaultdict(list)
+        for question in candidates_by_section[index]:
+            by_difficulty[question["difficulty"]].append(question)
+        pools.append((index, by_difficulty))
+
+    selected = []
+    difficulty_counts = defaultdict(int)
+    while len(selected) < num_questions and any(any(pool.values()) for _, pool in pools):
+        for index, pool in pools:
+            if len(selected) >= num_questions:
+                break
+            available = [difficulty for difficulty, questions in pool.items() if questions]
+            if not available:
+                continue
+            difficulty = min(available, key=lambda d: (difficulty_counts[d], DIFFICULTIES.index(d) if d in DIFFICULTIES else len(DIFFICULTIES)))
+            selected.append((index, pool[difficulty].pop(0)))
+            difficulty_counts[difficulty] += 1
+
+    # Number the quiz in document order
+    selected = [question for _, question in sorted(selected, key=lambda pair: pair[0])]
+    for number, question in enumerate(selected, start=1):
+        question["question_number"] = number
+    return selected
+
+
+def generate_document_quiz(pages, num_questions=5, max_sections=QUIZ_MAP_SECTIONS, max_workers=QUIZ_MAP_WORKERS, user_id=None):
+    """
+    Generate a quiz covering the whole document.
+
+    Args:
+        pages (list): Page texts of the document.
+        num_questions (int): Questions in the final quiz.
+        max_sections (int): Upper bound on sections (and so on LLM calls).
+        max_workers (int): Sections generated at the same time.
+        user_id (str): Skip candidates this user has already been given, as long as enough remain.
+
+    Returns:
+        list: The questions, each with the "pages" of its section.
+    """
+    sections = plan_sections(pages, max_sections)
+    if not sections:
+        return []
+    per_section = max(2, math.ceil(num_questions * CANDIDATE_FACTOR / len(sections)))
+
+    candidates_by_section = [[] for _ in sections]
+    failed = 0
+    worker = lambda section: generate_section_questions(section, per_section, len(sections))
+    for outcome in process_concurrently(sections, worker, max_workers=max_workers):
+        if outcome["status"] == "ok":
+            candidates_by_section[outcome["index"]] = outcome["result"]
+        else:
+            failed += 1
+            print(f"Quiz section {outcome['index'] + 1}/{len(sections)} failed: {outcome['error']}")
+    if failed == len(sections):
+        raise ValueError("Failed to generate questions for any section of the document")
+
+    # Near-duplicates across sections (overlapping text, repeated definitions)
+    candidates = [question for section in candidates_by_section for question in section]
+    kept = dedupe(candidates, lambda q: f"{q['question']} {q['answer']}")
+    fresh = unseen(user_id, kept)
+    if len(fresh) >= num_questions:
+        kept = fresh
+    kept = {id(question) for question in kept}
+    candidates_by_section = [[question for question in section if id(question) in kept] for section in candidates_by_section]
+
+    questions = select_questions(candidates_by_section, num_questions)
+    print(f"Selected {len(questions)} of {len(candidates)} candidate question(s) from {len(sections)} section(s)")
+    return questions
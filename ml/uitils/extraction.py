@@ -1,23 +1,22 @@
 import os
+import mimetypes
 
-import openai
 import spacy
 from spacy.lang.en.stop_words import STOP_WORDS
 
 
 from PyPDF2 import PdfReader
 
-from langchain_openai import OpenAIEmbeddings
 import json
-import requests
 import base64
 import dotenv
 from pymongo import MongoClient
 
 from io import BufferedReader
 
+from . import llm
+
 dotenv.load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
 
 mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 client = MongoClient(mongo_uri)
@@ -34,11 +33,10 @@ LOCAL_METADATA_DIR = "./metadata"
 os.makedirs(LOCAL_FILES_DIR, exist_ok=True)
 os.makedirs(LOCAL_METADATA_DIR, exist_ok=True)
 
-# Load environment variables (e.g., OpenAI API key)
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-def generate_openai(prompt,max_tokens=2000,temperature=0.3,model='gpt-4o-mini',json_parse=False):
-    response = openai.chat.completions.create(
+def generate_openai(prompt,max_tokens=2000,temperature=0.3,model=None,json_parse=False,site="extraction.generate_openai",task="extract"):
+    content = llm.chat(
+        site=site,
+        task=task,
         model=model,
         messages=[
             {"role": "system", "content": prompt}
@@ -47,14 +45,12 @@ def generate_openai(prompt,max_tokens=2000,temperature=0.3,model='gpt-4o-mini',j
         temperature=temperature,
     )
     if json_parse:
-        if response.choices[0].message.content is None:
+        if not content:
             return {}
-        result = response.choices[0].message.content.replace("```json","").replace("```","")
+        result = content.replace("```json","").replace("```","")
         result = json.loads(result)
     else:
-        if response.choices[0].message.content is None:
-            return ""
-        result = response.choices[0].message.content
+        result = content
     return result
 
 def encode_image(image_file: BufferedReader) -> str:
@@ -68,45 +64,30 @@ def get_description_from_image(file: BufferedReader) -> str:
     """
     # Encode the image to base64
     base64_image = encode_image(file)
-
-    # Prepare headers for the API request
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {openai.api_key}"
-    }
-
-    # Prepare the payload with image encoded in base64
-    payload = {
-        "model": "gpt-4o-mini",  # Replace with the model you're using (this is a placeholder)
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "If the image is OCR text, for eg, it's a picture of notes or something. Then only return the text. Otherwise, return a description of the image."
-                    },
-
-                ],
-                "data": {
-                    "image": base64_image
+    image_type, _ = mimetypes.guess_type(getattr(file, "name", ""))
+
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": "If the image is OCR text, for eg, it's a picture of notes or something. Then only return the text. Otherwise, return a description of the image."
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:{image_type or 'image/jpeg'};base64,{base64_image}"}
                 }
-            }
-        ],
-        "max_tokens": 1000
-    }
-
-    # Send a POST request to OpenAI API
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
+            ]
+        }
+    ]
 
-    # Check the response status and handle any errors
-    if response.status_code == 200:
-        result = response.json()
-        # Extract and return the description
-        return result.get("choices", [{}])[0].get("message", {}).get("content", "No description found")
-    else:
+    try:
+        description = llm.chat(messages, model="gpt-4o-mini", max_tokens=1000, site="get_description_from_image")
+        return description or "No description found"
+    except Exception as e:
         # If the request fails, print the error message
-        print(f"Error: {response.status_code} - {response.text}")
+        print(f"Error: {str(e)}")
         return "Error fetching description"
 
 def extract_text_from_file(file, content_type):
@@ -123,31 +104,44 @@ def extract_text_from_file(file, content_type):
         print(f"Error extracting text: {str(e)}")
         return None
 
+def extract_pages_from_file(file, content_type):
+    """
+    Extract the text of each page separately, so chunks can refer back to their pages.
+
+    Returns:
+        list: Text of each page, or None if the file could not be read or its type is not supported.
+    """
+    if content_type != 'application/pdf':
+        return None
+    try:
+        reader = PdfReader(file)
+        return [page.extract_text() or "" for page in reader.pages]
+    except Exception as e:
+        print(f"Error extracting pages: {str(e)}")
+        return None
+
 def extract_doctype_from_file(extracted_text):
     """
     Use AI to infer the document type (e.g., study material, announcement, test).
     """
     prompt = f"Classify the following text into document type such as study material, announcement, test or Experiment:\n\n{extracted_text[:1000]}. Return either STUDY_MATERIAL, ANNOUNCEMENT or EXPERIMENT in a single word as this will be used for parsing. Study materials are documentations such as notes from where student can learn. Announcement is a type of document which are changes in the institutions information. for eg change in syllabus, new upcoming tests etc. So if an institution document is given which shows the syllabus of a subject or changes in timetable or schedule, it should be considered as an ANNOUNCEMENT"
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
+    classification = llm.chat(
+        site="extract_doctype_from_file",
+        task="classify",
         messages=[
             {"role": "system", "content": prompt}
         ],
         max_tokens=500,
         temperature=0.3,
+        cache=True,
     )
-    classification = response.choices[0].message.content
     return classification
 
 def extract_embeddings_from_file(extracted_text):
     """
     Generate text embeddings using OpenAI's embeddings model.
     """
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-large",
-    )
-    # embeddings.embed_query(extracted_text)
-    return embeddings.embed_query(extracted_text)
+    return llm.embed_query(extracted_text, model="text-embedding-3-large", site="extract_embeddings_from_file")
 
 def extract_keywords_from_file(extracted_text):
     """
@@ -167,17 +161,18 @@ def extract_chapter_name_subject(extracted_text,user_id):
 
     syllabus = json.dumps(user_profile['syllabus'])
     prompt = f"Extract the subject and chapter name from this study material text:\n\n{extracted_text[:1000]}. Return it in a json format with keys subject and chapter. The syllabus for the user is {syllabus}"
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
+    result = llm.chat(
+        site="extract_chapter_name_subject",
+        task="extract",
         messages=[
             {"role": "system", "content": prompt}
         ],
         max_tokens=1000,
         temperature=0.3,
+        cache=True,
     )
 
-    result = response.choices[0].message.content
-    if result is None:
+    if not result:
         return {"subject": "", "chapter": ""}
 
     print(result)
@@ -199,17 +194,18 @@ def extract_syllabus_or_date_changes(extracted_text,user_id):
         return {}
 
     prompt = f"Extract any syllabus changes or date changes from this announcement text in json format:\n\n{extracted_text[:1000]}. The user profile for the user is {user_profile} "
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
+    content = llm.chat(
+        site="extract_syllabus_or_date_changes",
+        task="extract",
         messages=[
             {"role": "system", "content": prompt}
         ],
         max_tokens=5000,
         temperature=0.3,
     )
-    if response.choices[0].message.content is None:
+    if not content:
         return {}
-    result = response.choices[0].message.content.replace("```json","").replace("```","")
+    result = content.replace("```json","").replace("```","")
     print(result)
     try:
         return json.loads(result)
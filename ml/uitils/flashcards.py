@@ -1,15 +1,26 @@
 import os
 from pathlib import Path
 import PyPDF2
-import google.generativeai as genai
 import json
-import time
+import asyncio
 import dotenv
 
+from . import llm
+from .jsonstream import iter_json_items
+from .chunker import leading_text
+from .dedupe import MinHashIndex, flashcard_text
+
+# Tokens of the document used as flashcard context (roughly the old 3000-character cut)
+FLASHCARD_CONTEXT_TOKENS = int(os.getenv("FLASHCARD_CONTEXT_TOKENS", "750"))
+# PDFs processed at the same time by process_pdfs. Gemini calls have no requests-per-minute
+# cap unless GEMINI_RPM is set, so pacing only happens when the API actually throttles: a 429
+# is retried with backoff (honouring Retry-After)
+FLASHCARD_MAX_CONCURRENCY = int(os.getenv("FLASHCARD_MAX_CONCURRENCY", "4"))
+
 class SimpleFlashcardGenerator:
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    def __init__(self, api_key: str, model_name: str = 'gemini-2.0-flash-exp'):
+        llm.configure_gemini(api_key)
+        self.model_name = model_name
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         try:
@@ -23,10 +34,10 @@ class SimpleFlashcardGenerator:
             print(f"Error reading PDF {pdf_path}: {e}")
             return ""
 
-    def generate_flashcards(self, content: str, source: str) -> list:
-            prompt = f"""
+    def flashcards_prompt(self, content: str, source: str) -> str:
+            return f"""
             Create educational flashcards from this content.
-            Content: {content[:3000]}
+            Content: {leading_text(content, FLASHCARD_CONTEXT_TOKENS)}
 
             Create 10 flashcards with clear questions and concise answers.
 
@@ -43,56 +54,109 @@ class SimpleFlashcardGenerator:
             Generate similar flashcards for the main concepts in the content.
             """
 
-            response = None
+    def generate_flashcards(self, content: str, source: str) -> list:
+            prompt = self.flashcards_prompt(content, source)
+            response_text = None
             try:
-                response = self.model.generate_content(prompt)
+                response_text = llm.generate_gemini(prompt, model=self.model_name, site="SimpleFlashcardGenerator.generate_flashcards")
                 # Clean the response text
-                clean_text = response.text.strip()
+                clean_text = response_text.strip()
                 if clean_text.startswith('```json'):
                     clean_text = clean_text.replace('```json', '').replace('```', '')
                 flashcards = json.loads(clean_text)
                 return flashcards
             except Exception as e:
                 print(f"Error generating flashcards for {source}: {e}")
-                print(f"Raw response: {response.text if response else 'No response'}")
+                print(f"Raw response: {response_text if response_text else 'No response'}")
                 return []
 
-    def process_pdfs(self, folder_path: str) -> dict:
-        pdf_folder = Path(folder_path)
-        all_flashcards = []
-        processed_files = []
+    def iter_flashcards(self, content: str, source: str):
+            """
+            Streaming variant of `generate_flashcards`: yields each flashcard as soon as Gemini has
+            finished writing it, so callers can forward cards before the whole response is done.
+            """
+            pieces = llm.generate_gemini_stream(
+                self.flashcards_prompt(content, source),
+                model=self.model_name,
+                site="SimpleFlashcardGenerator.iter_flashcards"
+            )
+            try:
+                yield from iter_json_items(pieces)
+            except Exception as e:
+                print(f"Error streaming flashcards for {source}: {e}")
 
-        # Process each PDF in the folder
-        for pdf_file in pdf_folder.glob('*.pdf'):
+    async def _process_pdf(self, pdf_file: Path, semaphore: asyncio.Semaphore):
+        async with semaphore:
             print(f"\nProcessing: {pdf_file.name}")
-
-            # Extract text from PDF
-            content = self.extract_text_from_pdf(str(pdf_file))
+            content = await asyncio.to_thread(self.extract_text_from_pdf, str(pdf_file))
             if not content:
-                continue
+                return pdf_file, []
+            cards = await asyncio.to_thread(self.generate_flashcards, content, pdf_file.name)
+            return pdf_file, cards
+
+    async def aprocess_pdfs(self, folder_path: str, output_path: str = None, max_concurrency: int = FLASHCARD_MAX_CONCURRENCY) -> dict:
+        """
+        Generate flashcards for every PDF in a folder, up to `max_concurrency` files at a time.
+
+        Args:
+            folder_path (str): Folder with the PDFs.
+            output_path (str): JSON file the flashcards are written to. Each file's cards are
+                appended as soon as that file is done; the summary is written last.
+            max_concurrency (int): PDFs extracted and sent to Gemini at the same time.
+
+        Returns:
+            dict: "summary" and "flashcards", as written to `output_path`.
+        """
+        pdf_files = sorted(Path(folder_path).glob('*.pdf'))
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        all_flashcards = []
+        processed_files = []
+        generated = 0
+        # Near-identical cards from overlapping files: the first file to finish keeps the card
+        index = MinHashIndex()
 
-            # Generate flashcards
-            cards = self.generate_flashcards(content, pdf_file.name)
-            if cards:
-                all_flashcards.extend(cards)
+        output = open(output_path, "w") if output_path else None
+        try:
+            if output:
+                output.write('{\n  "flashcards": [')
+            for task in asyncio.as_completed([self._process_pdf(pdf_file, semaphore) for pdf_file in pdf_files]):
+                pdf_file, cards = await task
+                if not cards:
+                    continue
+                generated += len(cards)
+                kept = [card for card in cards if index.add(flashcard_text(card)) is None]
                 processed_files.append(pdf_file.name)
-                print(f"Generated {len(cards)} flashcards from {pdf_file.name}")
-
-            # Add delay between files
-            time.sleep(2)
-
-        # Prepare output
-        result = {
-            "summary": {
-                "total_files": len(processed_files),
-                "total_flashcards": len(all_flashcards),
-                "processed_files": processed_files
-            },
-            "flashcards": all_flashcards
-        }
+                print(f"Generated {len(cards)} flashcards from {pdf_file.name} ({len(cards) - len(kept)} duplicate(s))")
+
+                if output and kept:
+                    separator = ",\n    " if all_flashcards else "\n    "
+                    output.write(separator + ",\n    ".join(json.dumps(card) for card in kept))
+                    output.flush()
+                all_flashcards.extend(kept)
+
+            result = {
+                "summary": {
+                    "total_files": len(processed_files),
+                    "total_flashcards": len(all_flashcards),
+                    "duplicates_removed": generated - len(all_flashcards),
+                    "processed_files": processed_files
+                },
+                "flashcards": all_flashcards
+            }
+            if output:
+                output.write('\n  ],\n  "summary": ' + json.dumps(result["summary"], indent=2).replace("\n", "\n  ") + "\n}\n")
+        finally:
+            if output:
+                output.close()
 
         return result
 
+    def process_pdfs(self, folder_path: str, output_path: str = None, max_concurrency: int = FLASHCARD_MAX_CONCURRENCY) -> dict:
+        """
+        Blocking wrapper around `aprocess_pdfs`.
+        """
+        return asyncio.run(self.aprocess_pdfs(folder_path, output_path, max_concurrency))
+
 def main():
     # Configuration
     dotenv.load_dotenv()
@@ -105,13 +169,9 @@ def main():
         # Initialize generator
         generator = SimpleFlashcardGenerator(API_KEY)
 
-        # Process PDFs and generate flashcards
+        # Process PDFs and generate flashcards, saving each file's cards as it completes
         print(f"Processing PDFs from: {PDF_FOLDER}")
-        result = generator.process_pdfs(PDF_FOLDER)
-
-        # Save results
-        with open("flashcards.json", "w") as f:
-            json.dump(result, f, indent=2)
+        result = generator.process_pdfs(PDF_FOLDER, output_path="flashcards.json")
 
         # Print summary
         print("\nProcessing complete!")
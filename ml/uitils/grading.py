@@ -0,0 +1,243 @@
+import os
+import datetime
+
+import numpy as np
+import dotenv
+from pymongo import MongoClient
+
+from .mastery import record_attempts
+
+dotenv.load_dotenv()
+
+# Bulk grading of many attempts at the same quiz (e.g. a whole-class exam).
+# The answer key is compiled once into arrays; every attempt becomes one row of an
+# (attempts x questions) matrix of chosen options, so marks and the subject/chapter breakdowns
+# are array reductions instead of per-question dict updates.
+
+client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+db = client['RGIT_DB']
+attempts_collection = db['quiz_attempts']
+
+UNANSWERED = -1
+UNKNOWN = -2  # an answer that is not one of the question's options
+
+
+def _one_hot(ids, size):
+    matrix = np.zeros((len(ids), size), dtype=np.float64)
+    matrix[np.arange(len(ids)), ids] = 1
+    return matrix
+
+
+class AnswerKey:
+    """
+    A quiz compiled for grading: option codes, correct codes, marks and group membership as arrays.
+    """
+
+    def __init__(self, questions):
+        self.questions = questions
+        self.numbers = [question.get("question_number", index + 1) for index, question in enumerate(questions)]
+        # Per question: answer text -> option code. The correct answer always has a code, even
+        # if the model left it out of the options.
+        self.option_codes = []
+        correct = []
+        for question in questions:
+            options = list(question.get("options") or [])
+            if question.get("answer") not in options:
+                options.append(question.get("answer"))
+            self.option_codes.append({str(option): code for code, option in enumerate(options)})
+            correct.append(self.option_codes[-1][str(question.get("answer"))])
+        self.correct = np.array(correct, dtype=np.int16)
+        self.marks = np.array([question.get("marks", 1) or 0 for question in questions], dtype=np.float64)
+
+        self.subjects, subject_ids = np.unique([str(question.get("subject")) for question in questions], return_inverse=True)
+        self.chapters, chapter_ids = np.unique([str(question.get("chapter")) for question in questions], return_inverse=True)
+        self.subject_matrix = _one_hot(subject_ids, len(self.subjects))
+        self.chapter_matrix = _one_hot(chapter_ids, len(self.chapters))
+
+    def encode(self, attempts):
+        """
+        Chosen option codes of every attempt.
+
+        Returns:
+            numpy.ndarray: (len(attempts), len(questions)) int16, UNANSWERED or UNKNOWN where
+                there is no valid choice.
+        """
+        keys = [(str(number), number, codes) for number, codes in zip(self.numbers, self.option_codes)]
+        rows = []
+        for attempt in attempts:
+            answers = attempt.get("user_answers") or {}
+            row = []
+            for text_key, number, codes in keys:
+                answer = answers.get(text_key, answers.get(number))
+                row.append(UNANSWERED if answer is None else codes.get(str(answer), UNKNOWN))
+            rows.append(row)
+        return np.array(rows, dtype=np.int16).reshape(len(attempts), len(self.questions))
+
+
+def compile_answer_key(quiz_response):
+    """
+    Compile a quiz (`{"response": {"questions": [...]}}` or a bare question list) for grading.
+    """
+    questions = quiz_response.get('response', {}).get('questions', []) if isinstance(quiz_response, dict) else quiz_response
+    return AnswerKey(questions or [])
+
+
+def _percentage(obtained, total):
+    return np.divide(obtained * 100, total, out=np.zeros_like(obtained, dtype=np.float64), where=total > 0)
+
+
+def _breakdown(names, total_questions, correct, total_marks, obtained, percentage):
+    # Plain lists in, so building the dicts doesn't go through numpy scalars
+    return {
+        name: {
+            "total_questions": total_questions[i],
+            "correct_answers": correct[i],
+            "total_marks": total_marks[i],
+            "obtained_marks": obtained[i],
+            "percentage": percentage[i],
+        }
+        for i, name in enumerate(names)
+    }
+
+
+def recommendations(subject_analysis, chapter_analysis, overall_percentage):
+    # Same rules as evaluate_and_analyze_quiz in uitils/quiz.py
+    advice = []
+    for chapter, data in chapter_analysis.items():
+        if data["percentage"] < 50:
+            advice.append(f"Focus more on the chapter '{chapter}', as your accuracy is below 50%.")
+    for subject, data in subject_analysis.items():
+        if data["percentage"] < 60:
+            advice.append(f"Spend more time studying '{subject}' to improve overall understanding.")
+
+    if overall_percentage < 50:
+        advice.append("Your overall performance is below average. Review your weaker areas and practice more.")
+    elif overall_percentage < 75:
+        advice.append("Good effort! However, there is room for improvement in some subjects and chapters.")
+    return advice
+
+
+def grade_attempts(key, attempts, include_details=True):
+    """
+    Grade many attempts at one quiz.
+
+    Args:
+        key (AnswerKey): The compiled quiz.
+        attempts (list): `{"user_id": ..., "user_answers": {question_number: answer}}` dicts.
+        include_details (bool): Add the per-question "details" list to every result.
+
+    Returns:
+        tuple: (results, summary) - one performance summary per attempt, in the same format as
+            evaluate_and_analyze_quiz, and class-level statistics.
+    """
+    if not attempts:
+        return [], {"attempts": 0}
+
+    chosen = key.encode(attempts)
+    is_correct = chosen == key.correct
+    obtained_per_question = is_correct * key.marks
+
+    # Grouped reductions: (attempts x questions) @ (questions x groups)
+    correct_counts = is_correct.sum(axis=1)
+    obtained = obtained_per_question.sum(axis=1)
+    total_marks = key.marks.sum()
+    overall = _percentage(obtained, np.full_like(obtained, total_marks))
+
+    subject_questions = key.subject_matrix.sum(axis=0)
+    subject_marks = key.marks @ key.subject_matrix
+    subject_correct = is_correct @ key.subject_matrix
+    subject_obtained = obtained_per_question @ key.subject_matrix
+    subject_percentage = _percentage(subject_obtained, np.broadcast_to(subject_marks, subject_obtained.shape))
+
+    chapter_questions = key.chapter_matrix.sum(axis=0)
+    chapter_marks = key.marks @ key.chapter_matrix
+    chapter_correct = is_correct @ key.chapter_matrix
+    chapter_obtained = obtained_per_question @ key.chapter_matrix
+    chapter_percentage = _percentage(chapter_obtained, np.broadcast_to(chapter_marks, chapter_obtained.shape))
+
+    subjects, chapters = key.subjects.tolist(), key.chapters.tolist()
+    subject_questions, chapter_questions = subject_questions.astype(int).tolist(), chapter_questions.astype(int).tolist()
+    subject_marks, chapter_marks = subject_marks.tolist(), chapter_marks.tolist()
+    subject_correct, chapter_correct = subject_correct.astype(int).tolist(), chapter_correct.astype(int).tolist()
+    subject_obtained, chapter_obtained = subject_obtained.tolist(), chapter_obtained.tolist()
+    subject_rows, chapter_rows = subject_percentage.tolist(), chapter_percentage.tolist()
+    if include_details:
+        static_details = [(number, question.get("question"), question.get("answer"), question.get("subject"),
+                           question.get("chapter"), marks)
+                          for number, question, marks in zip(key.numbers, key.questions, key.marks.tolist())]
+        correct_rows, obtained_rows = is_correct.tolist(), obtained_per_question.tolist()
+
+    timestamp = datetime.datetime.now()
+    total_questions = len(key.questions)
+    total_marks = float(total_marks)
+    results = []
+    for row, (attempt, correct_count, obtained_marks, percentage) in enumerate(
+            zip(attempts, correct_counts.tolist(), obtained.tolist(), overall.tolist())):
+        subject_analysis = _breakdown(subjects, subject_questions, subject_correct[row], subject_marks,
+                                      subject_obtained[row], subject_rows[row])
+        chapter_analysis = _breakdown(chapters, chapter_questions, chapter_correct[row], chapter_marks,
+                                      chapter_obtained[row], chapter_rows[row])
+        result = {
+            "user_id": attempt.get("user_id"),
+            "total_questions": total_questions,
+            "correct_answers": correct_count,
+            "total_marks": total_marks,
+            "obtained_marks": obtained_marks,
+            "overall_percentage": percentage,
+            "subject_analysis": subject_analysis,
+            "chapter_analysis": chapter_analysis,
+            "recommendations": recommendations(subject_analysis, chapter_analysis, percentage),
+            "timestamp": timestamp
+        }
+        if include_details:
+            answers = attempt.get("user_answers") or {}
+            result["details"] = [
+                {
+                    "question_number": number,
+                    "question": text,
+                    "user_answer": answers.get(str(number), answers.get(number)),
+                    "correct_answer": answer,
+                    "is_correct": correct,
+                    "subject": subject,
+                    "chapter": chapter,
+                    "marks": marks,
+                    "obtained_marks": question_obtained
+                }
+                for (number, text, answer, subject, chapter, marks), correct, question_obtained
+                in zip(static_details, correct_rows[row], obtained_rows[row])
+            ]
+        results.append(result)
+
+    summary = {
+        "attempts": len(attempts),
+        "total_marks": total_marks,
+        "mean_percentage": float(overall.mean()),
+        "median_percentage": float(np.median(overall)),
+        # Share of attempts answering each question correctly / leaving it blank
+        "question_accuracy": {str(number): float(value) for number, value in zip(key.numbers, is_correct.mean(axis=0))},
+        "question_unanswered": {str(number): float(value) for number, value in zip(key.numbers, (chosen == UNANSWERED).mean(axis=0))},
+        "subject_percentage": {str(name): float(value) for name, value in zip(key.subjects, subject_percentage.mean(axis=0))},
+        "chapter_percentage": {str(name): float(value) for name, value in zip(key.chapters, chapter_percentage.mean(axis=0))},
+    }
+    return results, summary
+
+
+def save_results(results, quiz_id=None):
+    """
+    Store graded attempts in `quiz_attempts` with one insert_many and add them to the
+    students' mastery counters.
+
+    Returns:
+        int: Number of attempts stored.
+    """
+    if not results:
+        return 0
+    # Copies, so the inserted _id doesn't end up in the caller's (JSON) results
+    documents = [dict(result, quiz_id=quiz_id) if quiz_id else dict(result) for result in results]
+    saved = len(attempts_collection.insert_many(documents, ordered=False).inserted_ids)
+    try:
+        record_attempts(results)
+    except Exception as e:
+        # The attempts are already stored; mastery can be rebuilt from quiz_attempts
+        print(f"Error updating mastery: {str(e)}")
+    return saved
@@ -0,0 +1,231 @@
+import os
+import time
+import argparse
+import datetime
+
+import numpy as np
+import dotenv
+from pymongo import MongoClient, ReplaceOne
+
+from .question_bank import question_fingerprint
+
+dotenv.load_dotenv()
+
+# Item response theory (two-parameter logistic model) for quiz questions.
+#
+# P(correct | student u, question i) = 1 / (1 + exp(-a_i * (theta_u - b_i)))
+#     theta_u  ability of the student
+#     b_i      difficulty of the question (on the same scale as theta)
+#     a_i      discrimination: how sharply the question separates weaker from stronger students
+#
+# Calibration is joint maximum a posteriori estimation over all responses in quiz_attempts,
+# with normal priors keeping parameters of rarely answered questions near their defaults.
+# Every iteration is a handful of passes over flat response arrays (np.bincount for the
+# per-student and per-question sums), followed by a diagonal Fisher scoring step, so the cost
+# grows linearly with the number of responses.
+# Questions are identified by their question bank fingerprint.
+
+IRT_ITERATIONS = int(os.getenv("IRT_ITERATIONS", "30"))
+THETA_PRIOR_SD = 1.0
+DIFFICULTY_PRIOR_SD = 1.5
+LOG_DISCRIMINATION_PRIOR_SD = 0.5
+MAX_STEP = 1.0  # largest change of a parameter in one iteration
+
+# Starting difficulty of a question that hasn't been calibrated yet, from its LLM label
+LABEL_DIFFICULTY = {"easy": -1.0, "medium": 0.0, "hard": 1.0}
+
+client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+db = client['RGIT_DB']
+attempts_collection = db['quiz_attempts']
+items_collection = db['irt_items']
+abilities_collection = db['irt_abilities']
+
+
+def _sigmoid(z):
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+def calibrate(users, items, correct, n_users=None, n_items=None, iterations=IRT_ITERATIONS, tolerance=1e-4):
+    """
+    Fit abilities and item parameters to a set of responses.
+
+    Args:
+        users (numpy.ndarray): Student index of every response.
+        items (numpy.ndarray): Question index of every response.
+        correct (numpy.ndarray): 1 for a correct response, 0 otherwise.
+        n_users, n_items (int): Number of students/questions (default: largest index + 1).
+        iterations (int): Maximum number of Fisher scoring iterations.
+        tolerance (float): Stop when no parameter moves more than this.
+
+    Returns:
+        tuple: (theta, a, b) arrays.
+    """
+    users = np.asarray(users, dtype=np.int64)
+    items = np.asarray(items, dtype=np.int64)
+    y = np.asarray(correct, dtype=np.float64)
+    n_users = n_users or int(users.max()) + 1
+    n_items = n_items or int(items.max()) + 1
+
+    theta = np.zeros(n_users)
+    b = np.zeros(n_items)
+    log_a = np.zeros(n_items)
+
+    for iteration in range(iterations):
+        a = np.exp(log_a)
+
+        # Abilities, with the item parameters held fixed
+        a_r = a[items]
+        p = _sigmoid(a_r * (theta[users] - b[items]))
+        info = a_r * a_r * p * (1 - p)
+        gradient = np.bincount(users, a_r * (y - p), n_users) - theta / THETA_PRIOR_SD ** 2
+        hessian = np.bincount(users, info, n_users) + 1 / THETA_PRIOR_SD ** 2
+        step_theta = np.clip(gradient / hessian, -MAX_STEP, MAX_STEP)
+        theta += step_theta
+        # Pin the scale: abilities are centred on 0
+        theta -= theta.mean()
+
+        # Difficulties and discriminations, with the new abilities
+        diff = theta[users] - b[items]
+        p = _sigmoid(a_r * diff)
+        residual = y - p
+        pq = p * (1 - p)
+
+        gradient_b = np.bincount(items, -a_r * residual, n_items) - b / DIFFICULTY_PRIOR_SD ** 2
+        hessian_b = np.bincount(items, a_r * a_r * pq, n_items) + 1 / DIFFICULTY_PRIOR_SD ** 2
+        step_b = np.clip(gradient_b / hessian_b, -MAX_STEP, MAX_STEP)
+
+        # d/d(log a) = a * d/da
+        gradient_a = np.bincount(items, a_r * diff * residual, n_items) - log_a / LOG_DISCRIMINATION_PRIOR_SD ** 2
+        hessian_a = np.bincount(items, (a_r * diff) ** 2 * pq, n_items) + 1 / LOG_DISCRIMINATION_PRIOR_SD ** 2
+        step_a = np.clip(gradient_a / hessian_a, -MAX_STEP, MAX_STEP)
+
+        b += step_b
+        log_a += step_a
+
+        largest = max(np.abs(step_theta).max(initial=0), np.abs(step_b).max(initial=0), np.abs(step_a).max(initial=0))
+        if largest < tolerance:
+            break
+
+    return theta, np.exp(log_a), b
+
+
+def item_information(theta, a, b):
+    """
+    Fisher information of questions (a, b) for a student of ability theta.
+    """
+    p = _sigmoid(a * (theta - b))
+    return a * a * p * (1 - p)
+
+
+def load_responses(user_id=None, batch_size=1000):
+    """
+    Flatten the per-question details of quiz_attempts into response arrays.
+
+    Returns:
+        tuple: (users, items, correct, user_ids, fingerprints) - index arrays plus the user id and
+            question fingerprint behind every index.
+    """
+    query = {"user_id": user_id} if user_id else {}
+    projection = {"user_id": 1, "details.question": 1, "details.subject": 1, "details.chapter": 1, "details.is_correct": 1}
+    user_index, item_index = {}, {}
+    users, items, correct = [], [], []
+    for attempt in attempts_collection.find(query, projection).batch_size(batch_size):
+        if not attempt.get("user_id"):
+            continue
+        u = user_index.setdefault(attempt["user_id"], len(user_index))
+        for detail in attempt.get("details") or []:
+            if not detail.get("question"):
+                continue
+            users.append(u)
+            items.append(item_index.setdefault(question_fingerprint(detail), len(item_index)))
+            correct.append(1 if detail.get("is_correct") else 0)
+    return (np.array(users, dtype=np.int64), np.array(items, dtype=np.int64), np.array(correct, dtype=np.int8),
+            list(user_index), list(item_index))
+
+
+def recalibrate(batch_size=1000):
+    """
+    Calibrate all questions and students from quiz_attempts and store the parameters in
+    irt_items / irt_abilities.
+
+    Returns:
+        dict: Response, student and question counts and timings.
+    """
+    start = time.perf_counter()
+    users, items, correct, user_ids, fingerprints = load_responses(batch_size=batch_size)
+    loaded = time.perf_counter()
+    if not len(users):
+        return {"responses": 0}
+
+    theta, a, b = calibrate(users, items, correct, len(user_ids), len(fingerprints))
+    fitted = time.perf_counter()
+
+    now = datetime.datetime.utcnow()
+    responses = np.bincount(items, minlength=len(fingerprints))
+    item_ops = [ReplaceOne({"_id": fingerprint}, {"a": float(a_i), "b": float(b_i), "responses": int(count), "calibrated_at": now}, upsert=True)
+                for fingerprint, a_i, b_i, count in zip(fingerprints, a.tolist(), b.tolist(), responses.tolist())]
+    ability_ops = [ReplaceOne({"_id": user_id}, {"theta": float(value), "calibrated_at": now}, upsert=True)
+                   for user_id, value in zip(user_ids, theta.tolist())]
+    for collection, ops in ((items_collection, item_ops), (abilities_collection, ability_ops)):
+        for offset in range(0, len(ops), batch_size):
+            collection.bulk_write(ops[offset:offset + batch_size], ordered=False)
+
+    summary = {
+        "responses": int(len(users)),
+        "students": len(user_ids),
+        "questions": len(fingerprints),
+        "load_seconds": loaded - start,
+        "fit_seconds": fitted - loaded,
+        "store_seconds": time.perf_counter() - fitted,
+    }
+    print(f"IRT recalibrated: {summary}")
+    return summary
+
+
+def get_ability(user_id):
+    document = abilities_collection.find_one({"_id": user_id}) if user_id else None
+    return document["theta"] if document else 0.0
+
+
+def item_parameters(questions):
+    """
+    (a, b) arrays for questions: calibrated values where known, otherwise a = 1 and b from the
+    question's difficulty label.
+    """
+    fingerprints = [question_fingerprint(question) for question in questions]
+    calibrated = {document["_id"]: document for document in items_collection.find({"_id": {"$in": fingerprints}})}
+    a = np.ones(len(questions))
+    b = np.array([LABEL_DIFFICULTY.get(str(question.get("difficulty", "")).lower(), 0.0) for question in questions])
+    for index, fingerprint in enumerate(fingerprints):
+        if fingerprint in calibrated:
+            a[index] = calibrated[fingerprint]["a"]
+            b[index] = calibrated[fingerprint]["b"]
+    return a, b
+
+
+def select_most_informative(theta, a, b, count):
+    """
+    Indexes of the `count` questions with the highest information at ability theta, best first.
+    """
+    information = item_information(theta, np.asarray(a), np.asarray(b))
+    count = min(count, len(information))
+    if count <= 0:
+        return []
+    top = np.argpartition(-information, count - 1)[:count]
+    return top[np.argsort(-information[top])].tolist()
+
+
+def select_questions(user_id, candidates, count):
+    """
+    Pick the `count` candidate questions that tell the most about this student's ability.
+    """
+    if not candidates:
+        return []
+    a, b = item_parameters(candidates)
+    return [candidates[index] for index in select_most_informative(get_ability(user_id), a, b, count)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalibrate IRT parameters from quiz_attempts")
+    parser.parse_args()
+    recalibrate()
@@ -0,0 +1,153 @@
+import json
+import re
+
+
+class JSONItemStream:
+    """
+    Incremental parser that pulls complete objects out of a JSON array while it is still being generated.
+
+    Feed it the model output token by token; every object in the item array of the output is
+    returned as soon as its closing brace arrives. The item array is the first `[` followed by an
+    object that is either at the top level (no `{` before it) or the value of a key, so it works for
+    a bare array (`[{...}, {...}]`) as well as an array under a key (`{"questions": [{...}]}`), and
+    ignores markdown code fences or prose around the JSON (`Here are [5] cards: [{...}]`).
+
+    Example:
+        stream = JSONItemStream()
+        for token in tokens:
+            for item in stream.feed(token):
+                send(item)
+        for item in stream.finish():
+            send(item)
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.items_depth = None  # depth inside the item array, once found
+        self.brace_seen = False  # a "{" before the item array: only an array under a key can follow
+        self.last_chars = ""  # last two non-whitespace characters before the item array
+        self.item_start = None
+        self.done = False
+        self.emitted = 0
+        self.raw = []  # text seen before the first item, for the whole-document fallback in finish()
+
+    def feed(self, text):
+        """
+        Add generated text and return the objects completed by it.
+        """
+        if not text:
+            return []
+        if not self.emitted:
+            self.raw.append(text)
+        if self.done:
+            return []
+        self.buffer += text
+        items = []
+        buffer = self.buffer
+        i = self.position
+        while i < len(buffer):
+            char = buffer[i]
+            if self.items_depth is None:
+                # Looking for the item array: prose and brackets before it are skipped
+                if char == "[":
+                    rest = buffer[i + 1:].lstrip()
+                    if not rest:
+                        break  # wait for the next character to decide
+                    if rest[0] == "{" and (not self.brace_seen or self.last_chars == '":'):
+                        self.items_depth = self.depth = 1
+                        i += 1
+                        continue
+                elif char == "{":
+                    self.brace_seen = True
+                if not char.isspace():
+                    self.last_chars = (self.last_chars + char)[-2:]
+                i += 1
+                continue
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+                if self.depth == self.items_depth + 1 and char == "{":
+                    self.item_start = i
+            elif char in "]}":
+                if self.depth == self.items_depth + 1 and char == "}" and self.item_start is not None:
+                    item = self._parse(buffer[self.item_start:i + 1])
+                    if item is not None:
+                        items.append(item)
+                    self.item_start = None
+                elif self.depth == self.items_depth and char == "]":
+                    self.done = True
+                self.depth -= 1
+                if self.done:
+                    break
+            i += 1
+
+        # Drop text we no longer need so memory stays bounded by the size of one item
+        keep_from = self.item_start if self.item_start is not None else i
+        self.buffer = buffer[keep_from:]
+        self.position = i - keep_from
+        if self.item_start is not None:
+            self.item_start = 0
+        if items:
+            self.raw = []
+        self.emitted += len(items)
+        return items
+
+    def _parse(self, text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
+
+    def finish(self):
+        """
+        Call once the stream has ended. If nothing was emitted incrementally (e.g. the model
+        returned a single object instead of an array), fall back to parsing the whole output.
+        """
+        if self.emitted:
+            return []
+        text = "".join(self.raw).strip()
+        if "```json" in text:
+            text = text.split("```json", 1)[1].split("```", 1)[0]
+        elif "```" in text:
+            text = text.split("```")[1]
+        parsed = self._parse(text.strip())
+        if isinstance(parsed, list):
+            return parsed
+        if isinstance(parsed, dict):
+            arrays = [value for value in parsed.values() if isinstance(value, list)]
+            return arrays[0] if arrays else [parsed]
+        return self._last_array(text)
+
+    def _last_array(self, text):
+        # Not one JSON document (e.g. prose around it): the last array of objects that parses
+        decoder = json.JSONDecoder()
+        for match in reversed(list(re.finditer(r"\[\s*\{", text))):
+            try:
+                parsed, _ = decoder.raw_decode(text, match.start())
+            except json.JSONDecodeError:
+                continue
+            if isinstance(parsed, list) and parsed:
+                return parsed
+        return []
+
+
+def iter_json_items(chunks):
+    """
+    Yield each complete object from the first JSON array in a stream of text chunks.
+    """
+    stream = JSONItemStream()
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    yield from stream.finish()
@@ -0,0 +1,568 @@
+import os
+import json
+import time
+import asyncio
+import random
+import threading
+
+import dotenv
+import openai
+
+from . import llm_cache, metrics, routing
+from .singleflight import SingleFlight
+
+dotenv.load_dotenv()
+
+# Single gateway for every LLM / embedding call in the backend. All requests share one pooled
+# HTTP client, one retry policy and one per-model rate limiter.
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+# Requests per minute / tokens per minute for each model. Override with LLM_RATE_LIMITS, e.g.
+# LLM_RATE_LIMITS='{"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}'. An rpm of null (or 0) sets no
+# pre-emptive request cap; 429s from the provider are then handled by the retry backoff.
+# Gemini limits depend on the key's tier, so its request cap is off unless GEMINI_RPM is set.
+DEFAULT_RATE_LIMITS = {
+    "gpt-3.5-turbo": {"rpm": 3500, "tpm": 160000},
+    "gpt-4o-mini": {"rpm": 5000, "tpm": 2000000},
+    "gpt-4o": {"rpm": 5000, "tpm": 800000},
+    "text-embedding-3-large": {"rpm": 3000, "tpm": 1000000},
+    "text-embedding-ada-002": {"rpm": 3000, "tpm": 1000000},
+    "gemini-2.0-flash-exp": {"rpm": int(os.getenv("GEMINI_RPM", "0")) or None, "tpm": 4000000},
+}
+FALLBACK_RATE_LIMIT = {"rpm": 500, "tpm": 200000}
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+THROTTLED_STATUS_CODES = {429}
+# When the provider throttles, a model's request rate is halved (down to this share of its
+# configured limit) and then restored in small steps as calls succeed again
+LLM_MIN_RATE_SCALE = float(os.getenv("LLM_MIN_RATE_SCALE", "0.1"))
+LLM_RATE_RECOVERY_STEP = float(os.getenv("LLM_RATE_RECOVERY_STEP", "0.05"))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `capacity` units per minute.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, scale):
+        """
+        Refill at `scale` times the nominal rate; a lower rate also drops any unused burst.
+        """
+        with self.lock:
+            self._refill()
+            self.rate = self.capacity * scale / 60.0
+            if scale < 1:
+                self.tokens = min(self.tokens, 0.0)
+
+    def reserve(self, amount):
+        """
+        Take `amount` units from the bucket, going into debt if needed.
+
+        Returns:
+            float: Seconds the caller has to wait before the reservation is covered.
+        """
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Per-model limiter tracking requests per minute and tokens per minute.
+
+    Bursts above the limit wait for capacity instead of failing with a 429; a model without an
+    rpm is only limited by tokens per minute. The limits adapt to
+    the provider: every throttled call halves the rate (multiplicative decrease) and every
+    successful call adds back LLM_RATE_RECOVERY_STEP of it (additive increase), so callers only
+    slow down while the provider is actually pushing back.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm) if rpm else None  # no request cap
+        self.tokens = TokenBucket(tpm)
+        self.scale = 1.0
+        self.lock = threading.Lock()
+
+    def _apply(self, scale):
+        if self.requests:
+            self.requests.set_rate(scale)
+        self.tokens.set_rate(scale)
+
+    def throttled(self):
+        with self.lock:
+            self.scale = max(LLM_MIN_RATE_SCALE, self.scale / 2)
+            scale = self.scale
+        self._apply(scale)
+        print(f"Provider throttled, rate limit lowered to {scale:.0%} of the configured limit")
+
+    def succeeded(self):
+        with self.lock:
+            if self.scale >= 1.0:
+                return
+            self.scale = min(1.0, self.scale + LLM_RATE_RECOVERY_STEP)
+            scale = self.scale
+        self._apply(scale)
+
+    def acquire(self, tokens=1):
+        wait = max(self.requests.reserve(1) if self.requests else 0.0, self.tokens.reserve(tokens))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _load_rate_limits():
+    limits = dict(DEFAULT_RATE_LIMITS)
+    override = os.getenv("LLM_RATE_LIMITS")
+    if override:
+        try:
+            limits.update(json.loads(override))
+        except json.JSONDecodeError as e:
+            print(f"Ignoring invalid LLM_RATE_LIMITS: {str(e)}")
+    return limits
+
+
+RATE_LIMITS = _load_rate_limits()
+
+
+def get_limiter(model):
+    with _limiters_lock:
+        if model not in _limiters:
+            limit = RATE_LIMITS.get(model, FALLBACK_RATE_LIMIT)
+            _limiters[model] = RateLimiter(limit.get("rpm", FALLBACK_RATE_LIMIT["rpm"]), limit.get("tpm", FALLBACK_RATE_LIMIT["tpm"]))
+        return _limiters[model]
+
+
+def estimate_tokens(content):
+    """
+    Cheap token estimate (~4 characters per token) used for rate limiting.
+    """
+    if content is None:
+        return 0
+    if isinstance(content, str):
+        return len(content) // 4 + 1
+    if isinstance(content, dict):
+        return sum(estimate_tokens(v) for k, v in content.items() if k not in ("image_url", "role"))
+    if isinstance(content, (list, tuple)):
+        return sum(estimate_tokens(item) for item in content)
+    return 0
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide OpenAI client.
+
+    Sharing one client means every call site reuses the same keep-alive connection pool instead of
+    opening new connections per request. The SDK's own retries are disabled; retries are handled by
+    `with_retries` so that every provider follows the same policy.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = openai.OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                timeout=LLM_TIMEOUT,
+                max_retries=0,
+            )
+        return _client
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(error, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_retryable(error):
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def with_retries(call, description="LLM call", limiter=None):
+    """
+    Run `call` retrying 429/5xx/connection failures with full-jitter exponential backoff.
+    Throttling and successes are reported to `limiter` so it can adapt its rate.
+    """
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            result = call()
+            if limiter is not None:
+                limiter.succeeded()
+            return result
+        except Exception as e:
+            if limiter is not None and _status_code(e) in THROTTLED_STATUS_CODES:
+                limiter.throttled()
+            if attempt == LLM_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            print(f"{description} failed ({str(e)}), retrying in {delay:.2f}s (attempt {attempt + 1}/{LLM_MAX_RETRIES})")
+            time.sleep(delay)
+
+
+# Identical requests in flight at the same time share one upstream call
+_in_flight = SingleFlight()
+
+
+def coalescing_stats():
+    """
+    Upstream calls made (leaders) versus calls that joined an identical in-flight request (followers).
+    """
+    return _in_flight.snapshot()
+
+
+def _gateway_samples():
+    cache = llm_cache.cache_stats()
+    coalescing = coalescing_stats()
+    return [
+        ("llm_cache_hits_total", "counter", "LLM response cache hits.", cache["hits"]),
+        ("llm_cache_misses_total", "counter", "LLM response cache misses.", cache["misses"]),
+        ("llm_cache_saved_seconds_total", "counter", "Upstream latency avoided by cache hits.", cache["saved_seconds"]),
+        ("llm_coalesced_leaders_total", "counter", "Calls that went upstream after single-flight deduplication.", coalescing["leaders"]),
+        ("llm_coalesced_followers_total", "counter", "Calls served by joining an identical in-flight call.", coalescing["followers"]),
+        ("llm_in_flight", "gauge", "Distinct upstream LLM calls currently in flight.", coalescing["in_flight"]),
+    ]
+
+
+metrics.register_collector(_gateway_samples)
+
+
+def _observed(kind, model, site, detail, call, usage_of):
+    """
+    Run an upstream call and record its latency and token usage.
+    """
+    start = time.perf_counter()
+    try:
+        response = call()
+    except Exception:
+        metrics.observe_llm_call(kind, model, site, time.perf_counter() - start, status="error", detail=detail)
+        raise
+    duration = time.perf_counter() - start
+    prompt_tokens, completion_tokens = usage_of(response)
+    metrics.observe_llm_call(kind, model, site, duration, prompt_tokens, completion_tokens, detail=detail)
+    if kind == "chat":
+        routing.record_latency(model, duration)
+    return response
+
+
+def _openai_usage(response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
+def _route(messages, model, task, max_tokens, expected_output_tokens, site):
+    if model:
+        return model
+    return routing.choose_model(task or "answer", estimate_tokens(messages), max_tokens or expected_output_tokens, site=site)
+
+
+def _request_key(messages, model, task, max_tokens, temperature, expected_output_tokens):
+    # Built from the caller's inputs, not the routed model: routing follows live latency, so
+    # identical requests must share a key before a model is picked to coalesce and hit the cache
+    target = model or ["route", task or "answer", expected_output_tokens]
+    return llm_cache.cache_key(target, messages, temperature, max_tokens)
+
+
+def chat(messages, model=None, max_tokens=None, temperature=None, cache=False, cache_ttl=None, coalesce=True, site=None, detail=None,
+         task=None, expected_output_tokens=None):
+    """
+    Run a chat completion through the shared client.
+
+    Args:
+        messages (list): OpenAI-style chat messages.
+        model (str): Model name, or None to let the routing policy pick one for `task`.
+        max_tokens (int): Completion token limit, or None for the model default.
+        temperature (float): Sampling temperature, or None for the model default.
+        cache (bool): Serve repeated identical requests from the persistent response cache.
+        cache_ttl (int): Seconds a cached response stays valid (defaults to LLM_CACHE_TTL).
+        coalesce (bool): Share one upstream call between concurrent identical requests.
+        site (str): Call site name used to tag metrics.
+        detail (dict): Extra call context for the metrics JSON log (e.g. {"chunk": 3}).
+        task (str): Kind of job used for model routing ("classify", "extract", "quiz", "slides", ...).
+        expected_output_tokens (int): Expected completion size used for model routing.
+
+    Returns:
+        str: The completion text ("" when the model returned no content).
+    """
+    key = _request_key(messages, model, task, max_tokens, temperature, expected_output_tokens)
+    # Routed once per coalesced call (and only on a cache miss), so the whole group uses one model
+    route = lambda: _route(messages, model, task, max_tokens, expected_output_tokens, site)
+    call = lambda: _cached_chat(key, messages, route, max_tokens, temperature, cache, cache_ttl, site, detail)
+    if not coalesce:
+        return call()
+    return _in_flight.do(("chat", key), call)
+
+
+async def achat(messages, model=None, max_tokens=None, temperature=None, cache=False, cache_ttl=None, coalesce=True, site=None, detail=None,
+                task=None, expected_output_tokens=None):
+    """
+    Async variant of `chat`. Coalesces with identical requests from other tasks and threads.
+    """
+    key = _request_key(messages, model, task, max_tokens, temperature, expected_output_tokens)
+    route = lambda: _route(messages, model, task, max_tokens, expected_output_tokens, site)
+    call = lambda: asyncio.to_thread(_cached_chat, key, messages, route, max_tokens, temperature, cache, cache_ttl, site, detail)
+    if not coalesce:
+        return await call()
+    return await _in_flight.do_async(("chat", key), call)
+
+
+def _cached_chat(key, messages, route, max_tokens, temperature, cache, cache_ttl, site, detail):
+    if not cache:
+        return _chat(messages, route(), max_tokens, temperature, site, detail)
+    cached = llm_cache.lookup(key)
+    if cached is not None:
+        return cached
+    start = time.perf_counter()
+    content = _chat(messages, route(), max_tokens, temperature, site, detail)
+    if content:
+        llm_cache.store(key, content, time.perf_counter() - start, ttl=cache_ttl)
+    return content
+
+
+def _chat(messages, model, max_tokens, temperature, site, detail):
+    params = {"model": model, "messages": messages}
+    if max_tokens is not None:
+        params["max_tokens"] = max_tokens
+    if temperature is not None:
+        params["temperature"] = temperature
+
+    limiter = get_limiter(model)
+    limiter.acquire(estimate_tokens(messages) + (max_tokens or 500))
+    response = _observed(
+        "chat", model, site, detail,
+        lambda: with_retries(lambda: get_client().chat.completions.create(**params), f"Chat completion ({model})", limiter),
+        _openai_usage,
+    )
+    if not response or not response.choices:
+        return ""
+    return response.choices[0].message.content or ""
+
+
+def _observed_stream(kind, model, site, detail, open_stream, text_of, usage_of):
+    """
+    Open a streaming call (with retries), yield its text pieces and record latency, time to first
+    token and token usage once the stream ends.
+    """
+    start = time.perf_counter()
+    prompt_tokens = completion_tokens = None
+    first_token = None
+    status = "error"
+    try:
+        for chunk in with_retries(open_stream, f"Streaming {kind} ({model})", get_limiter(model)):
+            chunk_prompt, chunk_completion = usage_of(chunk)
+            if chunk_prompt is not None:
+                prompt_tokens, completion_tokens = chunk_prompt, chunk_completion
+            text = text_of(chunk)
+            if text:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    metrics.observe_first_token(kind, model, site, first_token)
+                yield text
+        status = "ok"
+    except GeneratorExit:
+        status = "cancelled"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe_llm_call(kind, model, site, duration, prompt_tokens, completion_tokens, status=status, detail=detail)
+        if status == "ok" and kind == "chat":
+            routing.record_latency(model, duration)
+
+
+def _delta_text(chunk):
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
+
+
+def chat_stream(messages, model=None, max_tokens=None, temperature=None, site=None, detail=None, task=None, expected_output_tokens=None):
+    """
+    Stream a chat completion, yielding text pieces as they arrive.
+
+    Takes the same arguments as `chat` (streams are never cached or coalesced). Retries only cover
+    opening the stream; a failure after the first token is raised to the caller.
+    """
+    model = _route(messages, model, task, max_tokens, expected_output_tokens, site)
+    params = {"model": model, "messages": messages, "stream": True, "stream_options": {"include_usage": True}}
+    if max_tokens is not None:
+        params["max_tokens"] = max_tokens
+    if temperature is not None:
+        params["temperature"] = temperature
+
+    get_limiter(model).acquire(estimate_tokens(messages) + (max_tokens or 500))
+    return _observed_stream(
+        "chat", model, site, detail,
+        lambda: get_client().chat.completions.create(**params),
+        _delta_text,
+        _openai_usage,
+    )
+
+
+def embed(texts, model="text-embedding-3-large", site=None):
+    """
+    Embed a list of texts. Concurrent identical requests share one upstream call.
+
+    Returns:
+        list: One embedding vector per input text.
+    """
+    if not texts:
+        return []
+    texts = list(texts)
+    return _in_flight.do(("embed", llm_cache.cache_key(model, texts)), lambda: _embed(texts, model, site))
+
+
+async def aembed(texts, model="text-embedding-3-large", site=None):
+    """
+    Async variant of `embed`.
+    """
+    if not texts:
+        return []
+    texts = list(texts)
+    return await _in_flight.do_async(("embed", llm_cache.cache_key(model, texts)), lambda: asyncio.to_thread(_embed, texts, model, site))
+
+
+def _embed(texts, model, site):
+    limiter = get_limiter(model)
+    limiter.acquire(estimate_tokens(texts))
+    response = _observed(
+        "embedding", model, site, {"inputs": len(texts)},
+        lambda: with_retries(lambda: get_client().embeddings.create(model=model, input=texts), f"Embedding ({model})", limiter),
+        lambda response: (_openai_usage(response)[0], None),
+    )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def embed_query(text, model="text-embedding-3-large", site=None):
+    """
+    Embed a single text.
+    """
+    return embed([text], model=model, site=site)[0]
+
+
+_gemini_models = {}
+_gemini_lock = threading.Lock()
+_gemini_configured = False
+
+
+def configure_gemini(api_key=None):
+    """
+    Configure the Gemini SDK. google-generativeai is only required by callers that use Gemini.
+    """
+    global _gemini_configured
+    import google.generativeai as genai
+
+    endpoint = os.getenv("GEMINI_API_ENDPOINT")  # e.g. the local fake_llm.py server for load tests
+    if endpoint:
+        genai.configure(api_key=api_key or os.getenv("API_KEY"), transport="rest", client_options={"api_endpoint": endpoint})
+    else:
+        genai.configure(api_key=api_key or os.getenv("API_KEY"))
+    _gemini_configured = True
+    return genai
+
+
+def _gemini_model(model):
+    import google.generativeai as genai
+
+    with _gemini_lock:
+        if not _gemini_configured:
+            configure_gemini()
+        if model not in _gemini_models:
+            _gemini_models[model] = genai.GenerativeModel(model)
+        return _gemini_models[model]
+
+
+def generate_gemini(prompt, model="gemini-2.0-flash-exp", site=None):
+    """
+    Generate text with Gemini through the shared retry policy and rate limiter.
+
+    Returns:
+        str: The response text.
+    """
+    return _in_flight.do(("gemini", llm_cache.cache_key(model, prompt)), lambda: _generate_gemini(prompt, model, site))
+
+
+def _gemini_usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+
+
+def _generate_gemini(prompt, model, site):
+    generative_model = _gemini_model(model)
+    limiter = get_limiter(model)
+    limiter.acquire(estimate_tokens(prompt) + 2000)
+    response = _observed(
+        "gemini", model, site, None,
+        lambda: with_retries(
+            lambda: generative_model.generate_content(prompt, request_options={"timeout": LLM_TIMEOUT}),
+            f"Gemini generation ({model})",
+            limiter,
+        ),
+        _gemini_usage,
+    )
+    return response.text
+
+
+def _gemini_chunk_text(chunk):
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks without text parts (e.g. the final usage-only chunk)
+        return None
+
+
+def generate_gemini_stream(prompt, model="gemini-2.0-flash-exp", site=None):
+    """
+    Stream a Gemini generation, yielding text pieces as they arrive.
+    """
+    generative_model = _gemini_model(model)
+    get_limiter(model).acquire(estimate_tokens(prompt) + 2000)
+    return _observed_stream(
+        "gemini", model, site, None,
+        lambda: generative_model.generate_content(prompt, stream=True, request_options={"timeout": LLM_TIMEOUT}),
+        _gemini_chunk_text,
+        _gemini_usage,
+    )
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+
+import dotenv
+
+dotenv.load_dotenv()
+
+# Persistent prompt -> response cache for deterministic-enough LLM calls. Call sites opt in with
+# llm.chat(..., cache=True); entries are keyed by a hash of model, messages, temperature and max_tokens.
+
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "disk")  # "disk" or "mongo"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "./cache/llm")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+
+def cache_key(model, messages, temperature=None, max_tokens=None):
+    """
+    Deterministic key for a chat request.
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    One JSON file per entry under `directory`. File mtime doubles as the LRU clock.
+    """
+
+    def __init__(self, directory=LLM_CACHE_DIR, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.count = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if entry.get("expires", 0) < time.time():
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        existed = os.path.exists(path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self.lock:
+            if self.count is None:
+                self.count = sum(1 for _ in self._entries())
+            elif not existed:
+                self.count += 1
+            if self.count > self.max_entries:
+                self._evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            with self.lock:
+                if self.count:
+                    self.count -= 1
+        except OSError:
+            pass
+
+    def _evict(self):
+        # Drop the least recently used entries until 90% of the budget is left
+        paths = []
+        for path in self._entries():
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        paths.sort()
+        target = int(self.max_entries * 0.9)
+        remaining = len(paths)
+        for _, path in paths:
+            if remaining <= target:
+                break
+            try:
+                os.remove(path)
+                remaining -= 1
+            except OSError:
+                continue
+        self.count = remaining
+        print(f"LLM cache evicted entries down to {remaining}")
+
+
+class MongoCache:
+    """
+    Entries in the `llm_cache` collection. Expiry is handled by a TTL index; size is bounded by
+    evicting the least recently used documents.
+    """
+
+    EVICTION_CHECK_INTERVAL = 100
+
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES):
+        from pymongo import MongoClient, ASCENDING
+
+        client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+        self.collection = client['RGIT_DB']['llm_cache']
+        self.collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        self.collection.create_index([("last_used", ASCENDING)])
+        self.max_entries = max_entries
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        now = datetime.datetime.utcnow()
+        doc = self.collection.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": now}},
+            {"$set": {"last_used": now}},
+        )
+        if not doc:
+            return None
+        return {"value": doc["value"], "latency": doc.get("latency", 0.0)}
+
+    def set(self, key, entry):
+        now = datetime.datetime.utcnow()
+        self.collection.replace_one(
+            {"_id": key},
+            {
+                "value": entry["value"],
+                "latency": entry["latency"],
+                "last_used": now,
+                "expires_at": datetime.datetime.utcfromtimestamp(entry["expires"]),
+            },
+            upsert=True,
+        )
+        with self.lock:
+            self.writes += 1
+            check = self.writes % self.EVICTION_CHECK_INTERVAL == 0
+        if check:
+            overflow = self.collection.estimated_document_count() - self.max_entries
+            if overflow > 0:
+                oldest = self.collection.find({}, {"_id": 1}).sort("last_used", 1).limit(overflow)
+                self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in oldest]}})
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "errors": 0, "saved_seconds": 0.0}
+_stats_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = MongoCache() if LLM_CACHE_BACKEND == "mongo" else DiskCache()
+        return _backend
+
+
+def _count(field, amount=1):
+    with _stats_lock:
+        _stats[field] += amount
+
+
+def lookup(key):
+    """
+    Return the cached value for `key`, or None on a miss.
+    """
+    try:
+        entry = get_backend().get(key)
+    except Exception as e:
+        print(f"LLM cache lookup failed: {str(e)}")
+        _count("errors")
+        entry = None
+    if entry is None:
+        _count("misses")
+        return None
+    _count("hits")
+    _count("saved_seconds", entry.get("latency", 0.0))
+    return entry["value"]
+
+
+def store(key, value, latency, ttl=None):
+    """
+    Store `value` with the latency it took to produce, so hits can report the time saved.
+    """
+    entry = {"value": value, "latency": latency, "expires": time.time() + (ttl or LLM_CACHE_TTL)}
+    try:
+        get_backend().set(key, entry)
+    except Exception as e:
+        print(f"LLM cache store failed: {str(e)}")
+        _count("errors")
+
+
+def cache_stats():
+    """
+    Hit/miss counters and total upstream latency avoided by cache hits.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["backend"] = LLM_CACHE_BACKEND
+    return stats
@@ -0,0 +1,204 @@
+import os
+import math
+import argparse
+import datetime
+
+import dotenv
+from pymongo import MongoClient, ASCENDING, UpdateOne
+
+dotenv.load_dotenv()
+
+# Running subject and chapter mastery per user, kept next to quiz_attempts so dashboards don't
+# have to rescan every attempt.
+#
+# One document per (user_id, kind, subject, chapter), kind being "subject" or "chapter", with
+# question/mark counters and exponentially decayed counters. Every evaluation adds to them with
+# a single atomic $inc.
+#
+# Decay without rewriting old documents: an answer at time t is weighted by 2 ** ((t - EPOCH) / half_life).
+# Decayed accuracy is weighted_correct / weighted_total, and the common factor 2 ** (-now / half_life)
+# cancels out of that ratio, so the stored sums never need to be decayed in place.
+# Weights grow by 2x per half-life; float64 has room for over 1000 half-lives.
+
+MASTERY_HALF_LIFE_DAYS = float(os.getenv("MASTERY_HALF_LIFE_DAYS", "30"))
+EPOCH = datetime.datetime(2024, 1, 1)
+# Weights overflow float64 after ~1024 half-lives; a 7-day half-life lasts until ~2043
+MIN_HALF_LIFE_DAYS = 7
+if MASTERY_HALF_LIFE_DAYS < MIN_HALF_LIFE_DAYS:
+    print(f"MASTERY_HALF_LIFE_DAYS={MASTERY_HALF_LIFE_DAYS:g} is below the minimum, using {MIN_HALF_LIFE_DAYS} days")
+    MASTERY_HALF_LIFE_DAYS = MIN_HALF_LIFE_DAYS
+
+client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+db = client['RGIT_DB']
+mastery_collection = db['mastery']
+attempts_collection = db['quiz_attempts']
+
+_indexes_ready = False
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    mastery_collection.create_index(
+        [("user_id", ASCENDING), ("kind", ASCENDING), ("subject", ASCENDING), ("chapter", ASCENDING)], unique=True)
+    _indexes_ready = True
+
+
+def decay_weight(timestamp=None):
+    timestamp = timestamp or datetime.datetime.utcnow()
+    days = (timestamp - EPOCH).total_seconds() / 86400
+    return math.pow(2.0, days / MASTERY_HALF_LIFE_DAYS)
+
+
+def _question_rows(summary):
+    """
+    (subject, chapter, is_correct, marks, obtained_marks) for every question of a performance
+    summary. Uses the per-question details; falls back to subject_analysis (without chapters)
+    for summaries that have none. Questions without a subject are skipped, and a missing
+    chapter stays None so no chapter document is created for it.
+    """
+    details = summary.get("details")
+    if details:
+        return [(str(d["subject"]), str(d["chapter"]) if d.get("chapter") not in (None, "") else None,
+                 bool(d.get("is_correct")), d.get("marks") or 0, d.get("obtained_marks") or 0)
+                for d in details if d.get("subject") not in (None, "")]
+    rows = []
+    for subject, data in (summary.get("subject_analysis") or {}).items():
+        correct = data.get("correct_answers", 0)
+        for index in range(data.get("total_questions", 0)):
+            # Marks are spread evenly: per-question marks aren't known here
+            share = 1 / max(data.get("total_questions", 1), 1)
+            rows.append((str(subject), None, index < correct,
+                         data.get("total_marks", 0) * share, data.get("obtained_marks", 0) * share))
+    return rows
+
+
+def _increments(summary):
+    """
+    Counter increments per (kind, subject, chapter) for one performance summary.
+    """
+    weight = decay_weight(summary.get("timestamp"))
+    totals = {}
+    for subject, chapter, is_correct, marks, obtained in _question_rows(summary):
+        keys = [("subject", subject, None)]
+        if chapter is not None:
+            keys.append(("chapter", subject, chapter))
+        for key in keys:
+            counters = totals.setdefault(key, {"questions": 0, "correct": 0, "total_marks": 0, "obtained_marks": 0,
+                                               "weighted_total": 0.0, "weighted_correct": 0.0})
+            counters["questions"] += 1
+            counters["correct"] += int(is_correct)
+            counters["total_marks"] += marks
+            counters["obtained_marks"] += obtained
+            counters["weighted_total"] += weight
+            counters["weighted_correct"] += weight * is_correct
+    return totals
+
+
+def _update_ops(summary):
+    timestamp = summary.get("timestamp") or datetime.datetime.utcnow()
+    ops = []
+    for (kind, subject, chapter), counters in _increments(summary).items():
+        counters["attempts"] = 1
+        ops.append(UpdateOne(
+            {"user_id": summary["user_id"], "kind": kind, "subject": subject, "chapter": chapter},
+            {"$inc": counters, "$max": {"last_attempt": timestamp}},
+            upsert=True
+        ))
+    return ops
+
+
+def record_attempts(summaries):
+    """
+    Add evaluated attempts (performance summaries as stored in quiz_attempts) to the users'
+    mastery counters with one bulk write.
+
+    Returns:
+        int: Number of mastery documents updated or created.
+    """
+    ops = [op for summary in summaries if summary.get("user_id") for op in _update_ops(summary)]
+    if not ops:
+        return 0
+    _ensure_indexes()
+    result = mastery_collection.bulk_write(ops, ordered=False)
+    return result.modified_count + result.upserted_count
+
+
+def record_attempt(summary):
+    """
+    Add one evaluated attempt to the user's mastery counters.
+    """
+    return record_attempts([summary])
+
+
+def _with_accuracy(document):
+    document = {k: v for k, v in document.items() if k != '_id'}
+    document["accuracy"] = document["correct"] / document["questions"] * 100 if document.get("questions") else 0
+    document["decayed_accuracy"] = (document["weighted_correct"] / document["weighted_total"] * 100
+                                    if document.get("weighted_total") else 0)
+    document.pop("weighted_correct", None)
+    document.pop("weighted_total", None)
+    return document
+
+
+def get_mastery(user_id):
+    """
+    Subject and chapter mastery of a user, read from the maintained counters.
+
+    Returns:
+        dict: {"subjects": [...], "chapters": [...]}, each entry with counts, marks, accuracy and
+            decayed_accuracy (percentages).
+    """
+    mastery = {"subjects": [], "chapters": []}
+    for document in mastery_collection.find({"user_id": user_id}):
+        document = _with_accuracy(document)
+        if document.pop("kind") == "subject":
+            document.pop("chapter", None)
+            mastery["subjects"].append(document)
+        else:
+            mastery["chapters"].append(document)
+    return mastery
+
+
+def rebuild(user_id=None, batch_size=1000):
+    """
+    Recompute mastery from quiz_attempts, for one user or everyone. Used to backfill attempts
+    stored before the counters existed; evaluations running meanwhile may be counted twice or
+    not at all, so run it when quizzes are quiet.
+
+    Returns:
+        int: Number of attempts replayed.
+    """
+    query = {"user_id": user_id} if user_id else {}
+    totals = {}
+    replayed = 0
+    projection = {"user_id": 1, "timestamp": 1, "details": 1, "subject_analysis": 1}
+    for summary in attempts_collection.find(query, projection).batch_size(batch_size):
+        if not summary.get("user_id"):
+            continue
+        replayed += 1
+        timestamp = summary.get("timestamp") or datetime.datetime.utcnow()
+        for (kind, subject, chapter), counters in _increments(summary).items():
+            key = (summary["user_id"], kind, subject, chapter)
+            entry = totals.setdefault(key, {"attempts": 0, "last_attempt": timestamp})
+            entry["attempts"] += 1
+            entry["last_attempt"] = max(entry["last_attempt"], timestamp)
+            for field, value in counters.items():
+                entry[field] = entry.get(field, 0) + value
+
+    _ensure_indexes()
+    mastery_collection.delete_many(query)
+    documents = [dict(entry, user_id=key[0], kind=key[1], subject=key[2], chapter=key[3])
+                 for key, entry in totals.items()]
+    for start in range(0, len(documents), batch_size):
+        mastery_collection.insert_many(documents[start:start + batch_size], ordered=False)
+    print(f"Rebuilt {len(documents)} mastery document(s) from {replayed} attempt(s)")
+    return replayed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-user mastery counters from quiz_attempts")
+    parser.add_argument("--user-id", help="Only rebuild this user")
+    args = parser.parse_args()
+    rebuild(args.user_id)
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import threading
+import contextvars
+
+import dotenv
+
+dotenv.load_dotenv()
+
+# In-process metrics for LLM/embedding calls, exported in Prometheus text format on /metrics.
+# Every call is tagged with the Flask route that triggered it and the call site in our code.
+
+LLM_METRICS_LOG = os.getenv("LLM_METRICS_LOG")  # optional JSONL file with one line per call
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 131072)
+
+# Route of the request being served; set by the Flask app in a before_request hook
+current_route = contextvars.ContextVar("current_route", default="none")
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with one series per label combination.
+    """
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = [(key, dict(series, buckets=list(series["buckets"]))) for key, series in self.series.items()]
+        for key, series in sorted(items):
+            labels = _labels(zip(self.label_names, key))
+            for bound, cumulative in zip(self.buckets, series["buckets"]):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series["count"]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series['sum']}")
+            lines.append(f"{self.name}_count{{{labels}}} {series['count']}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+LLM_LABELS = ("route", "site", "kind", "model", "status")
+llm_latency = Histogram("llm_request_duration_seconds", "Upstream LLM/embedding call latency including retries.", LLM_LABELS, LATENCY_BUCKETS)
+llm_prompt_tokens = Histogram("llm_prompt_tokens", "Prompt tokens per LLM/embedding call.", LLM_LABELS, TOKEN_BUCKETS)
+llm_completion_tokens = Histogram("llm_completion_tokens", "Completion tokens per LLM call.", LLM_LABELS, TOKEN_BUCKETS)
+llm_first_token = Histogram("llm_time_to_first_token_seconds", "Time until the first streamed token arrived.", LLM_LABELS, LATENCY_BUCKETS)
+http_latency = Histogram("http_request_duration_seconds", "Flask request latency.", ("route", "method", "status"), LATENCY_BUCKETS)
+
+_collectors = []
+_log_lock = threading.Lock()
+
+
+def register_collector(collector):
+    """
+    Register a callable returning [(name, type, description, value)] samples added to /metrics.
+    """
+    _collectors.append(collector)
+
+
+def observe_llm_call(kind, model, site, duration, prompt_tokens=None, completion_tokens=None, status="ok", detail=None):
+    """
+    Record one upstream LLM or embedding call.
+
+    Args:
+        kind (str): "chat", "embedding" or "gemini".
+        model (str): Model name.
+        site (str): Call site in our code, e.g. "extract_chapter_name_subject".
+        duration (float): Seconds spent in the call, including retries.
+        prompt_tokens (int): Prompt tokens reported by the provider.
+        completion_tokens (int): Completion tokens reported by the provider.
+        status (str): "ok" or "error".
+        detail (dict): Extra context (e.g. {"chunk": 3}) written to the JSON log only.
+    """
+    labels = {"route": current_route.get(), "site": site or "unknown", "kind": kind, "model": model, "status": status}
+    llm_latency.observe(labels, duration)
+    if prompt_tokens is not None:
+        llm_prompt_tokens.observe(labels, prompt_tokens)
+    if completion_tokens is not None:
+        llm_completion_tokens.observe(labels, completion_tokens)
+
+    if LLM_METRICS_LOG:
+        entry = dict(labels, timestamp=time.time(), duration=duration, prompt_tokens=prompt_tokens,
+                     completion_tokens=completion_tokens, detail=detail)
+        with _log_lock:
+            os.makedirs(os.path.dirname(LLM_METRICS_LOG) or ".", exist_ok=True)
+            with open(LLM_METRICS_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+
+def observe_first_token(kind, model, site, seconds):
+    """
+    Record time to first token for a streamed call.
+    """
+    llm_first_token.observe({"route": current_route.get(), "site": site or "unknown", "kind": kind, "model": model, "status": "ok"}, seconds)
+
+
+def render_prometheus():
+    """
+    Render all metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for histogram in (llm_latency, llm_prompt_tokens, llm_completion_tokens, llm_first_token, http_latency):
+        lines.extend(histogram.render())
+    for collector in _collectors:
+        try:
+            samples = collector()
+        except Exception as e:
+            print(f"Metrics collector failed: {str(e)}")
+            continue
+        for name, metric_type, description, value in samples:
+            lines.extend([f"# HELP {name} {description}", f"# TYPE {name} {metric_type}", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
@@ -1,12 +1,13 @@
-from .storage import save_portfolio, load_portfolio
+from .storage import ProfileStore
 
 
 from datetime import datetime  # Import datetime library
 from pymongo import MongoClient  # Import MongoClient for MongoDB integration
+from pymongo.errors import PyMongoError
 
 import os
-import openai
-# Load the portfolio database from MongoDB (using the load_portfolio from storage.py)
+
+from . import llm
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 if not MONGO_URI:
@@ -17,7 +18,8 @@ db = client["RGIT_DB"]  # Replace with your database name
 roadmap_collection = db["roadmap"]  # Roadmap collection name
 
 
-portfolio_db = load_portfolio()
+# Profiles are loaded per user on demand and only changed fields are written back
+profile_store = ProfileStore()
 
 def createProfile(data):
     """
@@ -35,15 +37,18 @@ def createProfile(data):
         return {"status": "error", "message": "User ID is required"}
 
     # Check if the profile already exists
-    if user_id in portfolio_db:
+    if profile_store.get(user_id) is not None:
         return {"status": "error", "message": "User profile already exists"}
 
     # Save the profile to MongoDB
-    portfolio_db[user_id] = data  # Store it in the in-memory database
-    save_portfolio(portfolio_db)  # Save to MongoDB
+    profile_store.set_fields(user_id, data)
+    try:
+        profile_store.commit()
+    except PyMongoError as e:
+        print(f"Error saving profile {user_id}: {str(e)}")
+        return {"status": "error", "message": "Failed to save profile"}
 
-    # Debugging output to confirm storage in memory
-    print("Current Portfolio DB (after creation):", portfolio_db)
+    print(f"Profile created: {user_id}")
 
     return {"status": "success", "message": "Profile created successfully", "data": data}
 
@@ -53,25 +58,26 @@ def updateProfile(user_id, updated_data):
          return {"status": "error", "message": "User ID is required"}
 
     # Check if the profile exists
-    if user_id not in portfolio_db:
+    profile = profile_store.get(user_id)
+    if profile is None:
         return {"status": "error", "message": "User profile not found"}
 
-    # Update the profile with new data in-memory
-    portfolio_db[user_id].update(updated_data)
+    changes = dict(updated_data)
 
-    # Manage calendar updates
-    if 'calendar' in updated_data:
-        # Append new calendar events
-        existing_calendar = portfolio_db[user_id].get('calendar', [])
-        new_calendar_events = updated_data['calendar']
-        existing_calendar.extend(new_calendar_events)
-        portfolio_db[user_id]['calendar'] = existing_calendar
+    # Manage calendar updates: new events are appended to the stored calendar
+    appended = {}
+    if 'calendar' in changes:
+        appended['calendar'] = changes.pop('calendar')
 
-    # Save the updated profile to MongoDB
-    save_portfolio(portfolio_db)  # Save updated data to MongoDB
+    # Save only the changed fields to MongoDB
+    profile_store.set_fields(user_id, changes, append=appended)
+    try:
+        profile_store.commit()
+    except PyMongoError as e:
+        print(f"Error saving profile {user_id}: {str(e)}")
+        return {"status": "error", "message": "Failed to save profile"}
 
-    # Debugging output to confirm storage after update
-    print("Current Portfolio DB (after update):", portfolio_db)
+    print(f"Profile updated: {user_id} ({', '.join([*changes, *appended])})")
 
     return {"status": "success", "message": "Profile updated successfully"}
 
@@ -88,8 +94,8 @@ def getProfile(user_id):
     if not user_id:
         return {"status": "error", "message": "User ID is required"}
 
-    # Retrieve the profile from the in-memory database
-    profile = portfolio_db.get(user_id)
+    # Retrieve the profile from the profile store
+    profile = profile_store.get(user_id)
 
     if not profile:
         return {"status": "error", "message": "User profile not found"}
@@ -102,22 +108,19 @@ import traceback
 def addRoadmap(user_id, prompt, db, ROADMAP_COLLECTION):
     try:
         # Generate roadmap using OpenAI
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
+        roadmap_text = llm.chat(
+            site="addRoadmap",
+            task="roadmap",
             messages=[
                 {
                     "role": "system",
                     "content": "Generate a learning roadmap with 5-10 steps. Format each step as 'Title: [title] | Description: [description]'"
                 },
                 {"role": "user", "content": prompt}
-            ]
+            ],
+            cache=True
         )
 
-        if not response or not response.choices or not response.choices[0].message:
-            print("Invalid response from OpenAI")
-            return []
-
-        roadmap_text = response.choices[0].message.content
         if not roadmap_text:
             print("Empty roadmap text received")
             return []
@@ -0,0 +1,305 @@
+import os
+import re
+import json
+import time
+import queue
+import random
+import hashlib
+import datetime
+import threading
+
+import dotenv
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from . import llm
+
+dotenv.load_dotenv()
+
+# Pre-generated multiple choice questions, so /quiz can answer from MongoDB in milliseconds.
+# Questions are stored per syllabus node (subject, chapter) with a difficulty. A background
+# refiller tops up every node that falls below QUESTION_BANK_TARGET questions; /quiz only
+# generates live when the bank can't cover a request.
+
+QUESTION_BANK_TARGET = int(os.getenv("QUESTION_BANK_TARGET", "30"))
+QUESTION_BANK_BATCH = int(os.getenv("QUESTION_BANK_BATCH", "10"))  # questions per generation call
+QUESTION_BANK_SWEEP_INTERVAL = int(os.getenv("QUESTION_BANK_SWEEP_INTERVAL", "900"))  # seconds between inventory sweeps
+
+DIFFICULTIES = ("easy", "medium", "hard")
+QUESTION_FIELDS = ("question", "options", "answer", "subject", "chapter", "difficulty")
+
+client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+db = client['RGIT_DB']
+bank_collection = db['question_bank']
+users_collection = db['users']
+
+_indexes_ready = False
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    bank_collection.create_index([("subject", ASCENDING), ("chapter", ASCENDING), ("difficulty", ASCENDING)])
+    bank_collection.create_index([("fingerprint", ASCENDING)], unique=True)
+    _indexes_ready = True
+
+
+def _chapter_names(entry):
+    chapters = entry.get("chapters") or []
+    names = []
+    for chapter in chapters:
+        if isinstance(chapter, dict):
+            chapter = chapter.get("name") or chapter.get("chapter") or chapter.get("title")
+        if chapter:
+            names.append(str(chapter))
+    return names
+
+
+def syllabus_nodes(syllabus):
+    """
+    The (subject, chapter) nodes of a syllabus. A subject without chapters is one node with
+    chapter "".
+    """
+    nodes = []
+    for entry in syllabus or []:
+        if not isinstance(entry, dict) or not entry.get("subject"):
+            continue
+        chapters = _chapter_names(entry)
+        for chapter in chapters or [""]:
+            if (entry["subject"], chapter) not in nodes:
+                nodes.append((entry["subject"], chapter))
+    return nodes
+
+
+def question_fingerprint(question):
+    """
+    Stable hash of a question's normalized text within its subject and chapter.
+    """
+    text = re.sub(r"\W+", " ", str(question.get("question", "")).lower()).strip()
+    raw = json.dumps([question.get("subject", ""), question.get("chapter", ""), text])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _node_filter(nodes, difficulty=None):
+    clauses = [{"subject": subject, "chapter": chapter} if chapter else {"subject": subject} for subject, chapter in nodes]
+    query = {"$or": clauses} if len(clauses) > 1 else clauses[0]
+    if difficulty:
+        query = {"$and": [query, {"difficulty": difficulty}]}
+    return query
+
+
+def sample_questions(nodes, num_questions, difficulty=None):
+    """
+    Draw `num_questions` random questions for the given syllabus nodes from the bank.
+
+    Returns:
+        list: The questions, numbered from 1, or fewer than requested if the bank is short.
+    """
+    if not nodes or num_questions <= 0:
+        return []
+    pipeline = [
+        {"$match": _node_filter(nodes, difficulty)},
+        {"$sample": {"size": num_questions}},
+        {"$project": {"_id": 0, "fingerprint": 0, "created_at": 0}},
+    ]
+    try:
+        _ensure_indexes()
+        questions = list(bank_collection.aggregate(pipeline))
+    except PyMongoError as e:
+        print(f"Question bank unavailable: {str(e)}")
+        return []
+    for number, question in enumerate(questions, start=1):
+        question["question_number"] = number
+    return questions
+
+
+def add_questions(questions, subject=None, chapter=None):
+    """
+    Store generated questions in the bank, skipping invalid ones and ones already stored.
+
+    Returns:
+        int: Number of questions added.
+    """
+    documents = []
+    for question in questions or []:
+        if not isinstance(question, dict):
+            continue
+        question = dict(question)
+        if subject is not None:
+            question["subject"] = subject
+        if chapter is not None:
+            question["chapter"] = chapter
+        question.setdefault("difficulty", "medium")
+        question.setdefault("marks", 1)
+        options = question.get("options")
+        if not all(question.get(field) not in (None, "") or field == "chapter" for field in QUESTION_FIELDS):
+            continue
+        if not isinstance(options, list) or len(options) != 4 or question["answer"] not in options:
+            continue
+        question.pop("question_number", None)
+        question.pop("_id", None)
+        question["difficulty"] = str(question["difficulty"]).lower()
+        question["fingerprint"] = question_fingerprint(question)
+        question["created_at"] = datetime.datetime.utcnow()
+        documents.append(question)
+    if not documents:
+        return 0
+
+    try:
+        _ensure_indexes()
+        return len(bank_collection.insert_many(documents, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        # Duplicates (same fingerprint) are expected and skipped
+        return e.details.get("nInserted", 0)
+    except PyMongoError as e:
+        print(f"Could not store questions in the question bank: {str(e)}")
+        return 0
+
+
+def inventory(nodes=None):
+    """
+    Number of banked questions per (subject, chapter) node.
+    """
+    pipeline = [{"$group": {"_id": {"subject": "$subject", "chapter": "$chapter"}, "count": {"$sum": 1}}}]
+    if nodes:
+        pipeline.insert(0, {"$match": _node_filter(nodes)})
+    counts = {}
+    for row in bank_collection.aggregate(pipeline):
+        counts[(row["_id"].get("subject"), row["_id"].get("chapter") or "")] = row["count"]
+    return counts
+
+
+def generate_for_node(subject, chapter, count=QUESTION_BANK_BATCH):
+    """
+    Generate `count` questions of mixed difficulty for one syllabus node and store them.
+
+    Returns:
+        int: Number of questions added to the bank.
+    """
+    topic = f"the chapter '{chapter}' of {subject}" if chapter else subject
+    prompt = f"""
+    Generate {count} multiple choice questions on {topic} for a student quiz.
+    Mix the difficulties: roughly a third each of easy, medium and hard.
+    Return a JSON object with the following format:
+    {{
+        "questions": [
+            {{
+                "question": "Question text",
+                "options": ["Option 1", "Option 2", "Option 3", "Option 4"],
+                "answer": "Option 2",
+                "subject": "{subject}",
+                "chapter": "{chapter}",
+                "difficulty": "easy",
+                "marks": 1,
+                "hint": "A short hint"
+            }}
+        ]
+    }}
+    The answer must be exactly one of the options.
+    """
+    content = llm.chat(
+        site="question_bank_refill",
+        task="quiz",
+        detail={"subject": subject, "chapter": chapter},
+        messages=[
+            {"role": "system", "content": "You are a helpful quiz generator."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.8,
+        max_tokens=3000
+    )
+    if "```" in content:
+        content = content.split("```json")[-1].split("```")[0] if "```json" in content else content.split("```")[1]
+    parsed = json.loads(content.strip())
+    questions = parsed.get("questions", []) if isinstance(parsed, dict) else parsed
+    return add_questions(questions, subject=subject, chapter=chapter)
+
+
+def refill_node(subject, chapter, target=QUESTION_BANK_TARGET):
+    """
+    Generate questions for a node until it holds at least `target` of them.
+    """
+    have = inventory([(subject, chapter)]).get((subject, chapter), 0)
+    attempts = 0
+    while have < target and attempts < 2 * (target // QUESTION_BANK_BATCH + 1):
+        attempts += 1
+        try:
+            added = generate_for_node(subject, chapter, min(QUESTION_BANK_BATCH, target - have))
+        except Exception as e:
+            print(f"Question bank refill failed for {subject} / {chapter or '-'}: {str(e)}")
+            break
+        have += added
+    print(f"Question bank: {subject} / {chapter or '-'} holds {have} questions")
+    return have
+
+
+# Background refiller: a single worker thread fed by requests from /quiz and periodic sweeps
+_refill_queue = queue.Queue()
+_queued = set()
+_queued_lock = threading.Lock()
+_refiller = None
+
+
+def request_refill(nodes):
+    """
+    Queue nodes for the background refiller; nodes already waiting are not queued twice.
+    """
+    with _queued_lock:
+        for node in nodes:
+            if node not in _queued:
+                _queued.add(node)
+                _refill_queue.put(node)
+
+
+def sweep():
+    """
+    Queue every syllabus node of every user whose inventory is below target.
+    """
+    nodes = []
+    for profile in users_collection.find({"syllabus": {"$exists": True}}, {"syllabus": 1}):
+        for node in syllabus_nodes(profile.get("syllabus")):
+            if node not in nodes:
+                nodes.append(node)
+    if not nodes:
+        return 0
+    counts = inventory()
+    short = [node for node in nodes if counts.get(node, 0) < QUESTION_BANK_TARGET]
+    request_refill(short)
+    return len(short)
+
+
+def _refill_loop():
+    next_sweep = 0
+    while True:
+        if time.time() >= next_sweep:
+            try:
+                short = sweep()
+                if short:
+                    print(f"Question bank sweep queued {short} node(s) below {QUESTION_BANK_TARGET} questions")
+            except PyMongoError as e:
+                print(f"Question bank sweep failed: {str(e)}")
+            # Spread sweeps of several workers/processes apart
+            next_sweep = time.time() + QUESTION_BANK_SWEEP_INTERVAL * random.uniform(0.8, 1.2)
+        try:
+            node = _refill_queue.get(timeout=5)
+        except queue.Empty:
+            continue
+        try:
+            refill_node(*node)
+        except PyMongoError as e:
+            print(f"Question bank refill failed for {node}: {str(e)}")
+        finally:
+            with _queued_lock:
+                _queued.discard(node)
+
+
+def start_refiller():
+    """
+    Start the background refill thread (once per process).
+    """
+    global _refiller
+    if _refiller is None:
+        _refiller = threading.Thread(target=_refill_loop, name="question-bank-refiller", daemon=True)
+        _refiller.start()
+    return _refiller
@@ -4,6 +4,8 @@ import os
 from pymongo import MongoClient
 import dotenv
 
+from .mastery import record_attempt
+
 dotenv.load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 client = MongoClient(MONGO_URI)
@@ -119,6 +121,11 @@ def evaluate_and_analyze_quiz(quiz_response, user_answers, user_id):
 
     # Save to MongoDB
     db['quiz_attempts'].insert_one(performance_summary)
+    try:
+        record_attempt(performance_summary)
+    except Exception as e:
+        # The attempt is already stored; mastery can be rebuilt from quiz_attempts
+        print(f"Error updating mastery: {str(e)}")
 
     # Return performance summary
     return performance_summary
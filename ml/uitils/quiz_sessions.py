@@ -0,0 +1,114 @@
+import os
+import uuid
+import datetime
+import threading
+from collections import OrderedDict
+
+import dotenv
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import PyMongoError
+
+from .grading import AnswerKey
+from .seen_questions import mark_seen
+
+dotenv.load_dotenv()
+
+# Generated quizzes are kept server-side under a quiz id, so /evaluate-quiz only needs the id and
+# the answers instead of the whole quiz (and can't be handed a tampered answer key).
+# MongoDB holds a compact answer key per quiz (expired by a TTL index); compiled keys of recent
+# quizzes are kept in memory.
+
+QUIZ_SESSION_TTL = int(os.getenv("QUIZ_SESSION_TTL", str(7 * 24 * 3600)))
+QUIZ_SESSION_CACHE_SIZE = int(os.getenv("QUIZ_SESSION_CACHE_SIZE", "2048"))
+
+# Only what grading and the evaluation details need; options are kept to map answers to codes
+KEY_FIELDS = ("question_number", "question", "options", "answer", "marks", "subject", "chapter")
+
+client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+db = client['RGIT_DB']
+sessions_collection = db['quiz_sessions']
+
+_indexes_ready = False
+_cache = OrderedDict()  # quiz_id -> (expires, AnswerKey), least recently used first
+_cache_lock = threading.Lock()
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    sessions_collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    _indexes_ready = True
+
+
+def _cache_put(quiz_id, key, expires):
+    with _cache_lock:
+        _cache[quiz_id] = (expires, key)
+        _cache.move_to_end(quiz_id)
+        while len(_cache) > QUIZ_SESSION_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _cache_get(quiz_id):
+    now = datetime.datetime.utcnow()
+    with _cache_lock:
+        entry = _cache.get(quiz_id)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del _cache[quiz_id]
+            return None
+        _cache.move_to_end(quiz_id)
+        return entry[1]
+
+
+def compact_key(questions):
+    """
+    The answer key of a quiz: its questions without hints, difficulty and other display fields.
+    """
+    return [{field: question.get(field) for field in KEY_FIELDS if field in question}
+            for question in questions if isinstance(question, dict)]
+
+
+def create_session(questions, user_id=None):
+    """
+    Store the answer key of a generated quiz and add its questions to the user's seen filter.
+
+    Returns:
+        str: The quiz id, or None if there are no questions. If MongoDB is unavailable the key
+            is only kept in this process's memory.
+    """
+    key = compact_key(questions)
+    if not key:
+        return None
+    quiz_id = uuid.uuid4().hex
+    expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=QUIZ_SESSION_TTL)
+    _cache_put(quiz_id, AnswerKey(key), expires)
+    try:
+        _ensure_indexes()
+        sessions_collection.insert_one({"_id": quiz_id, "user_id": user_id, "key": key, "expires_at": expires})
+    except PyMongoError as e:
+        print(f"Could not store quiz session {quiz_id}: {str(e)}")
+    mark_seen(user_id, questions)
+    return quiz_id
+
+
+def get_answer_key(quiz_id):
+    """
+    Compiled answer key of a stored quiz.
+
+    Returns:
+        AnswerKey: The key, or None if the quiz is unknown or expired.
+    """
+    if not quiz_id:
+        return None
+    key = _cache_get(quiz_id)
+    if key is not None:
+        return key
+
+    document = sessions_collection.find_one({"_id": quiz_id, "expires_at": {"$gt": datetime.datetime.utcnow()}})
+    if not document:
+        return None
+    key = AnswerKey(document["key"])
+    _cache_put(quiz_id, key, document["expires_at"])
+    return key
@@ -0,0 +1,124 @@
+import os
+import json
+import threading
+
+import dotenv
+
+dotenv.load_dotenv()
+
+# Picks the chat model for a call from a configurable policy instead of hard-coding it per call site.
+# A policy is a list of rules mapping (task, estimated size) to a tier, and tiers list candidate models.
+# Within a tier the model with the lowest observed latency that fits the context window wins.
+#
+# Override the default with LLM_ROUTING_POLICY (a JSON string or a path to a JSON file).
+
+DEFAULT_POLICY = {
+    "tiers": {
+        "fast": ["gpt-4o-mini"],
+        "balanced": ["gpt-4o-mini", "gpt-3.5-turbo"],
+        "quality": ["gpt-4o"],
+    },
+    "rules": [
+        {"tasks": ["classify", "extract", "parse"], "tier": "fast"},
+        {"tasks": ["quiz", "slides", "flashcards", "roadmap", "answer"], "min_total_tokens": 12000, "tier": "quality"},
+        {"tier": "balanced"},
+    ],
+    "context_windows": {
+        "gpt-3.5-turbo": 16385,
+        "gpt-4o-mini": 128000,
+        "gpt-4o": 128000,
+    },
+    # Expected completion size when the call site doesn't give one
+    "default_output_tokens": {
+        "classify": 20,
+        "extract": 300,
+        "parse": 300,
+        "answer": 500,
+        "quiz": 1500,
+        "slides": 1500,
+        "flashcards": 800,
+        "roadmap": 600,
+    },
+    # Latency prior (seconds) for models that have not been observed yet
+    "latency_prior": 2.0,
+}
+
+LATENCY_SMOOTHING = 0.2
+
+
+def _load_policy():
+    override = os.getenv("LLM_ROUTING_POLICY")
+    if not override:
+        return DEFAULT_POLICY
+    try:
+        if os.path.exists(override):
+            with open(override, "r", encoding="utf-8") as f:
+                policy = json.load(f)
+        else:
+            policy = json.loads(override)
+        return {**DEFAULT_POLICY, **policy}
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ignoring invalid LLM_ROUTING_POLICY: {str(e)}")
+        return DEFAULT_POLICY
+
+
+policy = _load_policy()
+_latency = {}
+_latency_lock = threading.Lock()
+
+
+def record_latency(model, seconds):
+    """
+    Feed an observed call latency into the model's moving average.
+    """
+    with _latency_lock:
+        previous = _latency.get(model)
+        _latency[model] = seconds if previous is None else previous + LATENCY_SMOOTHING * (seconds - previous)
+
+
+def model_latency(model):
+    with _latency_lock:
+        return _latency.get(model, policy["latency_prior"])
+
+
+def _rule_matches(rule, task, total_tokens):
+    if "tasks" in rule and task not in rule["tasks"]:
+        return False
+    if total_tokens < rule.get("min_total_tokens", 0):
+        return False
+    if total_tokens > rule.get("max_total_tokens", float("inf")):
+        return False
+    return True
+
+
+def choose_model(task, input_tokens, output_tokens=None, site=None):
+    """
+    Pick a chat model for a call.
+
+    Args:
+        task (str): Kind of job, e.g. "classify", "extract", "quiz", "slides".
+        input_tokens (int): Estimated prompt tokens.
+        output_tokens (int): Expected completion tokens, or None for the task default.
+        site (str): Call site, for the decision log.
+
+    Returns:
+        str: The chosen model name.
+    """
+    if output_tokens is None:
+        output_tokens = policy["default_output_tokens"].get(task, 500)
+    total_tokens = input_tokens + output_tokens
+
+    rule_index, tier = next(
+        ((i, rule["tier"]) for i, rule in enumerate(policy["rules"]) if _rule_matches(rule, task, total_tokens)),
+        (None, "balanced"),
+    )
+    windows = policy["context_windows"]
+    candidates = [model for model in policy["tiers"].get(tier, []) if windows.get(model, float("inf")) >= total_tokens]
+    if not candidates:
+        # Nothing in the tier fits: fall back to the model with the largest context window
+        candidates = [max(windows, key=windows.get)]
+
+    model = min(candidates, key=model_latency)
+    print(f"Routing {site or 'unknown'} ({task}, ~{input_tokens} in / {output_tokens} out tokens): "
+          f"rule {rule_index} -> tier {tier} -> {model}")
+    return model
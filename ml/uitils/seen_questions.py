@@ -0,0 +1,146 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import dotenv
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import PyMongoError
+from bson.int64 import Int64
+
+dotenv.load_dotenv()
+
+# Per-user Bloom filter of the questions a student has been given, so regenerated quizzes can
+# skip repeats without scanning their quiz_attempts.
+#
+# Each filter is SEEN_FILTER_BITS bits stored as an array of 64-bit words in the `seen_questions`
+# collection. Marking questions ORs words in place with $bit, so concurrent requests never lose
+# each other's updates. Filters of recent users are cached in memory; a lookup is a few array
+# reads. False positives (an unseen question reported as seen) stay around 1% up to
+# SEEN_FILTER_CAPACITY questions, after which the filter starts over.
+
+SEEN_FILTER_BITS = int(os.getenv("SEEN_FILTER_BITS", "16384"))  # 2 KB per user
+SEEN_FILTER_CAPACITY = int(os.getenv("SEEN_FILTER_CAPACITY", "1500"))
+SEEN_FILTER_CACHE_SECONDS = int(os.getenv("SEEN_FILTER_CACHE_SECONDS", "60"))
+SEEN_FILTER_CACHE_USERS = 4096
+
+WORDS = SEEN_FILTER_BITS // 64
+# Optimal number of hash functions for the configured capacity: (bits / capacity) * ln 2
+HASHES = max(1, round(SEEN_FILTER_BITS / SEEN_FILTER_CAPACITY * 0.693))
+
+client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+db = client['RGIT_DB']
+seen_collection = db['seen_questions']
+
+_cache = OrderedDict()  # user_id -> (loaded_at, words), least recently used first
+_cache_lock = threading.Lock()
+
+
+def normalize(question):
+    text = question.get("question", "") if isinstance(question, dict) else str(question)
+    return re.sub(r"\W+", " ", str(text).lower()).strip()
+
+
+def bit_positions(questions):
+    """
+    Bloom filter bit positions of each question: (len(questions), HASHES) array.
+    Double hashing over a stable digest of the normalized text (not Python's salted hash()).
+    """
+    digests = [hashlib.blake2b(normalize(question).encode("utf-8"), digest_size=16).digest() for question in questions]
+    if not digests:
+        return np.zeros((0, HASHES), dtype=np.uint64)
+    halves = np.frombuffer(b"".join(digests), dtype="<u8").reshape(len(digests), 2)
+    steps = np.arange(HASHES, dtype=np.uint64)
+    return (halves[:, :1] + steps * (halves[:, 1:] | np.uint64(1))) % np.uint64(SEEN_FILTER_BITS)
+
+
+def _load(user_id):
+    now = time.time()
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if entry and now - entry[0] < SEEN_FILTER_CACHE_SECONDS:
+            _cache.move_to_end(user_id)
+            return entry[1]
+
+    document = seen_collection.find_one({"_id": user_id}, {"words": 1})
+    words = np.zeros(WORDS, dtype=np.uint64)
+    if document and len(document.get("words") or []) == WORDS:
+        words = np.array(document["words"], dtype=np.int64).view(np.uint64)
+    with _cache_lock:
+        _cache[user_id] = (now, words)
+        _cache.move_to_end(user_id)
+        while len(_cache) > SEEN_FILTER_CACHE_USERS:
+            _cache.popitem(last=False)
+    return words
+
+
+def seen_mask(user_id, questions):
+    """
+    Whether the user has (probably) been given each question before.
+
+    Returns:
+        numpy.ndarray: One bool per question. All False without a user_id or if the filter
+            can't be loaded.
+    """
+    if not user_id or not questions:
+        return np.zeros(len(questions or []), dtype=bool)
+    try:
+        words = _load(user_id)
+    except PyMongoError as e:
+        print(f"Seen-question filter unavailable: {str(e)}")
+        return np.zeros(len(questions), dtype=bool)
+    positions = bit_positions(questions)
+    bits = (words[positions // np.uint64(64)] >> (positions % np.uint64(64))) & np.uint64(1)
+    return bits.all(axis=1)
+
+
+def unseen(user_id, questions):
+    """
+    The questions the user hasn't been given yet, in their original order.
+    """
+    mask = seen_mask(user_id, questions)
+    return [question for question, seen in zip(questions, mask) if not seen]
+
+
+def mark_seen(user_id, questions):
+    """
+    Add questions to the user's filter.
+    """
+    if not user_id or not questions:
+        return
+    positions = bit_positions(questions).ravel()
+    masks = np.zeros(WORDS, dtype=np.uint64)
+    np.bitwise_or.at(masks, positions // np.uint64(64), np.uint64(1) << (positions % np.uint64(64)))
+    changed = np.flatnonzero(masks)
+    signed = masks.view(np.int64)
+
+    try:
+        document = seen_collection.find_one_and_update(
+            {"_id": user_id},
+            {"$setOnInsert": {"words": [Int64(0)] * WORDS, "count": 0}},
+            upsert=True,
+            projection={"count": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        reset = document.get("count", 0) >= SEEN_FILTER_CAPACITY
+        if reset:
+            # Full: forget older questions rather than letting false positives pile up
+            seen_collection.update_one({"_id": user_id}, {"$set": {"words": [Int64(0)] * WORDS, "count": 0}})
+        seen_collection.update_one(
+            {"_id": user_id},
+            {"$bit": {f"words.{index}": {"or": Int64(int(signed[index]))} for index in changed.tolist()},
+             "$inc": {"count": len(questions)}}
+        )
+    except PyMongoError as e:
+        print(f"Could not update seen-question filter: {str(e)}")
+        return
+
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if entry:
+            if reset:
+                entry[1][:] = 0
+            entry[1] |= masks
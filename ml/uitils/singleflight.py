@@ -0,0 +1,74 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Collapse concurrent identical calls into one.
+
+    The first caller for a key (the leader) runs the call; everyone who asks for the same key while
+    it is in flight waits for that result instead of starting their own. Threads and asyncio tasks
+    share the same in-flight table, so a thread and a coroutine asking for the same key also
+    coalesce. The shared result object is handed to every waiter, so callers must not mutate it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def _join(self, key):
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.stats["followers"] += 1
+                return future, False
+            future = Future()
+            self.calls[key] = future
+            self.stats["leaders"] += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self.lock:
+            self.calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """
+        Run `fn()` once for all concurrent callers of `key` (blocking).
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key, coro_fn):
+        """
+        Await `coro_fn()` once for all concurrent callers of `key`.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self.calls)
+        return stats
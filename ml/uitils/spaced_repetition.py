@@ -0,0 +1,226 @@
+import os
+import hashlib
+import argparse
+import datetime
+
+import dotenv
+from pymongo import MongoClient, ASCENDING, UpdateOne
+
+dotenv.load_dotenv()
+
+# Spaced repetition (SM-2) for generated flashcards.
+#
+# Every card a user is given gets one document in `review_cards` holding its review state:
+# ease factor, interval in days, consecutive successful repetitions, lapses and the next due
+# date. The compound index (user_id, due_at) makes "next N due cards of a user" a single index
+# range scan that stops after N entries, whatever the number of cards in the collection.
+# Reviews are applied in batches: one find over the reviewed card ids, then one unordered
+# bulk_write of $set updates.
+#
+# Review quality follows SM-2: 0-5, where 3 and above count as recalled.
+
+SRS_DEFAULT_EASE = 2.5
+SRS_MIN_EASE = 1.3
+SRS_MAX_INTERVAL_DAYS = int(os.getenv("SRS_MAX_INTERVAL_DAYS", "365"))
+SRS_DUE_LIMIT = int(os.getenv("SRS_DUE_LIMIT", "20"))
+SRS_MAX_BATCH = int(os.getenv("SRS_MAX_BATCH", "1000"))  # reviews accepted per request
+
+CARD_FIELDS = ("question", "answer", "topic", "source")
+
+client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+db = client['RGIT_DB']
+cards_collection = db['review_cards']
+
+_indexes_ready = False
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    cards_collection.create_index([("user_id", ASCENDING), ("due_at", ASCENDING)])
+    _indexes_ready = True
+
+
+def card_id(card):
+    """
+    Stable id of a flashcard, from its question and answer.
+    """
+    text = f"{str(card.get('question', '')).strip().lower()}\n{str(card.get('answer', '')).strip().lower()}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _document_id(user_id, card):
+    return f"{user_id}:{card}"
+
+
+def schedule(state, quality, reviewed_at):
+    """
+    SM-2 update of one card's review state.
+
+    Args:
+        state (dict): "ease", "interval" (days), "repetitions" and "lapses".
+        quality (int): Recall quality, 0 (blackout) to 5 (perfect).
+        reviewed_at (datetime.datetime): Time of the review.
+
+    Returns:
+        dict: The new state, including "due_at".
+    """
+    ease = state.get("ease", SRS_DEFAULT_EASE)
+    interval = state.get("interval", 0)
+    repetitions = state.get("repetitions", 0)
+    lapses = state.get("lapses", 0)
+
+    if quality >= 3:
+        if repetitions == 0:
+            interval = 1
+        elif repetitions == 1:
+            interval = 6
+        else:
+            interval = round(interval * ease)
+        repetitions += 1
+    else:
+        repetitions = 0
+        interval = 1
+        lapses += 1
+    ease = max(SRS_MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    interval = min(interval, SRS_MAX_INTERVAL_DAYS)
+
+    return {
+        "ease": round(ease, 4),
+        "interval": interval,
+        "repetitions": repetitions,
+        "lapses": lapses,
+        "due_at": reviewed_at + datetime.timedelta(days=interval),
+    }
+
+
+def add_cards(user_id, cards):
+    """
+    Start tracking flashcards for a user. Cards the user already has keep their review state.
+    Each card dict gets its "card_id".
+
+    Returns:
+        list: The card ids, in order.
+    """
+    now = datetime.datetime.utcnow()
+    ids = []
+    operations = []
+    for card in cards:
+        if not isinstance(card, dict):
+            continue
+        card["card_id"] = card_id(card)
+        ids.append(card["card_id"])
+        if not user_id:
+            continue
+        operations.append(UpdateOne(
+            {"_id": _document_id(user_id, card["card_id"])},
+            {"$setOnInsert": {
+                "user_id": user_id,
+                "card_id": card["card_id"],
+                **{field: card.get(field) for field in CARD_FIELDS},
+                "ease": SRS_DEFAULT_EASE,
+                "interval": 0,
+                "repetitions": 0,
+                "lapses": 0,
+                "reviews": 0,
+                "created_at": now,
+                "due_at": now,
+            }},
+            upsert=True
+        ))
+    if operations:
+        _ensure_indexes()
+        cards_collection.bulk_write(operations, ordered=False)
+    return ids
+
+
+def record_reviews(user_id, reviews):
+    """
+    Apply a batch of reviews.
+
+    Args:
+        user_id (str): The reviewing user.
+        reviews (list): Dicts with "card_id", "quality" (0-5) and optionally "reviewed_at"
+            (datetime). Several reviews of the same card are applied in time order.
+
+    Returns:
+        dict: "updated" cards, "unknown" card ids and the new "due_at" per card id.
+    """
+    now = datetime.datetime.utcnow()
+    reviews = sorted(reviews, key=lambda review: review.get("reviewed_at") or now)
+    ids = list({_document_id(user_id, review["card_id"]) for review in reviews})
+    states = {document["card_id"]: document for document in cards_collection.find(
+        {"_id": {"$in": ids}}, {"card_id": 1, "ease": 1, "interval": 1, "repetitions": 1, "lapses": 1})}
+
+    unknown = []
+    changed = {}
+    counts = {}
+    for review in reviews:
+        state = states.get(review["card_id"])
+        if state is None:
+            unknown.append(review["card_id"])
+            continue
+        reviewed_at = review.get("reviewed_at") or now
+        state.update(schedule(state, review["quality"], reviewed_at), last_reviewed=reviewed_at)
+        changed[review["card_id"]] = state
+        counts[review["card_id"]] = counts.get(review["card_id"], 0) + 1
+
+    if changed:
+        cards_collection.bulk_write([
+            UpdateOne(
+                {"_id": _document_id(user_id, card)},
+                {"$set": {field: state[field] for field in ("ease", "interval", "repetitions", "lapses", "due_at", "last_reviewed")},
+                 "$inc": {"reviews": counts[card]}}
+            ) for card, state in changed.items()
+        ], ordered=False)
+
+    return {
+        "updated": len(changed),
+        "unknown": sorted(set(unknown)),
+        "due": {card: state["due_at"] for card, state in changed.items()},
+    }
+
+
+def remove_cards(user_id, card_ids):
+    """
+    Stop scheduling cards for a user (e.g. cards of pages removed from a document).
+
+    Returns:
+        int: Number of cards removed.
+    """
+    if not user_id or not card_ids:
+        return 0
+    result = cards_collection.delete_many({"_id": {"$in": [_document_id(user_id, card) for card in card_ids]}})
+    return result.deleted_count
+
+
+def due_cards(user_id, limit=SRS_DUE_LIMIT, now=None):
+    """
+    The user's cards that are due, most overdue first.
+    """
+    now = now or datetime.datetime.utcnow()
+    _ensure_indexes()
+    cursor = cards_collection.find(
+        {"user_id": user_id, "due_at": {"$lte": now}},
+        {"_id": 0, "user_id": 0, "created_at": 0}
+    ).sort("due_at", ASCENDING).limit(limit)
+    return list(cursor)
+
+
+def due_count(user_id, now=None):
+    """
+    Number of the user's cards that are due (counted on the index).
+    """
+    now = now or datetime.datetime.utcnow()
+    return cards_collection.count_documents({"user_id": user_id, "due_at": {"$lte": now}})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the flashcards a user has due for review")
+    parser.add_argument("user_id")
+    parser.add_argument("--limit", type=int, default=SRS_DUE_LIMIT)
+    args = parser.parse_args()
+    print(f"{due_count(args.user_id)} card(s) due")
+    for card in due_cards(args.user_id, args.limit):
+        print(f"{card['due_at']:%Y-%m-%d %H:%M}  {card['question']}")
@@ -1,6 +1,10 @@
 import os
+import copy
 import json
-from pymongo import MongoClient
+import threading
+from collections import OrderedDict
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
 # Import from bson.objectid as recommended
 from bson.objectid import ObjectId
 from dotenv import load_dotenv
@@ -14,6 +18,139 @@ client = MongoClient(MONGO_URI)
 db = client['RGIT_DB']  # Use 'portfolio_db' as the database
 profiles_collection = db['users']  # Use 'profiles' as the collection for storing user profiles
 
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+
+
+class ProfileStore:
+    """
+    Write-through store of user profiles.
+
+    Profiles are loaded one user at a time on first use and kept in an LRU cache. Changes are
+    kept per user until the next `commit`, which writes only those fields: replaced fields with
+    $set and appended lists with $push, so appends from other processes are never overwritten.
+    Commits are serialized: while one bulk_write is in flight, changes from other requests
+    queue up and the next commit writes all of them in a single bulk_write. If a commit fails,
+    its changes are dropped and the users' cached profiles evicted, so nothing unsaved is
+    served or written later. The cost of an edit depends on what changed, not on how many
+    users exist.
+    """
+
+    def __init__(self, collection=profiles_collection, cache_size=PROFILE_CACHE_SIZE):
+        self.collection = collection
+        self.cache_size = cache_size
+        self._profiles = OrderedDict()  # user_id -> profile, least recently used first
+        self._dirty = {}  # user_id -> {"set": {field: value}, "push": {field: items}} since the last commit
+        self._writing = {}  # the changes of the commit in flight
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._indexes_ready = False
+
+    def _ensure_indexes(self):
+        if not self._indexes_ready:
+            self.collection.create_index([("user_id", ASCENDING)])
+            self._indexes_ready = True
+
+    def _cache(self, user_id, profile):
+        self._profiles[user_id] = profile
+        self._profiles.move_to_end(user_id)
+        while len(self._profiles) > self.cache_size:
+            self._profiles.popitem(last=False)
+
+    @staticmethod
+    def _apply(profile, changes):
+        profile = dict(profile)
+        profile.update(copy.deepcopy(changes["set"]))
+        for field, items in changes["push"].items():
+            profile[field] = list(profile.get(field) or []) + copy.deepcopy(items)
+        return profile
+
+    def get(self, user_id):
+        """
+        A user's profile, or None if there is none. Callers must not modify it in place.
+        """
+        with self._lock:
+            if user_id in self._profiles:
+                self._profiles.move_to_end(user_id)
+                return self._profiles[user_id]
+        self._ensure_indexes()
+        profile = self.collection.find_one({"user_id": user_id})
+        with self._lock:
+            # A change made while the profile was loading wins over the loaded copy
+            if user_id in self._profiles:
+                return self._profiles[user_id]
+            if user_id in self._dirty:
+                profile = self._apply(profile or {"user_id": user_id}, self._dirty[user_id])
+            if profile is None:
+                return None
+            # The loaded copy may or may not include a commit in flight: don't cache it
+            if user_id not in self._writing:
+                self._cache(user_id, profile)
+            return profile
+
+    def set_fields(self, user_id, fields, append=None):
+        """
+        Change fields of a profile (creating it if needed) and keep them for the next commit.
+
+        Args:
+            user_id (str): The profile's user.
+            fields (dict): Values replacing the current ones.
+            append (dict): Lists appended to the current value of a field. They are written
+                with $push, so concurrent appends to one profile are all kept, whichever process
+                makes them.
+        """
+        fields = {key: copy.deepcopy(value) for key, value in fields.items() if key != "_id"}
+        append = {field: list(items) for field, items in (append or {}).items()}
+        with self._lock:
+            pending = self._dirty.setdefault(user_id, {"set": {}, "push": {}})
+            for field, value in fields.items():
+                pending["set"][field] = value
+                pending["push"].pop(field, None)
+            for field, items in append.items():
+                if field in pending["set"]:
+                    # Replaced in this commit already: the appended items go into the new value
+                    pending["set"][field] = list(pending["set"][field] or []) + copy.deepcopy(items)
+                else:
+                    pending["push"].setdefault(field, []).extend(copy.deepcopy(items))
+            if user_id in self._profiles:
+                self._cache(user_id, self._apply(self._profiles[user_id], {"set": fields, "push": append}))
+
+    def commit(self):
+        """
+        Write every pending change with one bulk_write of $set/$push updates. On a database
+        error the changes are dropped and the affected profiles evicted from the cache.
+
+        Returns:
+            int: Number of profiles written (0 if another commit already wrote them).
+        """
+        with self._commit_lock:
+            with self._lock:
+                self._writing, self._dirty = self._dirty, {}
+                operations = []
+                for user_id, changes in self._writing.items():
+                    update = {}
+                    if changes["set"]:
+                        update["$set"] = changes["set"]
+                    if changes["push"]:
+                        update["$push"] = {field: {"$each": items} for field, items in changes["push"].items()}
+                    if update:
+                        operations.append(UpdateOne({"user_id": user_id}, update, upsert=True))
+            if not operations:
+                self._writing = {}
+                return 0
+            try:
+                self._ensure_indexes()
+                self.collection.bulk_write(operations, ordered=False)
+            except PyMongoError:
+                with self._lock:
+                    for user_id in self._writing:
+                        self._profiles.pop(user_id, None)
+                    self._writing = {}
+                raise
+            with self._lock:
+                self._writing = {}
+            return len(operations)
+
+
 def save_portfolio(profiles):
     """
     Save profiles to MongoDB collection. Either create a new profile or update an existing one.
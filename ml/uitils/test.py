@@ -24,7 +24,7 @@ def test_extract_text_from_file(file, prompt="Solve it well please", user_id="us
                             The extracted text is from the assigment **IMPORTANT** {text}.
                             Return the test response in a json format. with keys: 'text' and 'code' as applicable.
 
-                         """)
+                         """, site="test_extract_text_from_file")
 
     return text
 